@@ -0,0 +1,155 @@
+"""
+Per-transaction-type statistics from benchbase's raw results (`raw.csv`, one line per transaction).
+
+Raw files can have millions of lines, so they are memory-mapped and NumPy's C parser (`np.loadtxt`) converts the
+numeric columns straight into arrays, instead of building a Python row per line with `csv`. The lines are still fed to
+it one at a time, but that costs far less than the parsing itself. `csv` is only used for files with quoted fields,
+which `np.loadtxt` can't split. Only depends on NumPy so the collector can use it.
+"""
+import csv
+import io
+import mmap
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from lib.histogram import LatencyHistogram
+
+RAW_RESULTS_FILE = 'raw.csv'
+# Latency percentiles to report for each transaction type
+TXN_PERCENTILES = [50, 90, 95, 99]
+TXN_STAT_COLS = [
+    'txn_index', 'txn_name', 'count', 'mean_us', 'min_us', *(f'p{p}_us' for p in TXN_PERCENTILES), 'max_us', 'total_s',
+]
+# Stats of each phase (`<work>` of the benchbase config) of a run with several of them, e.g. a concurrency ramp
+PHASE_STAT_COLS = [
+    'phase', 'active_terminals', 'count', 'throughput', 'mean_us', *(f'p{p}_us' for p in TXN_PERCENTILES), 'max_us',
+]
+# Transaction type indexes start from 1, so 0 is used for all transaction types together
+ALL_TXNS = 0
+
+
+@dataclass
+class RawResults:
+    """Columns of `raw.csv`, plus the name of each transaction type index."""
+    txn: np.ndarray  # transaction type index (as in the benchbase config, from 1)
+    start_s: np.ndarray  # start time (s) relative to the start of the run
+    latency_us: np.ndarray
+    worker: np.ndarray
+    phase: np.ndarray  # phase id (`<work>` of the benchbase config)
+    names: Dict[int, str]
+
+    def __len__(self):
+        return len(self.txn)
+
+    def select(self, mask: np.ndarray) -> 'RawResults':
+        """Only the transactions where `mask` is true"""
+        return RawResults(txn=self.txn[mask], start_s=self.start_s[mask], latency_us=self.latency_us[mask],
+                          worker=self.worker[mask], phase=self.phase[mask], names=self.names)
+
+
+def read_raw_results(raw_file: Union[str, Path]) -> RawResults:
+    """
+    Read `raw.csv` of benchbase: transaction type index, transaction name, start time, latency, worker id, and the
+    phase id, which older benchbase versions don't write (it's 0 for every transaction then). Files with quoted fields
+    (e.g. a transaction name with a comma) are parsed with `csv`, others with numpy, which is much faster.
+    """
+    dtype = [('txn', np.int32), ('start', np.float64), ('latency', np.int64), ('worker', np.int32),
+             ('phase', np.int32)]
+    empty = RawResults(*(np.zeros(0, dtype=t) for _, t in dtype), names={})
+    with open(raw_file, 'rb') as f:
+        if f.seek(0, io.SEEK_END) == 0:
+            return empty
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header_end = mm.find(b'\n', 0)
+            if header_end < 0 or not mm[header_end:].strip():
+                return empty
+            has_phase = len(next(csv.reader([mm[:header_end].decode()]))) > 5
+
+            mm.seek(header_end + 1)
+            lines = iter(mm.readline, b'')
+            if mm.find(b'"', header_end) >= 0:
+                rows = [r for r in csv.reader(line.decode() for line in lines) if r]
+                data = np.array([(int(r[0]), float(r[2]), int(r[3]), int(r[4]), int(r[5]) if has_phase else 0)
+                                 for r in rows], dtype=dtype)
+                names = {int(r[0]): r[1] for r in rows}
+            else:
+                # loadtxt reads lines from the mapping (without copying the file into one string), but parses each
+                # one in C
+                cols = dtype if has_phase else dtype[:-1]
+                data = np.loadtxt(lines, delimiter=',', usecols=(0, 2, 3, 4, 5)[:len(cols)], ndmin=2,
+                                  dtype=cols).reshape(-1)
+                if not has_phase:
+                    full = np.zeros(len(data), dtype=dtype)
+                    for c, _ in cols:
+                        full[c] = data[c]
+                    data = full
+
+                # names are the same for every line of a transaction type (and unquoted here), so only look up the
+                # first line of each
+                names = {}
+                for t in np.unique(data['txn']).tolist():
+                    line_start = mm.find(b'\n%d,' % t, header_end) + 1
+                    name_start = mm.find(b',', line_start) + 1
+                    names[t] = mm[name_start:mm.find(b',', name_start)].decode()
+
+    return RawResults(txn=data['txn'], start_s=data['start'], latency_us=data['latency'], worker=data['worker'],
+                      phase=data['phase'], names=names)
+
+
+def txn_stats(raw: RawResults) -> List[dict]:
+    """Count, latency distribution and total time of each transaction type."""
+    ret = []
+    order = np.argsort(raw.txn, kind='stable')
+    txns, starts = np.unique(raw.txn[order], return_index=True)
+    for t, lat in zip(txns.tolist(), np.split(raw.latency_us[order], starts[1:])):
+        pcts = np.percentile(lat, TXN_PERCENTILES)
+        ret.append({
+            'txn_index': t,
+            'txn_name': raw.names.get(t, ''),
+            'count': len(lat),
+            'mean_us': float(lat.mean()),
+            'min_us': int(lat.min()),
+            **{f'p{p}_us': float(v) for p, v in zip(TXN_PERCENTILES, pcts)},
+            'max_us': int(lat.max()),
+            'total_s': float(lat.sum()) / 10**6,
+        })
+    return ret
+
+
+def txn_histograms(raw: RawResults) -> Dict[int, LatencyHistogram]:
+    """Latency histogram of each transaction type, and of all transactions together at index `ALL_TXNS`."""
+    ret = {ALL_TXNS: LatencyHistogram.from_values(raw.latency_us)}
+    for t in np.unique(raw.txn).tolist():
+        ret[t] = LatencyHistogram.from_values(raw.latency_us[raw.txn == t])
+    return ret
+
+
+def phase_stats(raw: RawResults, active_terminals: List[int], phase_time_s: Optional[float] = None) -> List[dict]:
+    """
+    Throughput and latency distribution of each phase of a run, in order. Phases are matched to `active_terminals` by
+    the order of their ids since benchbase's ids don't necessarily start from 0. Throughput is over `phase_time_s` if
+    given (the measured time of each phase), otherwise over the span of the phase's transactions.
+    """
+    phases = np.unique(raw.phase).tolist()
+    if len(phases) > len(active_terminals):
+        print(f'WARNING: {len(phases)} phases in the raw results but only {len(active_terminals)} configured')
+    ret = []
+    for i, (phase_id, terminals) in enumerate(zip(phases, active_terminals)):
+        sel = raw.phase == phase_id
+        lat = raw.latency_us[sel]
+        start = raw.start_s[sel]
+        elapsed_s = phase_time_s or float((start + lat / 10**6).max() - start.min())
+        pcts = np.percentile(lat, TXN_PERCENTILES)
+        ret.append({
+            'phase': i,
+            'active_terminals': terminals,
+            'count': len(lat),
+            'throughput': len(lat) / elapsed_s if elapsed_s > 0 else None,
+            'mean_us': float(lat.mean()),
+            **{f'p{p}_us': float(v) for p, v in zip(TXN_PERCENTILES, pcts)},
+            'max_us': int(lat.max()),
+        })
+    return ret
@@ -0,0 +1,149 @@
+"""
+Block-layer I/O traces of the database device, captured with the kernel's `block_rq_issue` and `block_rq_complete`
+tracepoints (ftrace) while benchbase runs.
+
+Traces are stored as a NumPy structured array with one entry per request (see `BLKTRACE_DTYPE`), and summarized by
+`blktrace_stats` into the `BLKTRACE_STAT_COLS` of the collected results. This module only depends on NumPy so the
+collector can use it.
+"""
+import re
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Dict, Union
+import numpy as np
+
+# One entry per request, in the order they were issued to the device
+BLKTRACE_DTYPE = np.dtype([
+    ('ts', np.float64),  # issue time (s, trace clock)
+    ('offset', np.int64),  # bytes from the start of the partition
+    ('length', np.int32),  # bytes
+    ('op', np.uint8),  # one of the OP_* values
+    ('latency', np.float32),  # issue to completion (s), NaN if the completion was not traced
+])
+OP_READ = 0
+OP_WRITE = 1
+OP_OTHER = 2
+
+SECTOR_SIZE = 512
+# reads starting where one of this many previous reads ended count as sequential (parallel scans interleave requests)
+SEQ_WINDOW = 32
+# granularity for detecting data which is read more than once
+REUSE_PAGE_SIZE = 4096
+# request size histogram buckets (KiB): count of requests <= each size, and larger than the last
+READ_SIZE_BUCKETS_KB = [4, 8, 16, 32, 64, 128, 256, 512]
+
+BLKTRACE_STAT_COLS = [
+    'blk_read_reqs', 'blk_write_reqs', 'blk_read_gb', 'blk_read_distinct_gb', 'blk_read_reread_frac',
+    'blk_read_seq_frac', 'blk_read_size_avg_kb',
+    *(f'blk_read_size_le{b}k' for b in READ_SIZE_BUCKETS_KB), f'blk_read_size_gt{READ_SIZE_BUCKETS_KB[-1]}k',
+    'blk_read_lat_avg_ms', 'blk_read_lat_p99_ms', 'blk_read_inflight_avg',
+]
+
+# e.g. (the `be,0,4` I/O priority is only in newer kernels)
+#   postgres-1234 [003] d..1. 12345.678901: block_rq_issue: 8,16 R 8192 () 123456 + 16 be,0,4 [postgres]
+#   <idle>-0      [003] d.h1. 12345.679901: block_rq_complete: 8,16 R () 123456 + 16 be,0,4 [0]
+_EVENT_RE = re.compile(r' (\d+\.\d+): block_rq_(issue|complete): \d+,\d+ (\S+) (?:\d+ )?\(.*?\) (\d+) \+ (\d+)')
+
+
+def rwbs_op(rwbs: str) -> int:
+    if 'R' in rwbs:
+        return OP_READ
+    if 'W' in rwbs:
+        return OP_WRITE
+    return OP_OTHER
+
+
+def parse_ftrace(raw_file: Union[str, Path], part_start: int, part_sectors: int) -> np.ndarray:
+    """
+    Convert the text output of the block tracepoints to `BLKTRACE_DTYPE`. Sectors are relative to the whole disk, so
+    requests outside of the partition (`part_start` and `part_sectors` in sectors) are dropped.
+    Completions are matched with the oldest outstanding request for the same sector and operation.
+    """
+    ts, offset, length, op, latency = [], [], [], [], []
+    outstanding: Dict[tuple, deque] = defaultdict(deque)
+
+    with open(raw_file, 'r', errors='replace') as f:
+        for line in f:
+            m = _EVENT_RE.search(line)
+            if m is None:
+                continue
+            t, event, rwbs, sector, nsectors = m.groups()
+            sector, nsectors = int(sector), int(nsectors)
+            if nsectors == 0 or not (part_start <= sector < part_start + part_sectors):
+                continue
+            key = (sector, rwbs_op(rwbs))
+
+            if event == 'issue':
+                outstanding[key].append(len(ts))
+                ts.append(float(t))
+                offset.append((sector - part_start) * SECTOR_SIZE)
+                length.append(nsectors * SECTOR_SIZE)
+                op.append(key[1])
+                latency.append(np.nan)
+            elif outstanding[key]:
+                i = outstanding[key].popleft()
+                latency[i] = float(t) - ts[i]
+
+    trace = np.zeros(len(ts), dtype=BLKTRACE_DTYPE)
+    trace['ts'] = ts
+    trace['offset'] = offset
+    trace['length'] = length
+    trace['op'] = op
+    trace['latency'] = latency
+    return trace
+
+
+def convert_ftrace(raw_file: Union[str, Path], out_file: Union[str, Path], part_start: int, part_sectors: int):
+    """Parse a raw trace with `parse_ftrace` and save it as `.npy`"""
+    np.save(out_file, parse_ftrace(raw_file, part_start, part_sectors))
+
+
+def blktrace_stats(trace: np.ndarray) -> dict:
+    """Summarize a trace: request counts, sequentiality, request sizes, re-reads and device latency of reads."""
+    reads = trace[trace['op'] == OP_READ]
+    ret = {
+        'blk_read_reqs': len(reads),
+        'blk_write_reqs': int(np.count_nonzero(trace['op'] == OP_WRITE)),
+    }
+    if len(reads) == 0:
+        return ret
+
+    offsets = reads['offset']
+    lengths = reads['length'].astype(np.int64)
+    ret['blk_read_gb'] = lengths.sum() / 2**30
+    ret['blk_read_size_avg_kb'] = lengths.mean() / 2**10
+
+    # sequential if the request continues any of the last SEQ_WINDOW reads
+    ends = offsets + lengths
+    seq = np.zeros(len(reads), dtype=bool)
+    for k in range(1, min(SEQ_WINDOW, len(reads) - 1) + 1):
+        seq[k:] |= offsets[k:] == ends[:-k]
+    ret['blk_read_seq_frac'] = seq.mean()
+
+    # request size histogram, as fractions of read requests
+    size_kb = lengths / 2**10
+    prev = 0
+    for b in READ_SIZE_BUCKETS_KB:
+        ret[f'blk_read_size_le{b}k'] = np.count_nonzero((size_kb > prev) & (size_kb <= b)) / len(reads)
+        prev = b
+    ret[f'blk_read_size_gt{prev}k'] = np.count_nonzero(size_kb > prev) / len(reads)
+
+    # how much data is read from the device more than once
+    first_page = offsets // REUSE_PAGE_SIZE
+    npages = (ends - 1) // REUSE_PAGE_SIZE - first_page + 1
+    starts = np.repeat(first_page - np.cumsum(npages) + npages, npages)
+    pages = starts + np.arange(npages.sum())
+    distinct = len(np.unique(pages))
+    ret['blk_read_distinct_gb'] = distinct * REUSE_PAGE_SIZE / 2**30
+    ret['blk_read_reread_frac'] = 1 - distinct / len(pages)
+
+    # device service time (issue -> complete), excluding time queued in the block layer before issue
+    lat = reads['latency'][~np.isnan(reads['latency'])].astype(np.float64)
+    if len(lat) > 0:
+        ret['blk_read_lat_avg_ms'] = lat.mean() * 1000
+        ret['blk_read_lat_p99_ms'] = np.percentile(lat, 99) * 1000
+        duration = trace['ts'][-1] - trace['ts'][0]
+        if duration > 0:
+            ret['blk_read_inflight_avg'] = lat.sum() / duration
+
+    return ret
@@ -0,0 +1,173 @@
+"""
+Resource usage of the load generator process on the client, to detect runs where the client rather than the database
+was the bottleneck.
+
+`ClientSampler` polls `/proc/<pid>` of the benchbase JVM in a background thread: CPU time, threads and resident memory,
+GC time from one long-running `jstat` (if the JDK has it), and the CPU usage of the whole client host. Samples are
+written to `CLIENT_STATS_FILE`, and `client_stats` summarizes them and flags the run as saturated when the client ran
+out of CPU or spent too much time in GC.
+"""
+import csv
+import os
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+CLIENT_COLS = ['time_s', 'cpu_s', 'threads', 'rss_bytes', 'gc_s', 'host_busy_ticks', 'host_total_ticks', 'ncpus']
+CLIENT_STAT_COLS = [
+    'client_cpu_util', 'client_cpu_util_max', 'client_host_cpu_util', 'client_gc_frac', 'client_threads_max',
+    'client_rss_gb_max', 'client_saturated',
+]
+
+# the client is saturated if the process or host used at least this fraction of the CPUs on average or in
+# SATURATED_SAMPLES_FRAC of the intervals, or the JVM spent at least this fraction of the time in GC
+SATURATED_CPU_UTIL = 0.9
+SATURATED_SAMPLES_FRAC = 0.25
+SATURATED_GC_FRAC = 0.1
+
+_CLK_TCK = os.sysconf('SC_CLK_TCK')
+
+
+def _process_sample(pid: int) -> Optional[dict]:
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            # skip the command name, which may contain spaces
+            stat = f.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/status', 'r') as f:
+            status = dict(line.split(':', 1) for line in f if ':' in line)
+    except (OSError, IndexError):
+        return None
+    return {
+        # utime and stime are fields 14 and 15, counted from 1 including the pid and command
+        'cpu_s': (int(stat[11]) + int(stat[12])) / _CLK_TCK,
+        'threads': int(status['Threads']),
+        'rss_bytes': int(status['VmRSS'].split()[0]) * 1024 if 'VmRSS' in status else None,
+    }
+
+
+class _JstatStream:
+    """
+    Total GC time of a JVM (the GCT column), from a single `jstat -gc <pid> <interval>` printing a line every interval
+    rather than starting a new JVM for `jstat` on every sample. `gc_s` is the latest value, None if it isn't available.
+    """
+
+    def __init__(self, pid: int, interval_s: float):
+        self.gc_s: Optional[float] = None
+        try:
+            self._proc = subprocess.Popen(['jstat', '-gc', str(pid), str(max(int(interval_s * 1000), 1))],
+                                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1)
+        except OSError:
+            self._proc = None
+            return
+        self._thread = threading.Thread(target=self._read, name='client_jstat', daemon=True)
+        self._thread.start()
+
+    def _read(self):
+        gct = None
+        for line in self._proc.stdout:
+            values = line.split()
+            if 'GCT' in values:
+                gct = values.index('GCT')
+            elif gct is not None and len(values) > gct:
+                try:
+                    self.gc_s = float(values[gct])
+                except ValueError:
+                    pass
+
+    def stop(self):
+        if self._proc is not None:
+            self._proc.terminate()
+            self._proc.wait()
+            self._thread.join()
+
+
+def _host_cpu_ticks() -> Tuple[int, int]:
+    with open('/proc/stat', 'r') as f:
+        ticks = [int(t) for t in f.readline().split()[1:9]]
+    idle = ticks[3] + ticks[4]  # idle + iowait
+    return sum(ticks) - idle, sum(ticks)
+
+
+class ClientSampler:
+    """Sample the process `pid` every `interval_s` in a background thread between `start()` and `stop()`."""
+
+    def __init__(self, pid: int, interval_s: float):
+        self.pid = pid
+        self.interval_s = interval_s
+        self.rows: List[dict] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._jstat: Optional[_JstatStream] = None
+        try:
+            self.ncpus = len(os.sched_getaffinity(pid))
+        except OSError:
+            self.ncpus = os.cpu_count()
+
+    def _sample(self) -> bool:
+        proc = _process_sample(self.pid)
+        if proc is None:
+            return False
+        busy, total = _host_cpu_ticks()
+        self.rows.append({'time_s': time.monotonic(), **proc, 'gc_s': self._jstat.gc_s,
+                          'host_busy_ticks': busy, 'host_total_ticks': total, 'ncpus': self.ncpus})
+        return True
+
+    def _run(self):
+        next_sample = time.monotonic()
+        while not self._stop.is_set() and self._sample():
+            next_sample += self.interval_s
+            self._stop.wait(max(next_sample - time.monotonic(), 0))
+
+    def start(self):
+        self._jstat = _JstatStream(self.pid, self.interval_s)
+        self._thread = threading.Thread(target=self._run, name='client_sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._jstat.stop()
+
+    def write(self, out_file: Path):
+        with open(out_file, 'w', newline='') as f:
+            w = csv.DictWriter(f, CLIENT_COLS)
+            w.writeheader()
+            w.writerows(self.rows)
+
+
+def client_stats(client_file: Path) -> dict:
+    """Summarize the client samples of a run, or an empty dict if there weren't enough of them."""
+    with open(client_file, 'r') as f:
+        rows = [{k: float(v) if v not in (None, '') else None for k, v in r.items()} for r in csv.DictReader(f)]
+    if len(rows) < 2:
+        return {}
+
+    first, last = rows[0], rows[-1]
+    elapsed_s = last['time_s'] - first['time_s']
+    ncpus = last['ncpus']
+    if elapsed_s <= 0:
+        return {}
+
+    # utilization of each interval, to catch saturation during part of the run
+    intervals = [(b['cpu_s'] - a['cpu_s']) / (b['time_s'] - a['time_s']) / ncpus
+                 for a, b in zip(rows, rows[1:]) if b['time_s'] > a['time_s']]
+    host_total = last['host_total_ticks'] - first['host_total_ticks']
+    gc = [r['gc_s'] for r in rows if r['gc_s'] is not None]
+
+    cpu_util = (last['cpu_s'] - first['cpu_s']) / elapsed_s / ncpus
+    host_util = (last['host_busy_ticks'] - first['host_busy_ticks']) / host_total if host_total > 0 else None
+    gc_frac = (gc[-1] - gc[0]) / elapsed_s if len(gc) >= 2 else None
+    saturated_intervals = sum(u >= SATURATED_CPU_UTIL for u in intervals) / len(intervals) if intervals else 0
+
+    return {
+        'client_cpu_util': cpu_util,
+        'client_cpu_util_max': max(intervals, default=None),
+        'client_host_cpu_util': host_util,
+        'client_gc_frac': gc_frac,
+        'client_threads_max': max(r['threads'] for r in rows),
+        'client_rss_gb_max': max((r['rss_bytes'] for r in rows if r['rss_bytes'] is not None), default=0) / 2**30,
+        'client_saturated': (cpu_util >= SATURATED_CPU_UTIL or (host_util or 0) >= SATURATED_CPU_UTIL
+                             or saturated_intervals >= SATURATED_SAMPLES_FRAC or (gc_frac or 0) >= SATURATED_GC_FRAC),
+    }
@@ -26,9 +26,9 @@ PG_PASSWD: str = ''
 # TODO remove these?
 # Postgres data files (absolute path)
 PG_DEFAULT_DATA_ROOT = Path('/hdd1/pgdata')
-# this is the device on the host which has the given file path.
+# this is the device on the host which has the given file path. Only a fallback: the devices are found from the data
+# directory (see `remote_data_devices`)
 PG_DATA_DEVICE: str = 'sdb/sdb1'
-# TODO replace /sys/block -> /sys/class/block, and make this just `sdb1` since the hierarchy is flat there
 
 # Some of the above args for running on the SSD host
 SSD_HOST_ARGS = {
@@ -43,6 +43,53 @@ HDD_HOST_ARGS_TPCH = {
 # Where to clone/compile everything (absolute path)
 BUILD_ROOT = Path(os.environ['HOME']) / 'PG_TESTS'
 
+# Postgres block size (KiB)
+# PG_BLK_SIZES = [8, 32]
+PG_BLK_SIZES = [8]
+
+# Allowed sizes of block groups (in KiB). Database is compiled for each of these sizes.
+# Must be a power of 2 and multiple of block size
+# BLOCK_GROUP_SIZES = [256, 1024, 4096]
+BLOCK_GROUP_SIZES = [1024]
+# BLOCK_GROUP_SIZES = [256]
+# BLOCK_GROUP_SIZES = [256, 4096]
+
+# Defaults for parameters with multiple options
+DEFAULT_BLOCK_SIZE = 8  # kB, must be power of 2 between 1 and 32
+# DEFAULT_BG_SIZE = 256
+DEFAULT_BG_SIZE = 1024  # kB, must be power of 2 and >= block size
+
+
+@dataclasses.dataclass(frozen=True)
+class DeviceProfile:
+    """
+    Storage to emulate for postgres: read bandwidth and IOPS are limited with cgroup v2 `io.max`, and latency is added
+    to every request with dm-delay (only when the data directory is on the emulated device, see `emul_setup` in
+    `run_util.py`).
+    """
+    name: str
+    read_mbps: typing.Optional[float] = None  # MiB/s
+    read_iops: typing.Optional[int] = None
+    latency_ms: float = 0
+
+
+# Roughly the HDD and SSD hosts (HDD_HOST_ARGS_TPCH and SSD_HOST_ARGS)
+DEVICE_HDD = DeviceProfile('hdd', read_mbps=160, read_iops=250, latency_ms=4)
+DEVICE_SSD = DeviceProfile('ssd', read_mbps=520, read_iops=90000, latency_ms=0.1)
+DEVICE_PROFILES = {p.name: p for p in [DEVICE_HDD, DEVICE_SSD]}
+
+# Emulated device for running everything on one machine: a loop device over `EMUL_BACKING_FILE` (with direct I/O so
+# it isn't cached twice), under a dm-delay device named `EMUL_DM_NAME`, with a filesystem mounted at `EMUL_MOUNT`.
+EMUL_DM_NAME = 'pbm_emul'
+EMUL_BACKING_FILE = Path('/var/tmp/pbm_emul.img')
+EMUL_MOUNT = Path('/mnt/pbm_emul')
+# Host args for the emulated device on this machine. Device mapper devices are configured by name (`mapper/<name>`)
+# since their kernel name (`dm-N`) depends on what else was set up first
+LOCAL_HOST_ARGS = {
+    'data_root': (EMUL_MOUNT / 'pgdata', f'mapper/{EMUL_DM_NAME}'),
+    'db_host': 'localhost'
+}
+
 
 #######################################
 #  CONSTANTS & DERIVED CONFIGURATION  #
@@ -111,6 +158,19 @@ BENCHBASE_GIT_URL = 'ist-git@git.uwaterloo.ca:ta3vande/benchbase.git'
 # BENCHBASE_GIT_URL = 'https://@git.uwaterloo.ca/ta3vande/benchbase.git'
 BENCHBASE_SRC_PATH = BUILD_ROOT / 'benchbase_src'
 BENCHBASE_INSTALL_PATH = BUILD_ROOT / 'benchbase_install'
+# Running benchbase on several client hosts (`BBaseConfig.client_hosts`): each needs benchbase installed at the same
+# path. Clients start together this long after the run is set up (clocks must be synchronized, e.g. with NTP), and
+# client i uses the seed + i * CLIENT_SEED_STRIDE. Their own results are kept in the `BBASE_CLIENTS_DIR` subdirectory.
+CLIENT_START_DELAY_S = 10
+CLIENT_SEED_STRIDE = 1000003
+CLIENT_REMOTE_ROOT = '/tmp/pbm_bbase_client'
+BBASE_CLIENTS_DIR = 'clients'
+# benchbase writes the throughput and latency of every window of this many seconds (`-s`) to `SAMPLES_FILE`, which is
+# used to detect steady state (see `lib/steady_state.py`)
+BBASE_SAMPLE_WINDOW_S = 1
+SAMPLES_FILE = 'samples.csv'
+# benchbase logs the throughput of every interval of this many seconds (`-im`), which the run watchdogs check
+BBASE_MONITOR_INTERVAL_S = 1
 
 # Results
 RESULTS_ROOT = BUILD_ROOT / 'results'
@@ -119,10 +179,68 @@ CONFIG_FILE_NAME = 'test_config.json'
 CONSTRAINTS_FILE = 'constraints.csv'
 INDEXES_FILE = 'indexes.csv'
 IOSTATS_FILE = 'iostats.json'
-NON_DIR_RESULTS = [CONFIG_FILE_NAME, CONSTRAINTS_FILE, INDEXES_FILE, IOSTATS_FILE]
+PHASE_TIMES_FILE = 'phase_times.json'
+BLKTRACE_FILE = 'blktrace.npy'
+# Query plans captured with EXPLAIN ANALYZE (see `lib/plans.py`)
+PLANS_DIR = 'plans'
+# Per-statement statistics from pg_stat_statements after the run
+STATEMENTS_FILE = 'statements.csv'
+# Wait event profile of the run (see `lib/waits.py`)
+WAIT_EVENTS_FILE = 'wait_events.json'
+# Host resource telemetry of the run (see `lib/telemetry.py`), and where the agent runs on the database host
+TELEMETRY_FILE = 'telemetry.csv'
+TELEMETRY_REMOTE_AGENT = '/tmp/pbm_telemetry.py'
+TELEMETRY_REMOTE_OUT = '/tmp/pbm_telemetry.csv'
+TELEMETRY_REMOTE_PID = '/tmp/pbm_telemetry.pid'
+# how long to wait for the agent to take its last sample and exit when stopping it
+TELEMETRY_STOP_TIMEOUT_S = 30
+# Resource usage of the load generator on the client (see `lib/client_monitor.py`)
+CLIENT_STATS_FILE = 'client.csv'
+# CPU and NUMA topology of the database host and the client (see `write_topology`)
+TOPOLOGY_FILE = 'topology.json'
+# Storage characterization of each database host (see `lib/storage.py`), as `<host>.json`
+STORAGE_PROFILES_DIR = BUILD_ROOT / 'storage_profiles'
+STORAGE_REMOTE_SCRIPT = '/tmp/pbm_storage.py'
+STORAGE_REMOTE_OUT = '/tmp/pbm_storage.json'
+# OS page cache residency of relation files at points of the run (see `lib/pagecache.py`)
+PAGECACHE_FILE = 'pagecache.json'
+PAGECACHE_REMOTE_SCRIPT = '/tmp/pbm_pagecache.py'
+PAGECACHE_REMOTE_RELATIONS = '/tmp/pbm_pagecache_relations.json'
+PAGECACHE_REMOTE_OUT = '/tmp/pbm_pagecache.json'
+# 'start': after starting postgres and dropping the OS cache, 'before_run': after prewarming, right before the benchmark
+PAGECACHE_POINTS = ['start', 'before_run', 'after_run']
+# Wait event types of pg_stat_activity, plus 'CPU' for active backends which aren't waiting
+WAIT_EVENT_TYPES = ['CPU', 'LWLock', 'Lock', 'BufferPin', 'IO', 'IPC', 'Client', 'Activity', 'Extension', 'Timeout']
+# Written when a watchdog aborts a run (see `lib/watchdog.py`), with the reason. The collector skips these results.
+FAILED_FILE = 'failed.json'
+NON_DIR_RESULTS = [CONFIG_FILE_NAME, CONSTRAINTS_FILE, INDEXES_FILE, IOSTATS_FILE, PHASE_TIMES_FILE, BLKTRACE_FILE,
+                   PLANS_DIR, STATEMENTS_FILE, WAIT_EVENTS_FILE, TELEMETRY_FILE, PAGECACHE_FILE,
+                   TOPOLOGY_FILE, CLIENT_STATS_FILE, FAILED_FILE]
+
+# Phases of an experiment which are timed separately and stored in `PHASE_TIMES_FILE`, in the order they run.
+# 'benchbase' includes JVM startup and shutdown as well as the measured run (or just the run with the python driver or
+# pgbench). 'tpcc_restore_data_dir' restores the data directory of any workload which modifies the database.
+# 'explain' replaces 'benchbase' when only capturing query plans.
+EXPERIMENT_PHASES = [
+    'setup_indexes_cluster', 'tpcc_restore_data_dir', 'config_postgres', 'start_postgres', 'drop_caches',
+    'prewarm', 'clear_stats', 'benchbase', 'explain', 'blktrace', 'pagecache', 'stop_postgres', 'rename_results',
+]
+
+# Per-transaction-type stats of each run (next to the benchbase results)
+TXN_STATS_FILE = 'txn_stats.csv'
+# Latency histograms of each run, per transaction type (see `lib/histogram.py`)
+LATENCY_HIST_FILE = 'latency_hist.npz'
+# Throughput and latency of each phase of runs with several phases (concurrency ramps)
+PHASE_STATS_FILE = 'phase_stats.csv'
 
 # Aggregate results to:
 COLLECTED_RESULTS_CSV = 'results.csv'
+COLLECTED_TXN_RESULTS_CSV = 'results_txn.csv'  # per transaction type
+COLLECTED_HIST_NPZ = 'results_hist.npz'  # latency histograms per run and transaction type
+COLLECTED_PLAN_NODES_CSV = 'results_plan_nodes.csv'  # query plan nodes
+COLLECTED_WAIT_EVENTS_CSV = 'results_wait_events.csv'  # wait event profiles
+COLLECTED_PAGECACHE_CSV = 'results_pagecache.csv'  # page cache residency per relation
+COLLECTED_PHASE_RESULTS_CSV = 'results_phases.csv'  # per phase of concurrency ramps
 
 # Used to determine the 'pages per range' of BRIN indexes. We want to adjust this depending on the block size to have
 # the same number of *rows* per range. (approximately - blocks are padded slightly if not exactly a multiple of the row
@@ -133,6 +251,14 @@ BLOOM_BASE_PAGES_PER_RANGE = 32 * 8
 
 # Cgroup to run postgres under to limit total system memory
 PG_CGROUP: str = 'postgres_pbm'
+# Mount point of the cgroup v2 (unified) hierarchy
+CGROUP2_ROOT = Path('/sys/fs/cgroup')
+
+# Block I/O tracing (ftrace) on the database host: tracefs mount point, name of the trace instance to create, and
+# per-CPU buffer size (KiB) which must be large enough to not drop events between reads of the trace pipe.
+TRACEFS_ROOT = Path('/sys/kernel/tracing')
+BLKTRACE_FTRACE_INSTANCE = 'pbm_blktrace'
+BLKTRACE_BUFFER_KB = 65536
 
 # column names for IO stats for the disk
 # See https://www.kernel.org/doc/html/latest/block/stat.html for what these columns are
@@ -142,4 +268,10 @@ SYSBLOCKSTAT_COLS = [
     'in_flight', 'io_ticks', 'time_in_queue',
     'discard_ios', 'discard_merges', 'discard_sectors', 'discard_ticks',
     'flush_ios', 'flush_ticks',
-]
\ No newline at end of file
+]
+
+# columns of pg_stat_statements (PG 14) saved to `STATEMENTS_FILE`. Times are in ms
+PG_STATEMENTS_COLS = [
+    'queryid', 'query', 'calls', 'total_exec_time', 'mean_exec_time', 'rows',
+    'shared_blks_hit', 'shared_blks_read', 'shared_blks_dirtied', 'shared_blks_written', 'blk_read_time',
+]
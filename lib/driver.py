@@ -0,0 +1,244 @@
+"""
+In-process load driver: an alternative to benchbase for workloads which are just a fixed set of SQL queries (e.g. TPCH).
+
+Each terminal is a thread with its own persistent connection. Both weighted (time limited) and counted workloads are
+supported with the same semantics as the benchbase workload configs, and results are written in the same format as
+(renamed) benchbase results so `results_collect_to_csv.py` handles them unchanged:
+ - `summary.json`: runtime, throughput and latency distribution
+ - `metrics.json`: postgres statistics views after the run
+ - `stream_times.json`: time (us) for each terminal to run all its queries (counted workloads only)
+ - `raw.csv`: one line per query
+"""
+import csv
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import numpy as np
+import postgresql as pg
+from postgresql.api import Connection as PgConnection
+
+from lib.steady_state import SteadyStateMonitor
+
+# Queries for workload `w` are read from `ddl/<w>/<transaction name>.sql`
+DRIVER_SQL_ROOT = Path('ddl')
+# Same header as benchbase's raw output
+RAW_CSV_COLS = ['Transaction Type Index', 'Transaction Name', 'Start Time (microseconds)', 'Latency (microseconds)',
+                'Worker Id (start number)', 'Phase Id (index in config file)']
+# Statistics views saved to `metrics.json` after the run
+PG_METRICS_VIEWS = ['pg_stat_database', 'pg_statio_user_tables', 'pg_stat_user_tables']
+
+
+@dataclass
+class QueryResult:
+    txn: int  # index into the transaction types
+    start_us: int  # since the start of the run
+    latency_us: int
+    worker: int
+    measured: bool  # false for queries during warmup
+
+
+def read_transaction_types(base_config_file: str) -> List[str]:
+    """Names of the transaction types in a benchbase config file, in order of their ids."""
+    types = ET.parse(base_config_file).getroot().find('transactiontypes')
+    return [t.find('name').text for t in sorted(types, key=lambda t: int(t.find('id').text))]
+
+
+def load_queries(workload_name: str, names: List[str], used: List[bool]) -> List[Optional[str]]:
+    """Read the SQL of each used transaction type. Unused ones are `None` and don't need to exist."""
+    queries = []
+    for name, u in zip(names, used):
+        if not u:
+            queries.append(None)
+            continue
+        path = DRIVER_SQL_ROOT / workload_name / f'{name}.sql'
+        if not path.exists():
+            raise Exception(f'No SQL for transaction type {name} at {path}, it cannot be run without benchbase')
+        with open(path, 'r') as f:
+            queries.append(f.read())
+    return queries
+
+
+def parse_weights(weights: str) -> List[float]:
+    return [float(w) for w in weights.split(',') if w.strip() != '']
+
+
+class LoadDriver:
+    """
+    Run `nworkers` terminals against `conn_str`. Either `weights` + `time_s` (weighted) or `counts` (counted) must be
+    given, indexed the same as `queries`. Weighted runs stop before `time_s` once the steady-state throughput is known
+    to `stop_precision` (relative half-width of its confidence interval) if it is given.
+    """
+
+    def __init__(self, conn_str: str, queries: List[Optional[str]], nworkers: int, seed: int, *,
+                 weights: List[float] = None, time_s: float = None, warmup_s: float = 0,
+                 rate: str = 'unlimited', arrival: str = 'regular',
+                 counts: List[int] = None, randomized: bool = True, stop_precision: float = None):
+        if (weights is None) == (counts is None):
+            raise Exception('Load driver needs exactly one of weights or counts!')
+        self.conn_str = conn_str
+        self.queries = queries
+        self.nworkers = nworkers
+        self.seed = seed
+        self.weights = weights
+        self.time_s = time_s
+        self.warmup_s = warmup_s
+        # per-terminal rate limit (queries/s)
+        self.interval_s = None if rate == 'unlimited' else nworkers / float(rate)
+        self.poisson = arrival == 'poisson'
+        self.counts = counts
+        self.randomized = randomized
+        self.stop_precision = stop_precision if counts is None else None
+        self._stop = threading.Event()
+
+        self.results: List[List[QueryResult]] = [[] for _ in range(nworkers)]
+        self.stream_times_us: List[int] = []
+        self.start = None
+        self.runtime_ns = None
+
+    def _terminal(self, worker: int, conn: PgConnection, barrier: threading.Barrier) -> int:
+        """Run one terminal, returning the time (us) to run all of its queries."""
+        rng = random.Random(self.seed + worker)
+        if self.counts is not None:
+            order = [i for i, c in enumerate(self.counts) for _ in range(c)]
+            if self.randomized:
+                rng.shuffle(order)
+            txns = iter(order)
+        else:
+            end = self.warmup_s + self.time_s
+            txns = (rng.choices(range(len(self.weights)), self.weights)[0] for _ in itertools.count())
+
+        barrier.wait()
+        results = self.results[worker]
+        next_arrival = time.perf_counter()
+        for txn in txns:
+            now = time.perf_counter()
+            if self.counts is None and (now - self.start >= end or self._stop.is_set()):
+                break
+            if self.interval_s is not None:
+                next_arrival += rng.expovariate(1 / self.interval_s) if self.poisson else self.interval_s
+                if next_arrival > now:
+                    time.sleep(next_arrival - now)
+
+            q_start = time.perf_counter()
+            conn.execute(self.queries[txn])
+            q_end = time.perf_counter()
+            results.append(QueryResult(txn=txn, start_us=int((q_start - self.start) * 10**6),
+                                       latency_us=int((q_end - q_start) * 10**6), worker=worker,
+                                       measured=(q_start - self.start) >= self.warmup_s))
+
+        return int((time.perf_counter() - self.start) * 10**6)
+
+    def run(self):
+        # connect first so connection setup isn't part of the measured run
+        conns = [pg.open(self.conn_str) for _ in range(self.nworkers)]
+        barrier = threading.Barrier(self.nworkers + 1)
+        try:
+            with ThreadPoolExecutor(max_workers=self.nworkers) as pool:
+                futures = [pool.submit(self._terminal, w, conns[w], barrier) for w in range(self.nworkers)]
+                self.start = time.perf_counter()
+                barrier.wait()
+                if self.stop_precision is not None:
+                    self._monitor_steady_state(futures)
+                self.stream_times_us = [f.result() for f in futures]
+            elapsed_s = time.perf_counter() - self.start
+        finally:
+            for c in conns:
+                c.close()
+
+        # like benchbase, the runtime does not include warmup
+        self.runtime_ns = int((elapsed_s - self.warmup_s) * 10**9)
+
+    def _monitor_steady_state(self, futures):
+        """Count completed queries every second after the warmup, and stop the terminals once in steady state."""
+        monitor = SteadyStateMonitor(self.stop_precision)
+        next_window = self.start + self.warmup_s
+        prev = None
+        while not all(f.done() for f in futures):
+            time.sleep(max(next_window - time.perf_counter(), 0))
+            next_window += monitor.window_s
+            completed = sum(len(rs) for rs in self.results)
+            if prev is not None:
+                monitor.add_window(completed - prev)
+            prev = completed
+            if monitor.converged():
+                print(f'Steady state reached after {len(monitor.counts) * monitor.window_s:.0f} s, stopping early')
+                self._stop.set()
+                return
+
+    def measured(self) -> List[QueryResult]:
+        return [r for rs in self.results for r in rs if r.measured]
+
+    def summary(self) -> dict:
+        lat = np.array([r.latency_us for r in self.measured()], dtype=np.float64)
+        return summary_map(lat, self.runtime_ns, driver='python')
+
+    def write_results(self, out_dir: Path, names: List[str]):
+        os.makedirs(out_dir, exist_ok=True)
+        with open(out_dir / 'summary.json', 'w') as f:
+            f.write(json.JSONEncoder(indent=2).encode(self.summary()))
+        if self.counts is not None:
+            with open(out_dir / 'stream_times.json', 'w') as f:
+                f.write(json.JSONEncoder().encode(self.stream_times_us))
+        # like benchbase, only the measured part of the run (not the warmup) goes in raw.csv
+        rows = sorted(self.measured(), key=lambda r: r.start_us)
+        write_raw_csv(out_dir / 'raw.csv', ([r.txn, names[r.txn], r.start_us, r.latency_us, r.worker] for r in rows))
+
+
+def summary_map(latency_us: np.ndarray, runtime_ns: int, *, driver: str, failed: int = 0) -> dict:
+    """
+    `summary.json` with the same keys benchbase uses for everything the collector reads, from the latencies of the
+    completed requests in the measured part of the run. `failed` requests only count towards throughput.
+    """
+    lat = latency_us
+    runtime_s = runtime_ns / 10**9
+    pct = (lambda p: float(np.percentile(lat, p))) if len(lat) > 0 else (lambda p: 0.)
+    return {
+        'Benchmark Runtime (nanoseconds)': runtime_ns,
+        'Throughput (requests/second)': (len(lat) + failed) / runtime_s,
+        'Goodput (requests/second)': len(lat) / runtime_s,
+        'Driver': driver,
+        'Latency Distribution': {
+            'Average Latency (microseconds)': float(lat.mean()) if len(lat) > 0 else 0.,
+            'Maximum Latency (microseconds)': pct(100),
+            '99th Percentile Latency (microseconds)': pct(99),
+            '95th Percentile Latency (microseconds)': pct(95),
+            '90th Percentile Latency (microseconds)': pct(90),
+            '75th Percentile Latency (microseconds)': pct(75),
+            'Median Latency (microseconds)': pct(50),
+            '25th Percentile Latency (microseconds)': pct(25),
+            'Minimum Latency (microseconds)': pct(0),
+        },
+    }
+
+
+def write_raw_csv(out_file: Path, rows: Iterable[list]):
+    """
+    Write `raw.csv` from rows of [transaction type index (from 0), name, start (us), latency (us), worker] and
+    optionally the phase id (0 if not given). Like benchbase, the start time is actually written in seconds despite
+    the column name.
+    """
+    with open(out_file, 'w') as f:
+        w = csv.writer(f)
+        w.writerow(RAW_CSV_COLS)
+        w.writerows([txn + 1, name, f'{start / 10**6:.6f}', lat, worker, *(phase or [0])]
+                    for txn, name, start, lat, worker, *phase in rows)
+
+
+def write_pg_metrics(conn: PgConnection, out_file: Path):
+    """Save the postgres statistics views as `metrics.json`. Values are strings like in benchbase's output."""
+    metrics = {}
+    for view in PG_METRICS_VIEWS:
+        stmt = conn.prepare(f'SELECT * FROM {view}')
+        metrics[view] = [{c: (str(v) if v is not None else None) for c, v in zip(stmt.column_names, row)}
+                         for row in stmt()]
+    with open(out_file, 'w') as f:
+        f.write(json.JSONEncoder(indent=2).encode(metrics))
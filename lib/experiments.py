@@ -1,16 +1,21 @@
 """
 Code for setting up and running experiments.
 """
+import csv
+import io
 import json
 import os
-from typing import Optional, List, Dict, DefaultDict, Union
+import re
+from typing import Optional, List, Dict, DefaultDict, Union, Tuple, Callable
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 import copy
 
 import git
 import shutil
 import subprocess
 from datetime import datetime as dt
+import threading
 import time
 from pathlib import Path
 import postgresql as pg
@@ -24,42 +29,36 @@ from fabric import Connection as FabConnection
 import xml.etree.ElementTree as ET
 import tqdm
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, asdict, fields, field, replace
+import numpy as np
 import pandas as pd
 
 from lib.config import *
+from lib.blktrace import convert_ftrace
+from lib.driver import LoadDriver, DRIVER_SQL_ROOT, read_transaction_types, load_queries, parse_weights, \
+    write_pg_metrics, summary_map, write_raw_csv
+from lib.bbase_results import RAW_RESULTS_FILE, read_raw_results
+from lib.pgbench import PGBENCH_LOG_PREFIX, write_pgbench_results
+from lib.plans import PLAN_RUNS, plan_file_name
+from lib.waits import WaitEventSampler
+from lib.client_monitor import ClientSampler, client_stats
+from lib.watchdog import WatchdogConfig, RunWatchdog
 
 
 ##############################
 #  EXPERIMENT CONFIGURATION  #
 ##############################
 
-# Postgres block size (KiB)
-# PG_BLK_SIZES = [8, 32]
-PG_BLK_SIZES = [8]
-
 # Time to run tests (s)
 # BBASE_TIME = 600
 BBASE_TIME = 200
 BBASE_WARMUP_TIME = 10
 
-# Allowed sizes of block groups (in KiB). Database is compiled for each of these sizes.
-# Must be a power of 2 and multiple of block size
-# BLOCK_GROUP_SIZES = [256, 1024, 4096]
-BLOCK_GROUP_SIZES = [1024]
-# BLOCK_GROUP_SIZES = [256]
-# BLOCK_GROUP_SIZES = [256, 4096]
-
 # PG_WORK_MEM = '32MB'
 PG_WORK_MEM = '4MB'
 
 
-# Defaults for parameters with multiple options
-DEFAULT_BLOCK_SIZE = 8  # kB, must be power of 2 between 1 and 32
-# DEFAULT_BG_SIZE = 256
-DEFAULT_BG_SIZE = 1024  # kB, must be power of 2 and >= block size
-
-
 ##########
 #  CODE  #
 ##########
@@ -98,6 +97,12 @@ class WorkloadConfig(ABC):
     @abstractmethod
     def write_bbase_config(self, work_element: ET.Element): ...
 
+    def write_bbase_works(self, works_element: ET.Element):
+        """Add the phases (`<work>` elements) of the workload to the benchbase config: by default just one."""
+        work = ET.SubElement(works_element, 'work')
+        ET.SubElement(work, 'serial').text = 'false'
+        self.write_bbase_config(work)
+
     @abstractmethod
     def to_config_map(self) -> dict: ...
 
@@ -111,6 +116,8 @@ class WeightedWorkloadConfig(WorkloadConfig):
     warmup_s: int = 0
     rate: str = 'unlimited'
     arrival: str = 'regular'
+    # stop before `time_s` once steady-state throughput is known to this relative precision (python driver only)
+    stop_precision: Optional[float] = None
 
     def with_rate(self, q_per_s: int) -> 'WeightedWorkloadConfig':
         ret = copy.copy(self)
@@ -128,6 +135,24 @@ class WeightedWorkloadConfig(WorkloadConfig):
         ret.warmup_s = warmup
         return ret
 
+    def with_early_stop(self, precision: Optional[float]) -> 'WeightedWorkloadConfig':
+        """Stop once the steady-state throughput is known to `precision`. MSER-5 finds the warmup, so none is fixed"""
+        ret = copy.copy(self)
+        ret.stop_precision = precision
+        ret.warmup_s = 0
+        return ret
+
+    def with_ramp(self, terminals: List[int]) -> 'RampWorkloadConfig':
+        """Run the workload once for each number of active terminals, each phase for `time_s` after `warmup_s`"""
+        ret = RampWorkloadConfig(**{f.name: getattr(self, f.name) for f in fields(self) if f.init},
+                                 terminals=list(terminals))
+        ret.selectivity = self.selectivity
+        return ret
+
+    @property
+    def total_time_s(self) -> int:
+        return self.warmup_s + self.time_s
+
     def write_bbase_config(self, work_element: ET.Element):
         ET.SubElement(work_element, 'rate').text = self.rate
         ET.SubElement(work_element, 'arrival').text = self.arrival
@@ -147,6 +172,48 @@ class WeightedWorkloadConfig(WorkloadConfig):
             'warmup': self.warmup_s,
             'rate': self.rate,
             'arrival': self.arrival,
+            'stop_precision': self.stop_precision if self.stop_precision is not None else '',
+        }
+
+
+@dataclass
+class RampWorkloadConfig(WeightedWorkloadConfig):
+    """
+    Weighted workload run as a series of phases with an increasing (or any) number of active terminals, so a whole
+    throughput vs. concurrency curve is measured with one database start and prewarm. Each phase has its own warmup
+    and runs for `time_s`. Benchbase has to be started with at least `max(terminals)` terminals.
+    """
+    terminals: List[int] = field(default_factory=list)
+
+    def __post_init__(self):
+        if not self.terminals or min(self.terminals) < 1:
+            raise Exception(f'Invalid terminals for a ramp: {self.terminals}')
+
+    @property
+    def max_terminals(self) -> int:
+        return max(self.terminals)
+
+    @property
+    def total_time_s(self) -> int:
+        return len(self.terminals) * (self.warmup_s + self.time_s)
+
+    def client_share(self, i: int, n: int) -> 'RampWorkloadConfig':
+        """Active terminals of client `i` of `n` in each phase, split the same way as the terminals"""
+        ret = copy.copy(self)
+        ret.terminals = [t // n + (1 if i < t % n else 0) for t in self.terminals]
+        return ret
+
+    def write_bbase_works(self, works_element: ET.Element):
+        for terminals in self.terminals:
+            work = ET.SubElement(works_element, 'work')
+            ET.SubElement(work, 'serial').text = 'false'
+            self.write_bbase_config(work)
+            ET.SubElement(work, 'active_terminals').text = str(terminals)
+
+    def to_config_map(self) -> dict:
+        return {
+            **super().to_config_map(),
+            'ramp': ','.join(str(t) for t in self.terminals),
         }
 
 
@@ -187,9 +254,63 @@ class CountedWorkloadConfig(WorkloadConfig):
         }
 
 
+@dataclass
+class PgbenchWorkloadConfig(WorkloadConfig):
+    """
+    pgbench workload (run instead of benchbase) for a fixed time: built-in scripts and/or custom script files, each
+    optionally with a weight (`name@weight`). The number of clients is the number of workers in `BBaseConfig`.
+    """
+    time_s: int
+    builtin: List[str] = field(default_factory=lambda: ['tpcb-like'])
+    scripts: List[str] = field(default_factory=list)
+    nthreads: int = 1
+    rate: str = 'unlimited'  # or total transactions/s
+
+    def with_rate(self, tps: int) -> 'PgbenchWorkloadConfig':
+        ret = copy.copy(self)
+        ret.rate = str(tps)
+        return ret
+
+    def with_time(self, time_s: int) -> 'PgbenchWorkloadConfig':
+        ret = copy.copy(self)
+        ret.time_s = time_s
+        return ret
+
+    @property
+    def script_names(self) -> List[str]:
+        """Name of each script, in the order pgbench numbers them"""
+        return [b.partition('@')[0] for b in self.builtin] + [Path(s.partition('@')[0]).stem for s in self.scripts]
+
+    def pgbench_args(self) -> List[str]:
+        args = [f'--builtin={b}' for b in self.builtin]
+        for s in self.scripts:
+            path, at, weight = s.partition('@')
+            args.append(f'--file={Path(path).absolute()}{at}{weight}')
+        args += ['--time', str(self.time_s), '--jobs', str(self.nthreads)]
+        if self.rate != 'unlimited':
+            args += ['--rate', self.rate]
+        return args
+
+    def write_bbase_config(self, work_element: ET.Element):
+        raise Exception(f'{self.workname} is a pgbench workload, it cannot be run with benchbase')
+
+    def to_config_map(self) -> dict:
+        return {
+            # general workload config fields
+            'workload': self.workname,
+            'selectivity': '',
+            # specific to this workload type:
+            'time': self.time_s,
+            'rate': self.rate,
+            'pgbench_scripts': ','.join(self.builtin + self.scripts),
+            'pgbench_threads': self.nthreads,
+        }
+
+
 # The available workloads
 TPCH = Workload('tpch', 'bbase_config/sample_tpch_config.xml', PG_HOST_TPCH, PG_DATA_DEVICE)
 TPCC = Workload('tpcc', 'bbase_config/sample_tpcc_config.xml', PG_HOST_TPCC, PG_DATA_DEVICE)
+PGBENCH = Workload('pgbench', None, PG_HOST_TPCC, PG_DATA_DEVICE)
 
 # queries 17 and 20 are extremely slow, 18 and 21 are moderately slow.
 WORKLOAD_TPCH_WEIGHTS = WeightedWorkloadConfig('tpch_w', TPCH, weights='1,'*16 + '0,'*6 + '0,0,0', time_s=BBASE_TIME)
@@ -198,6 +319,8 @@ WORKLOAD_TPCH_COUNTS = CountedWorkloadConfig('tpch_c', TPCH, counts=[1]*16 + [0]
 WORKLOAD_MICRO_COUNTS = CountedWorkloadConfig('micro_c', TPCH, counts=[0]*22 + [1, 1, 0])
 WORKLOAD_MICRO_IDX_COUNTS = CountedWorkloadConfig('microidx_c', TPCH, counts=[0]*22 + [0, 0, 1])
 WORKLOAD_TPCC = WeightedWorkloadConfig('tpcc', TPCC, weights='45,43,4,4,4', time_s=BBASE_TIME, warmup_s=BBASE_WARMUP_TIME)
+WORKLOAD_PGBENCH_TPCB = PgbenchWorkloadConfig('pgbench_tpcb', PGBENCH, time_s=BBASE_TIME)
+WORKLOAD_PGBENCH_SELECT = PgbenchWorkloadConfig('pgbench_select', PGBENCH, time_s=BBASE_TIME, builtin=['select-only'])
 
 
 WORKLOADS_MAP: Dict[str, WorkloadConfig] = {c.workname: c for c in [
@@ -206,6 +329,8 @@ WORKLOADS_MAP: Dict[str, WorkloadConfig] = {c.workname: c for c in [
     WORKLOAD_TPCH_COUNTS,
     WORKLOAD_MICRO_COUNTS,
     WORKLOAD_TPCC,
+    WORKLOAD_PGBENCH_TPCB,
+    WORKLOAD_PGBENCH_SELECT,
 ]}
 
 
@@ -311,15 +436,91 @@ class DbConfig:
 
 @dataclass
 class CGroupConfig:
-    mem_gb: float
+    """
+    Cgroup to run postgres in, limiting memory (including the OS page cache) and optionally I/O to the data device.
+    Version 1 uses cgroup-tools and only supports the memory limit. Version 2 writes to the unified hierarchy directly
+    and also supports `memory.high` (reclaim throttling before the hard limit) and `io.max` read limits, to emulate a
+    slower device.
+    """
+    mem_gb: Optional[float]  # memory.max (v2) or memory.limit_in_bytes (v1), None for no limit
     name: str = PG_CGROUP
+    version: int = 1
+    mem_high_gb: Optional[float] = None
+    io_read_bps: Optional[int] = None  # bytes/s
+    io_read_iops: Optional[int] = None
+
+    def __post_init__(self):
+        if self.version not in [1, 2]:
+            raise Exception(f'Unknown cgroup version {self.version}')
+        if self.version == 1 and (self.mem_high_gb, self.io_read_bps, self.io_read_iops) != (None, None, None):
+            raise Exception('memory.high and I/O limits are only supported with cgroup v2!')
 
     @property
     def mem_bytes(self):
         return int(self.mem_gb * 2**30)
 
+    @property
+    def path(self) -> Path:
+        """Directory of the cgroup in the unified hierarchy (v2 only)"""
+        return CGROUP2_ROOT / self.name
+
     def to_config_map(self) -> dict:
-        return {'cgroup_gb': self.mem_gb, }
+        return {
+            'cgroup_gb': self.mem_gb,
+            'cgroup_version': self.version,
+            'cgroup_high_gb': self.mem_high_gb,
+            'cgroup_io_read_bps': self.io_read_bps,
+            'cgroup_io_read_iops': self.io_read_iops,
+        }
+
+
+@dataclass
+class OsTuningConfig:
+    """
+    OS settings on the database host which affect I/O, set before each run and restored to the host's values after.
+    None leaves a setting as it is. Readahead is set on the device of the data directory's filesystem and the disks
+    under it, and the I/O scheduler on the disks.
+    """
+    readahead_kb: Optional[int] = None  # queue/read_ahead_kb
+    scheduler: Optional[str] = None  # queue/scheduler, e.g. 'none', 'mq-deadline', 'bfq', 'kyber'
+    thp: Optional[str] = None  # transparent huge pages: 'always', 'madvise' or 'never'
+    dirty_ratio: Optional[int] = None  # vm.dirty_ratio (%)
+    dirty_background_ratio: Optional[int] = None  # vm.dirty_background_ratio (%)
+    dirty_expire_centisecs: Optional[int] = None  # vm.dirty_expire_centisecs
+
+    def __post_init__(self):
+        if self.thp not in [None, 'always', 'madvise', 'never']:
+            raise Exception(f'Unknown transparent huge pages setting {self.thp}')
+
+    def to_config_map(self) -> dict:
+        return {f'os_{f.name}': getattr(self, f.name) for f in fields(self)}
+
+
+@dataclass
+class AffinityConfig:
+    """
+    CPUs (a cpu list like '0-7,16-23') and/or NUMA node to run postgres on the database host and the load generator
+    (the benchbase JVM or pgbench) on the client. With a cgroup v2 postgres is confined by the cgroup's cpuset,
+    otherwise it is started under `taskset` or `numactl` (for a NUMA node, which also binds its memory to the node).
+    Backends are forked from the postmaster so they inherit its affinity.
+    """
+    pg_cpus: Optional[str] = None
+    pg_numa_node: Optional[int] = None
+    client_cpus: Optional[str] = None
+    client_numa_node: Optional[int] = None
+
+    def to_config_map(self) -> dict:
+        return {f'affinity_{f.name}': getattr(self, f.name) for f in fields(self)}
+
+
+def affinity_command(cpus: Optional[str], numa_node: Optional[int]) -> List[str]:
+    """Command prefix to run something on the given CPUs and/or NUMA node (empty if neither is given)"""
+    if numa_node is not None:
+        cpu_arg = f'--physcpubind={cpus}' if cpus is not None else f'--cpunodebind={numa_node}'
+        return ['numactl', cpu_arg, f'--membind={numa_node}']
+    if cpus is not None:
+        return ['taskset', '--cpu-list', cpus]
+    return []
 
 
 @dataclass
@@ -332,12 +533,60 @@ class BBaseConfig:
     workload: WorkloadConfig
     seed: int = 12345
     prewarm: bool = True
+    driver: str = 'benchbase'  # or 'python' for the in-process load driver (lib/driver.py). Always pgbench for pgbench workloads
+    # hosts to split the terminals between, each running benchbase (empty: run it on this host)
+    client_hosts: List[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        if isinstance(self.workload, PgbenchWorkloadConfig):
+            self.driver = 'pgbench'
+        if self.client_hosts and self.driver != 'benchbase':
+            raise Exception(f'Multiple client hosts are only supported with benchbase, not {self.driver}')
+        if len(self.client_hosts) > self.nworkers:
+            raise Exception(f'Can\'t split {self.nworkers} terminals between {len(self.client_hosts)} clients')
+        if getattr(self.workload, 'stop_precision', None) is not None and self.driver != 'python':
+            raise Exception(f'Stopping at steady state is only supported with the python driver, not {self.driver}')
+        if isinstance(self.workload, RampWorkloadConfig):
+            if self.driver != 'benchbase':
+                raise Exception(f'Concurrency ramps are only supported with benchbase, not {self.driver}')
+            if self.workload.max_terminals > self.nworkers:
+                raise Exception(f'Ramp to {self.workload.max_terminals} active terminals needs at least as many '
+                                f'terminals, not {self.nworkers}')
+            if self.client_hosts and min(self.workload.terminals) < len(self.client_hosts):
+                print(f'WARNING: some clients have no active terminals in the first phases of the ramp '
+                      f'{self.workload.terminals}')
+
+    @property
+    def watchable(self) -> bool:
+        """Whether the run watchdogs can be enforced: only benchbase on this host streams its throughput to them"""
+        return self.driver == 'benchbase' and not self.client_hosts
+
+    def client_shares(self) -> List['BBaseConfig']:
+        """
+        Configuration of each client host: a share of the terminals (and of the rate, if limited), and a different
+        seed so clients don't run the same sequence of transactions.
+        """
+        n = len(self.client_hosts)
+        ret = []
+        for i in range(n):
+            share = self.nworkers // n + (1 if i < self.nworkers % n else 0)
+            workload = self.workload
+            rate = getattr(workload, 'rate', 'unlimited')
+            if rate != 'unlimited':
+                workload = workload.with_rate(max(1, round(float(rate) * share / self.nworkers)))
+            if isinstance(workload, RampWorkloadConfig):
+                workload = workload.client_share(i, n)
+            ret.append(replace(self, nworkers=share, workload=workload, seed=self.seed + i * CLIENT_SEED_STRIDE,
+                               client_hosts=[]))
+        return ret
 
     def to_config_map(self) -> dict:
         return {
             'parallelism': self.nworkers,
             'prewarm': self.prewarm,
             'seed': self.seed,
+            'driver': self.driver,
+            'client_hosts': ' '.join(self.client_hosts),
             **self.workload.to_config_map(),
         }
 
@@ -355,6 +604,9 @@ class RuntimePgConfig:
     track_io_timing: str = 'off'
     work_mem: str = PG_WORK_MEM
     max_connections: int = None
+    # Extensions loaded at startup, e.g. pg_stat_statements (built with the server by `build_postgres`, see
+    # `with_statements`). Not loaded by default since it adds overhead to every statement
+    shared_preload_libraries: Optional[str] = None
     # Optimizer cost estimation
     seq_page_cost: Optional[float] = None
     random_page_cost: Optional[float] = None
@@ -389,6 +641,18 @@ class RuntimePgConfig:
     def config_dict(self) -> Dict[str, str]:
         return {k: (str(v) if v is not None else None) for k, v in asdict(self).items()}
 
+    @property
+    def track_statements(self) -> bool:
+        return 'pg_stat_statements' in (self.shared_preload_libraries or '')
+
+    def with_statements(self) -> 'RuntimePgConfig':
+        """Same config with pg_stat_statements preloaded, to save per-statement statistics of the run"""
+        if self.track_statements:
+            return self
+        libs = f'{self.shared_preload_libraries},pg_stat_statements' if self.shared_preload_libraries \
+            else 'pg_stat_statements'
+        return replace(self, shared_preload_libraries=libs)
+
 
 @dataclass(frozen=True)
 class DbSetup:
@@ -402,6 +666,34 @@ class DbSetup:
         return ret
 
 
+class RunAborted(Exception):
+    """A watchdog stopped the benchmark. The results directory is marked with `FAILED_FILE`."""
+
+
+@dataclass
+class CaptureConfig:
+    """Optional data to capture on the database host during the benchmark, which is too expensive to always collect"""
+    blktrace: bool = False  # trace every block I/O request to the data device
+    wait_events_hz: Optional[float] = None  # rate to sample wait events of the benchmark's backends, if at all
+    telemetry_interval_s: Optional[float] = None  # interval to sample host resource telemetry at, if at all
+    pagecache_points: Tuple[str, ...] = ()  # points of the run to measure page cache residency at (`PAGECACHE_POINTS`)
+    client_interval_s: Optional[float] = 1.  # interval to sample the benchbase JVM on the client at
+
+    def __post_init__(self):
+        for p in self.pagecache_points:
+            if p not in PAGECACHE_POINTS:
+                raise Exception(f'Unknown page cache capture point {p}, options are: {", ".join(PAGECACHE_POINTS)}')
+
+    def to_config_map(self) -> dict:
+        return {
+            'capture_blktrace': self.blktrace,
+            'capture_wait_events_hz': self.wait_events_hz,
+            'capture_telemetry_interval_s': self.telemetry_interval_s,
+            'capture_pagecache_points': ' '.join(self.pagecache_points),
+            'capture_client_interval_s': self.client_interval_s,
+        }
+
+
 @dataclass
 class ExperimentConfig:
     """All configuration for an experiment"""
@@ -411,6 +703,18 @@ class ExperimentConfig:
     bbconf: BBaseConfig
     db_host: str = None
     cgroup: Optional[CGroupConfig] = None
+    capture: CaptureConfig = field(default_factory=CaptureConfig)
+    device: Optional[DeviceProfile] = None  # storage to emulate
+    os_tuning: Optional[OsTuningConfig] = None
+    affinity: Optional[AffinityConfig] = None
+    # abort benchbase if it stalls or runs far from expectations (None: never)
+    watchdog: Optional[WatchdogConfig] = field(default_factory=WatchdogConfig)
+
+    @property
+    def client_command(self) -> List[str]:
+        """Command prefix to pin the load generator with (empty without affinity)"""
+        a = self.affinity
+        return affinity_command(a.client_cpus, a.client_numa_node) if a is not None else []
 
     _res_dir: Optional[Path] = field(init=False, default=None)
 
@@ -418,6 +722,29 @@ class ExperimentConfig:
         if self.db_host is None:
             self.db_host = self.bbconf.workload.workload.default_db_host
 
+        if self.watchdog is not None and self.watchdog != WatchdogConfig() and not self.bbconf.watchable:
+            where = 'multiple client hosts' if self.bbconf.client_hosts else f'the {self.bbconf.driver} driver'
+            raise Exception(f'Run watchdogs are only supported with benchbase on this host, not with {where}')
+
+        # bandwidth and IOPS limits of the device are applied through the cgroup, which needs cgroup v2
+        if self.device is not None and (self.device.read_mbps or self.device.read_iops):
+            if self.cgroup is not None and self.cgroup.version != 2:
+                raise Exception(f'Device profile {self.device.name} limits I/O through the cgroup, which needs '
+                                f'cgroup v2 but version {self.cgroup.version} is configured')
+            cg = self.cgroup or CGroupConfig(None, version=2)
+            self.cgroup = replace(
+                cg,
+                io_read_bps=cg.io_read_bps or (int(self.device.read_mbps * 2**20) if self.device.read_mbps else None),
+                io_read_iops=cg.io_read_iops or self.device.read_iops,
+            )
+
+    def device_config_map(self) -> dict:
+        d = self.device
+        return {
+            'device_profile': d.name if d is not None else None,
+            'device_latency_ms': d.latency_ms if d is not None else None,
+        }
+
     @property
     def results_dir(self) -> Path:
         if self._res_dir is not None:
@@ -446,6 +773,29 @@ class ExperimentConfig:
         return self.results_dir / f'{self.dbconf.branch.name}_blksz{self.dbconf.block_size}'
 
 
+class PhaseTimer:
+    """Accumulates wall time (from a monotonic clock) spent in each phase of an experiment."""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the body of the `with` block as phase `name`. Repeated phases are added together."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.) + (time.monotonic() - start)
+
+    def to_json_map(self) -> dict:
+        return {
+            'phases': self.phases,
+            'total': time.monotonic() - self.start,
+        }
+
+
 def last_config_file(dbhost: str) -> str:
     return f'last_config_{dbhost}.json'
 
@@ -632,7 +982,7 @@ def build_postgres(dbbin: DbBin):
         raise Exception(f'Got return code {ret} when installing postgres {brnch.name} with block size={blk_sz}, group size={bg_sz}')
 
     # compile desired extensions...
-    for ext in ['pg_prewarm', 'pg_trgm']:
+    for ext in ['pg_prewarm', 'pg_trgm', 'pg_stat_statements']:
         build_postgres_extension(build_path, ext)
 
 
@@ -725,7 +1075,150 @@ def config_remote_postgres(conn: fabric.Connection, dbconf: DbConfig, pgconf: Ru
     os.remove(local_temp_path)
 
 
-def start_remote_postgres(conn: fabric.Connection, case: DbConfig, cgroup: CGroupConfig = None):
+def remote_block_dev(conn: fabric.Connection, name: str) -> Tuple[int, int]:
+    """Major and minor device numbers of a block device (e.g. 'sdb') on the remote host"""
+    major, minor = conn.run(f'cat /sys/class/block/{name}/dev', hide=True).stdout.split(':')
+    return int(major), int(minor)
+
+
+@dataclass
+class BlockDevices:
+    """Block devices (names in /sys/class/block) under the data directory"""
+    top: str  # device the filesystem is on, e.g. 'sdb1', 'dm-2' (LVM), 'md0', 'nvme0n1p2'
+    leaves: List[str]  # devices at the bottom of the stack, e.g. the partitions an LVM volume or RAID is on
+    disks: List[str]  # whole disks of the leaves (e.g. 'sdb' for 'sdb1')
+
+
+def remote_data_devices(conn: fabric.Connection, case: DbConfig) -> BlockDevices:
+    """
+    Resolve the block devices under the data directory on the remote host: the device of the filesystem, then through
+    `slaves/` of device mapper (LVM, dm-delay) and md-RAID devices down to the partitions or disks they are on.
+    Falls back to the configured device (`Workload.device`) if that fails, e.g. for filesystems without a block device.
+    """
+    configured = case.data.workload.device.split('/')
+    if configured[0] == 'mapper':
+        # device mapper device by name (e.g. the emulated device): look up its kernel name
+        dm = conn.run(f'basename $(readlink -e /dev/mapper/{configured[1]})', hide=True, warn=True).stdout.strip()
+        configured = [dm or configured[1]]
+    # only the data root has to exist yet
+    path = case.data.data_path
+    # readlink -e fails if there is no such block device (e.g. btrfs or overlay, with major 0)
+    res = conn.run(f'd=$(stat -c %d {path} 2>/dev/null || stat -c %d {path.parent}) && '
+                   f'dev=$(readlink -e /sys/dev/block/$(( d >> 8 & 0xfff )):$(( (d & 0xff) | (d >> 12 & 0xfff00) ))) && '
+                   f'basename $dev', hide=True, warn=True)
+    top = res.stdout.strip()
+    if not res.ok or not top:
+        print(f'WARNING: could not find the block device of {path} on {conn.host}, using configured {configured[-1]}')
+        return BlockDevices(configured[-1], [configured[-1]], [configured[0]])
+
+    leaves = []
+    todo = [top]
+    while todo:
+        dev = todo.pop(0)
+        slaves = conn.run(f'ls /sys/class/block/{dev}/slaves', hide=True, warn=True).stdout.split()
+        if slaves:
+            todo += sorted(slaves)
+        elif dev not in leaves:
+            leaves.append(dev)
+
+    disks = []
+    for dev in leaves:
+        # partitions are a subdirectory of their disk in sysfs
+        is_part = conn.run(f'test -e /sys/class/block/{dev}/partition', hide=True, warn=True).ok
+        disk = conn.run(f'basename $(dirname $(readlink -f /sys/class/block/{dev}))', hide=True).stdout.strip() \
+            if is_part else dev
+        if disk not in disks:
+            disks.append(disk)
+
+    if configured[-1] not in [top, *leaves]:
+        print(f'WARNING: configured device {"/".join(configured)} is not under {path} on {conn.host}, '
+              f'using {top} ({", ".join(leaves)})')
+    return BlockDevices(top, leaves, disks)
+
+
+def config_remote_cgroup_v2(conn: fabric.Connection, case: DbConfig, cgroup: CGroupConfig,
+                            affinity: AffinityConfig = None):
+    """
+    Create the cgroup (v2) if needed and set its memory and I/O limits and cpuset, clearing any that aren't configured.
+    """
+    cg = cgroup.path
+    conn.run(f'sudo mkdir -p {cg}', hide=True)
+    # the controllers must be enabled for children of the parent group
+    conn.run(f"echo '+memory +io +cpuset' | sudo tee {cg.parent / 'cgroup.subtree_control'}", hide=True)
+
+    def write(file: str, value):
+        conn.run(f"echo '{value}' | sudo tee {cg / file}", hide=True)
+
+    # empty cpuset files mean all CPUs and memory nodes of the parent
+    cpus, node = (affinity.pg_cpus, affinity.pg_numa_node) if affinity is not None else (None, None)
+    if cpus is None and node is not None:
+        cpus = conn.run(f'cat /sys/devices/system/node/node{node}/cpulist', hide=True).stdout.strip()
+    write('cpuset.cpus', cpus or '')
+    write('cpuset.mems', node if node is not None else '')
+
+    write('memory.max', cgroup.mem_bytes if cgroup.mem_gb is not None else 'max')
+    write('memory.high', int(cgroup.mem_high_gb * 2**30) if cgroup.mem_high_gb is not None else 'max')
+
+    # io.max applies to whole disks, not partitions or device mapper devices. For several disks (e.g. RAID) each one
+    # gets the limit
+    for disk in remote_data_devices(conn, case).disks:
+        major, minor = remote_block_dev(conn, disk)
+        write('io.max', f'{major}:{minor} rbps={cgroup.io_read_bps or "max"} riops={cgroup.io_read_iops or "max"}')
+
+
+def _read_remote_setting(conn: fabric.Connection, file: str) -> str:
+    value = conn.run(f'cat {file}', hide=True).stdout.strip()
+    # selections like the scheduler and THP are shown as `a [b] c`
+    selected = re.search(r'\[(\S+)]', value)
+    return selected.group(1) if selected else value
+
+
+def _write_remote_settings(conn: fabric.Connection, settings: Dict[str, str]):
+    for file, value in settings.items():
+        conn.run(f"echo '{value}' | sudo tee {file}", hide=True)
+
+
+def apply_remote_os_tuning(conn: fabric.Connection, case: DbConfig, tuning: Optional[OsTuningConfig]) -> Dict[str, str]:
+    """
+    Apply the OS settings of `tuning` on the remote host, returning the previous value of everything that was changed
+    (file -> value) for `restore_remote_os_tuning`.
+    """
+    if tuning is None:
+        return {}
+    settings = {}
+    if tuning.readahead_kb is not None or tuning.scheduler is not None:
+        devices = remote_data_devices(conn, case)
+        # partitions don't have a queue of their own, the disk's is used
+        queued = [d for d in dict.fromkeys([devices.top, *devices.disks])
+                  if conn.run(f'test -e /sys/class/block/{d}/queue', hide=True, warn=True).ok]
+        if tuning.readahead_kb is not None:
+            settings.update({f'/sys/class/block/{d}/queue/read_ahead_kb': tuning.readahead_kb for d in queued})
+        if tuning.scheduler is not None:
+            settings.update({f'/sys/class/block/{d}/queue/scheduler': tuning.scheduler for d in devices.disks})
+    if tuning.thp is not None:
+        settings['/sys/kernel/mm/transparent_hugepage/enabled'] = tuning.thp
+    for name in ['dirty_ratio', 'dirty_background_ratio', 'dirty_expire_centisecs']:
+        if getattr(tuning, name) is not None:
+            settings[f'/proc/sys/vm/{name}'] = getattr(tuning, name)
+
+    previous = {file: _read_remote_setting(conn, file) for file in settings}
+    # setting a dirty ratio clears the matching *_bytes limit, so remember that too
+    for file in [f for f in settings if f.endswith('_ratio')]:
+        previous[file.replace('_ratio', '_bytes')] = _read_remote_setting(conn, file.replace('_ratio', '_bytes'))
+
+    _write_remote_settings(conn, settings)
+    return previous
+
+
+def restore_remote_os_tuning(conn: fabric.Connection, previous: Dict[str, str]):
+    """Restore the settings changed by `apply_remote_os_tuning`"""
+    # only one of each dirty ratio or bytes is in use (the other is 0), and writing 0 would clear the other
+    _write_remote_settings(conn, {f: v for f, v in previous.items()
+                                  if not (f.startswith('/proc/sys/vm/dirty_') and v == '0')})
+
+
+def start_remote_postgres(conn: fabric.Connection, case: DbConfig, cgroup: CGroupConfig = None,
+                          affinity: AffinityConfig = None):
     """Start PostgreSQL from the benchmark client machine."""
     install_path = case.bin.install_path
     pgctl = install_path / 'bin' / 'pg_ctl'
@@ -734,8 +1227,15 @@ def start_remote_postgres(conn: fabric.Connection, case: DbConfig, cgroup: CGrou
 
     conn.run(f'truncate --size=0 {logfile}')
     start_cmd = f'{pgctl} start -D {data_dir} -l {logfile}'
-    if cgroup is not None:
-        conn.run(f'cgset -r memory.limit_in_bytes={cgroup.mem_bytes} {cgroup.name}')
+    if affinity is not None and (cgroup is None or cgroup.version == 1):
+        start_cmd = ' '.join([*affinity_command(affinity.pg_cpus, affinity.pg_numa_node), start_cmd])
+    if cgroup is not None and cgroup.version == 2:
+        config_remote_cgroup_v2(conn, case, cgroup, affinity)
+        # move the shell into the cgroup (needs root), then start postgres from it as the normal user
+        start_cmd = f"sudo sh -c 'echo $$ > {cgroup.path / 'cgroup.procs'} && exec sudo -u {conn.user} {start_cmd}'"
+    elif cgroup is not None:
+        limit = cgroup.mem_bytes if cgroup.mem_gb is not None else -1
+        conn.run(f'cgset -r memory.limit_in_bytes={limit} {cgroup.name}')
         start_cmd = f'cgexec -g memory:{cgroup.name} {start_cmd}'
     conn.run(start_cmd)
 
@@ -751,12 +1251,159 @@ def stop_remote_postgres(conn: fabric.Connection, case: DbConfig, immediate=Fals
     conn.run(f'{pgctl} stop -D {data_dir} {extra_args}')
 
 
-def get_remote_disk_stats(conn: fabric.Connection, case: DbConfig):
-    """Get disk stats of the remote host as a dict"""
-    dev = case.data.workload.device
-    res = conn.run(f'cat /sys/block/{dev}/stat', hide=True).stdout.split()
+def set_remote_device_latency(conn: fabric.Connection, case: DbConfig, device: Optional[DeviceProfile]):
+    """
+    If the data directory is on the emulated device, set the latency dm-delay adds to every request to that of
+    `device` (none without a profile). Otherwise only warn if the profile has a latency which can't be emulated.
+    """
+    top = remote_data_devices(conn, case).top
+    dm_name = conn.run(f'cat /sys/class/block/{top}/dm/name', hide=True, warn=True).stdout.strip()
+    latency_ms = device.latency_ms if device is not None else 0
+    if dm_name != EMUL_DM_NAME:
+        if latency_ms > 0:
+            print(f'WARNING: {case.data.data_path} is not on the emulated device, ignoring latency of {device.name}')
+        return
+
+    # table is `<start> <sectors> delay <device> <offset> <delay ms>`
+    table = conn.run(f'sudo dmsetup table {EMUL_DM_NAME}', hide=True).stdout.split()
+    table[5] = f'{latency_ms:g}'
+    conn.run(f"sudo dmsetup suspend {EMUL_DM_NAME} && sudo dmsetup reload {EMUL_DM_NAME} --table '{' '.join(table[:6])}'"
+             f" && sudo dmsetup resume {EMUL_DM_NAME}", hide=True)
+
+
+def get_remote_disk_stats(conn: fabric.Connection, case: DbConfig, devices: BlockDevices = None) -> dict:
+    """
+    Get disk stats of the data directory's devices on the remote host: counters of the top device and every leaf
+    device, and the sum of the leaves (the physical I/O) as `aggregate`.
+    """
+    devices = devices or remote_data_devices(conn, case)
+    names = list(dict.fromkeys([devices.top, *devices.leaves]))
+    lines = conn.run(' '.join(['cat', *(f'/sys/class/block/{d}/stat' for d in names)]), hide=True).stdout.splitlines()
+    per_dev = {d: {a: int(b) for a, b in zip(SYSBLOCKSTAT_COLS, line.split())} for d, line in zip(names, lines)}
+
+    return {
+        'aggregate': {c: sum(per_dev[d].get(c, 0) for d in devices.leaves) for c in SYSBLOCKSTAT_COLS},
+        'devices': per_dev,
+    }
+
+
+@dataclass
+class RemoteBlkTrace:
+    """A block I/O trace running on a remote host, see `start_remote_blktrace`"""
+    instance_dir: Path
+    out_file: str
+    part_start: int  # sectors
+    part_sectors: int
+
+
+def _write_tracefs(conn: fabric.Connection, file: Path, value):
+    conn.run(f"echo '{value}' | sudo tee {file}", hide=True)
+
 
-    return {a: b for a, b in zip(SYSBLOCKSTAT_COLS, res)}
+def start_remote_blktrace(conn: fabric.Connection, case: DbConfig) -> RemoteBlkTrace:
+    """
+    Start tracing block requests to the data device on the remote host using a dedicated ftrace instance.
+    Events are streamed from the trace pipe to a file on the remote host until `stop_remote_blktrace`.
+    """
+    devices = remote_data_devices(conn, case)
+    if len(devices.leaves) > 1:
+        print(f'WARNING: data is on several devices ({", ".join(devices.leaves)}), only tracing {devices.leaves[0]}')
+    disk, part = devices.disks[0], devices.leaves[0]
+
+    # the tracepoints report the whole disk and sector numbers relative to it
+    major, minor = remote_block_dev(conn, disk)
+    part_sectors = int(conn.run(f'cat /sys/class/block/{part}/size', hide=True).stdout)
+    part_start = int(conn.run(f'cat /sys/class/block/{part}/start', hide=True).stdout) if part != disk else 0
+
+    inst = TRACEFS_ROOT / 'instances' / BLKTRACE_FTRACE_INSTANCE
+    out_file = f'/tmp/{BLKTRACE_FTRACE_INSTANCE}.txt'
+    conn.run(f'sudo mkdir -p {inst}', hide=True)
+    _write_tracefs(conn, inst / 'tracing_on', 0)
+    _write_tracefs(conn, inst / 'buffer_size_kb', BLKTRACE_BUFFER_KB)
+    for event in ['block_rq_issue', 'block_rq_complete']:
+        # filter uses the kernel's internal dev_t encoding
+        _write_tracefs(conn, inst / 'events' / 'block' / event / 'filter', f'dev == {(major << 20) | minor}')
+        _write_tracefs(conn, inst / 'events' / 'block' / event / 'enable', 1)
+    _write_tracefs(conn, inst / 'trace', '')  # clear anything left over
+
+    conn.run(f"sudo sh -c 'cat {inst / 'trace_pipe'} > {out_file}' > /dev/null 2>&1 &", hide=True)
+    _write_tracefs(conn, inst / 'tracing_on', 1)
+
+    return RemoteBlkTrace(instance_dir=inst, out_file=out_file, part_start=part_start, part_sectors=part_sectors)
+
+
+def stop_remote_blktrace(conn: fabric.Connection, trace: RemoteBlkTrace, out: Path):
+    """Stop a trace from `start_remote_blktrace`, copy it to this host and convert it to the binary format at `out`."""
+    inst = trace.instance_dir
+    _write_tracefs(conn, inst / 'tracing_on', 0)
+    time.sleep(1)  # let the reader drain what is left in the buffer
+    conn.run(f"sudo pkill -f '{inst / 'trace_pipe'}'", hide=True, warn=True)
+
+    overrun = conn.run(f"sudo sh -c 'cat {inst}/per_cpu/cpu*/stats' | awk '/^overrun/ {{s += $2}} END {{print s + 0}}'",
+                       hide=True).stdout.strip()
+    if int(overrun) > 0:
+        print(f'WARNING: {overrun} block trace events were dropped! Consider increasing BLKTRACE_BUFFER_KB')
+
+    for event in ['block_rq_issue', 'block_rq_complete']:
+        _write_tracefs(conn, inst / 'events' / 'block' / event / 'enable', 0)
+    conn.run(f'sudo rmdir {inst}', hide=True, warn=True)
+
+    local_raw = BUILD_ROOT / f'{BLKTRACE_FTRACE_INSTANCE}_{conn.host}.txt'
+    conn.get(trace.out_file, str(local_raw))
+    conn.run(f'sudo rm -f {trace.out_file}', hide=True)
+
+    convert_ftrace(local_raw, out, trace.part_start, trace.part_sectors)
+    os.remove(local_raw)
+
+
+def start_remote_telemetry(conn: fabric.Connection, interval_s: float, cgroup: Optional[CGroupConfig]):
+    """Start the telemetry agent (`lib/telemetry.py`) on the remote host, running until `stop_remote_telemetry`."""
+    conn.put(str(Path(__file__).parent / 'telemetry.py'), TELEMETRY_REMOTE_AGENT)
+    cgroup_arg = f'--cgroup {cgroup.name}' if cgroup is not None else ''
+    conn.run(f'nohup python3 {TELEMETRY_REMOTE_AGENT} --out {TELEMETRY_REMOTE_OUT} --interval {interval_s} '
+             f'{cgroup_arg} > /dev/null 2>&1 & echo $! > {TELEMETRY_REMOTE_PID}', hide=True)
+
+
+def mark_remote_telemetry(conn: fabric.Connection, bench: bool):
+    """Mark the start (`bench`) or end of the benchmark in the telemetry, which its summaries are limited to."""
+    sig = 'USR1' if bench else 'USR2'
+    conn.run(f'kill -{sig} $(cat {TELEMETRY_REMOTE_PID})', hide=True, warn=True)
+
+
+def stop_remote_telemetry(conn: fabric.Connection, out: Path):
+    """Stop the telemetry agent, wait for it to take its last sample and exit, and copy its output to `out`."""
+    pid = f'$(cat {TELEMETRY_REMOTE_PID})'
+    res = conn.run(f'kill -TERM {pid} && timeout {TELEMETRY_STOP_TIMEOUT_S} '
+                   f'sh -c "while kill -0 {pid} 2>/dev/null; do sleep 0.1; done"', hide=True, warn=True)
+    if res.exited == 124:
+        print(f'WARNING: the telemetry agent on {conn.host} did not exit within {TELEMETRY_STOP_TIMEOUT_S} s')
+    try:
+        conn.get(TELEMETRY_REMOTE_OUT, str(out))
+    except FileNotFoundError:
+        print(f'WARNING: no telemetry from {conn.host}, is python3 installed there?')
+    conn.run(f'rm -f {TELEMETRY_REMOTE_OUT} {TELEMETRY_REMOTE_AGENT} {TELEMETRY_REMOTE_PID}', hide=True)
+
+
+def storage_profile_file(db_host: str) -> Path:
+    return STORAGE_PROFILES_DIR / f'{db_host}.json'
+
+
+def characterize_remote_storage(db_host: str, data_root: Path, file_gb: float, duration_s: float):
+    """
+    Measure direct I/O read throughput and latency of the device under `data_root` on the database host with
+    `lib/storage.py` and save the profile to `storage_profile_file(db_host)`. Postgres should not be running.
+    """
+    out = storage_profile_file(db_host)
+    os.makedirs(out.parent, exist_ok=True)
+    with FabConnection(db_host) as conn:
+        conn.put(str(Path(__file__).parent / 'storage.py'), STORAGE_REMOTE_SCRIPT)
+        try:
+            conn.run(f'python3 {STORAGE_REMOTE_SCRIPT} --dir {data_root} --out {STORAGE_REMOTE_OUT} '
+                     f'--file-gb {file_gb} --duration {duration_s}')
+            conn.get(STORAGE_REMOTE_OUT, str(out))
+        finally:
+            conn.run(f'rm -f {STORAGE_REMOTE_OUT} {STORAGE_REMOTE_SCRIPT}', hide=True)
+    print(f'Saved storage profile of {db_host} to {out}')
 
 
 def prewarm_lineitem(data: DbData, dbhost: str):
@@ -768,11 +1415,57 @@ def prewarm_lineitem(data: DbData, dbhost: str):
         conn.execute('''select pg_prewarm('lineitem');''')
 
 
-def clear_pg_stats(data: DbData, dbhost: str):
-    """Clear IO statistics for the given database config (DB must be running))"""
+def clear_pg_stats(data: DbData, dbhost: str, statements=False):
+    """Clear IO statistics for the given database config, and pg_stat_statements if enabled (DB must be running))"""
     with pg.open(data.conn_str(dbhost)) as conn:
         conn: PgConnection
         conn.execute('SELECT pg_stat_reset();')
+        if statements:
+            conn.execute('CREATE EXTENSION IF NOT EXISTS pg_stat_statements;')
+            conn.execute('SELECT pg_stat_statements_reset();')
+
+
+def save_pg_statements(data: DbData, dbhost: str, out_file: Path):
+    """Save per-statement statistics of the database from pg_stat_statements to a csv (DB must be running)"""
+    with pg.open(data.conn_str(dbhost)) as conn:
+        conn: PgConnection
+        stmt = conn.prepare(f'''
+            SELECT {', '.join(PG_STATEMENTS_COLS)} FROM pg_stat_statements
+            WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+            ORDER BY total_exec_time DESC;''')
+        rows = stmt()
+
+    with open(out_file, 'w') as f:
+        w = csv.writer(f)
+        w.writerow(PG_STATEMENTS_COLS)
+        w.writerows(rows)
+
+
+def relation_file_paths(data: DbData, dbhost: str) -> Dict[str, str]:
+    """Files of user tables and indexes relative to the data directory, by relation name (DB must be running)"""
+    with pg.open(data.conn_str(dbhost)) as conn:
+        conn: PgConnection
+        rows = conn.prepare('''
+            SELECT c.relname, pg_relation_filepath(c.oid) FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relkind IN ('r', 'i', 'm') AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+                AND n.nspname NOT LIKE 'pg_toast%';''')()
+    return {name: path for name, path in rows if path is not None}
+
+
+def capture_remote_pagecache(conn: fabric.Connection, data: DbData, dbhost: str) -> dict:
+    """Page cache residency of every relation of the database, with `lib/pagecache.py` on the remote host"""
+    relations = relation_file_paths(data, dbhost)
+    conn.put(str(Path(__file__).parent / 'pagecache.py'), PAGECACHE_REMOTE_SCRIPT)
+    conn.put(io.BytesIO(json.dumps(relations).encode()), PAGECACHE_REMOTE_RELATIONS)
+    try:
+        conn.run(f'python3 {PAGECACHE_REMOTE_SCRIPT} --data-dir {data.data_path} '
+                 f'--relations {PAGECACHE_REMOTE_RELATIONS} --out {PAGECACHE_REMOTE_OUT}', hide=True)
+        out = io.BytesIO()
+        conn.get(PAGECACHE_REMOTE_OUT, out)
+    finally:
+        conn.run(f'rm -f {PAGECACHE_REMOTE_SCRIPT} {PAGECACHE_REMOTE_RELATIONS} {PAGECACHE_REMOTE_OUT}', hide=True)
+    return json.loads(out.getvalue())
 
 
 def create_bbase_config(sf: int, bb_config: BBaseConfig, out, host):
@@ -807,10 +1500,7 @@ def create_bbase_config(sf: int, bb_config: BBaseConfig, out, host):
     for elem in works:
         works.remove(elem)
 
-    work = ET.SubElement(works, 'work')
-
-    ET.SubElement(work, 'serial').text = 'false'
-    bb_config.workload.write_bbase_config(work)
+    bb_config.workload.write_bbase_works(works)
 
     tree.write(out)
 
@@ -831,15 +1521,189 @@ def run_bbase_load(b: str, config: Path, create=False):
     ], cwd=BENCHBASE_INSTALL_PATH / 'benchbase-postgres').wait()
 
 
-def run_bbase_test(exp: ExperimentConfig):
+def run_python_driver(exp: ExperimentConfig):
+    """Run the workload with the in-process load driver instead of benchbase, writing results in the same format."""
+    bbconf = exp.bbconf
+    wl = bbconf.workload
+    names = read_transaction_types(wl.workload.base_config_file)
+    conn_str = exp.dbconf.data.conn_str(exp.db_host)
+
+    if wl.selectivity is not None:
+        print(f'WARNING: selectivity={wl.selectivity} is ignored by the python load driver')
+
+    if isinstance(wl, WeightedWorkloadConfig):
+        weights = parse_weights(wl.weights)
+        queries = load_queries(wl.workload.name, names, [w > 0 for w in weights])
+        driver = LoadDriver(conn_str, queries, bbconf.nworkers, bbconf.seed, weights=weights, time_s=wl.time_s,
+                            warmup_s=wl.warmup_s, rate=wl.rate, arrival=wl.arrival, stop_precision=wl.stop_precision)
+    elif isinstance(wl, CountedWorkloadConfig):
+        counts = [c * wl.count_multiplier for c in wl.counts]
+        queries = load_queries(wl.workload.name, names, [c > 0 for c in counts])
+        driver = LoadDriver(conn_str, queries, bbconf.nworkers, bbconf.seed, counts=counts, randomized=wl.randomized)
+    else:
+        raise Exception(f'Unsupported workload type for the python load driver: {type(wl)}')
+
+    driver.run()
+    driver.write_results(exp.results_bbase_subdir, names)
+    with pg.open(conn_str) as conn:
+        write_pg_metrics(conn, exp.results_bbase_subdir / 'metrics.json')
+
+
+def run_pgbench(exp: ExperimentConfig):
+    """Run a pgbench workload from this host, writing results in the same format as benchbase."""
+    wl: PgbenchWorkloadConfig = exp.bbconf.workload
+    out_dir = exp.results_bbase_subdir
+    os.makedirs(out_dir, exist_ok=True)
+
+    subprocess.run([
+        *exp.client_command,
+        str(exp.dbconf.bin.install_path / 'bin' / 'pgbench'),
+        '--host', exp.db_host, '--port', PG_PORT, '--username', PG_USER,
+        '--client', str(exp.bbconf.nworkers),
+        f'--random-seed={exp.bbconf.seed}',
+        '--no-vacuum',  # the data directory is restored before every test
+        '--log', f'--log-prefix={PGBENCH_LOG_PREFIX}',
+        *wl.pgbench_args(),
+        exp.dbconf.data.db_name,
+    ], cwd=out_dir, check=True)
+
+    write_pgbench_results(out_dir, wl.script_names)
+    with pg.open(exp.dbconf.data.conn_str(exp.db_host)) as conn:
+        write_pg_metrics(conn, out_dir / 'metrics.json')
+
+
+def run_bbase_clients(exp: ExperimentConfig):
+    """
+    Run benchbase on every client host of the experiment with its share of the terminals, all starting at the same
+    time, then merge their results into the results directory as if they came from one benchbase.
+    """
+    bbconf = exp.bbconf
+    hosts = bbconf.client_hosts
+    bb_workload_name = bbconf.workload.workload.name.lower()
+    clients_dir = exp.results_bbase_subdir / BBASE_CLIENTS_DIR
+    start_at = time.time() + CLIENT_START_DELAY_S
+
+    def run_client(i: int, host: str, share: BBaseConfig) -> Path:
+        client_dir = clients_dir / f'{i}_{host}'
+        os.makedirs(client_dir, exist_ok=True)
+        local_config = BUILD_ROOT / f'bbase_{bb_workload_name}_{exp.db_host}_client{i}_config.xml'
+        create_bbase_config(exp.dbconf.sf, share, local_config, host=exp.db_host)
+
+        remote_dir = f'{CLIENT_REMOTE_ROOT}_{i}'
+        with FabConnection(host) as conn:
+            conn.run(f'rm -rf {remote_dir} && mkdir -p {remote_dir}/results', hide=True)
+            conn.put(str(local_config), f'{remote_dir}/config.xml')
+            # wait for the common start time, so all clients run in lock-step
+            conn.run(f'python3 -c "import time; time.sleep(max(0, {start_at} - time.time()))" && '
+                     f'cd {BENCHBASE_INSTALL_PATH / "benchbase-postgres"} && '
+                     f'{" ".join(exp.client_command)} java -jar benchbase.jar -b {bb_workload_name} '
+                     f'-c {remote_dir}/config.xml --execute=true -s {BBASE_SAMPLE_WINDOW_S} -d {remote_dir}/results',
+                     hide=i > 0)
+            for f in conn.run(f'ls {remote_dir}/results', hide=True).stdout.split():
+                conn.get(f'{remote_dir}/results/{f}', str(client_dir / f))
+            conn.run(f'rm -rf {remote_dir}', hide=True)
+        os.remove(local_config)
+        rename_bbase_results(client_dir)
+        return client_dir
+
+    shares = bbconf.client_shares()
+    print(f'Running benchbase on {len(hosts)} clients: '
+          + ', '.join(f'{h} ({s.nworkers} terminals)' for h, s in zip(hosts, shares)))
+    with ThreadPoolExecutor(len(hosts)) as pool:
+        client_dirs = list(pool.map(run_client, range(len(hosts)), hosts, shares))
+
+    merge_client_results(exp, client_dirs, shares)
+
+
+def merge_client_results(exp: ExperimentConfig, client_dirs: List[Path], shares: List[BBaseConfig]):
+    """
+    Merge the benchbase results of each client into the results directory: raw results (with worker ids offset so
+    they stay unique) and stream times are concatenated, throughput is the sum of the clients' and the latency
+    distribution is recomputed from all transactions. `metrics.json` is read from postgres again after all clients are
+    done, since the statistics are for the whole database.
+    """
+    out_dir = exp.results_bbase_subdir
+    rows = []
+    stream_times = []
+    summaries = []
+    worker_offset = 0
+    for client_dir, share in zip(client_dirs, shares):
+        raw = read_raw_results(client_dir / RAW_RESULTS_FILE)
+        rows += zip((raw.txn - 1).tolist(), [raw.names[t] for t in raw.txn.tolist()], (raw.start_s * 10**6).tolist(),
+                    raw.latency_us.tolist(), (raw.worker + worker_offset).tolist(), raw.phase.tolist())
+        worker_offset += share.nworkers
+
+        with open(client_dir / 'summary.json', 'r') as f:
+            summaries.append(json.load(f))
+        if (client_dir / 'stream_times.json').exists():
+            with open(client_dir / 'stream_times.json', 'r') as f:
+                stream_times += json.load(f)
+
+    rows.sort(key=lambda r: r[2])
+    write_raw_csv(out_dir / RAW_RESULTS_FILE, rows)
+    if stream_times:
+        with open(out_dir / 'stream_times.json', 'w') as f:
+            f.write(json.JSONEncoder().encode(stream_times))
+
+    runtime_ns = max(s['Benchmark Runtime (nanoseconds)'] for s in summaries)
+    summary = {
+        **summaries[0],
+        **summary_map(np.array([r[3] for r in rows], dtype=np.int64), runtime_ns, driver='benchbase'),
+        'Throughput (requests/second)': sum(s['Throughput (requests/second)'] for s in summaries),
+        'Goodput (requests/second)': sum(s['Goodput (requests/second)'] for s in summaries),
+        'Clients': exp.bbconf.client_hosts,
+    }
+    with open(out_dir / 'summary.json', 'w') as f:
+        f.write(json.JSONEncoder(indent=2).encode(summary))
+
+    with pg.open(exp.dbconf.data.conn_str(exp.db_host)) as conn:
+        write_pg_metrics(conn, out_dir / 'metrics.json')
+
+
+def watch_bbase(exp: ExperimentConfig, bbase: subprocess.Popen):
+    """
+    Stream the output of benchbase until it exits, checking the experiment's watchdogs every second. If one trips,
+    benchbase is stopped, the results are marked as failed with the reason, and `RunAborted` is raised.
+    """
+    watchdog = RunWatchdog(exp.watchdog or WatchdogConfig(), BBASE_MONITOR_INTERVAL_S)
+    reader = threading.Thread(target=watchdog.feed, args=(bbase.stdout,), name='bbase_output', daemon=True)
+    reader.start()
+    warned = False
+    while True:
+        try:
+            bbase.wait(timeout=1)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+        if not warned and not watchdog.seen_monitor and time.monotonic() - watchdog.start > 120:
+            print('WARNING: no throughput output from benchbase, only the wall time watchdog is enforced')
+            warned = True
+        reason = watchdog.check()
+        if reason is not None:
+            print(f'WARNING: aborting benchbase: {reason}')
+            bbase.terminate()
+            try:
+                bbase.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                bbase.kill()
+                bbase.wait()
+            with open(exp.results_dir / FAILED_FILE, 'w') as f:
+                f.write(json.JSONEncoder(indent=2).encode({'reason': reason, 'time': dt.now().isoformat()}))
+            raise RunAborted(reason)
+    reader.join(timeout=10)
+
+
+def run_bbase_test(exp: ExperimentConfig, timer: PhaseTimer = None):
     """
     Run benchbase (on local machine) against PostgreSQL on the remote host.
     Will start & stop PostgreSQL on the remote host.
+    Time spent in each step is recorded in `timer` if given.
     Returns (disk stats before experiment, disk stats after experiment)
     """
     dbconf = exp.dbconf
     bbconf = exp.bbconf
     pgconf = exp.pgconf
+    timer = timer or PhaseTimer()
 
     workload = bbconf.workload.workload
     db_host = exp.db_host
@@ -850,46 +1714,185 @@ def run_bbase_test(exp: ExperimentConfig):
     assert dbconf.check_consistent(), "Error with the DB configuration!"
     assert workload == dbconf.data.workload, "BB config and DB confid have different workloads!"
 
-    create_bbase_config(dbconf.sf, bbconf, temp_bbase_config, host=db_host)
+    if bbconf.driver == 'benchbase' and not bbconf.client_hosts:
+        create_bbase_config(dbconf.sf, bbconf, temp_bbase_config, host=db_host)
+
+    pagecache = {}
+
+    def capture_pagecache(point: str):
+        if point in exp.capture.pagecache_points:
+            with FabConnection(db_host) as pc_conn, timer.phase('pagecache'):
+                pagecache[point] = capture_remote_pagecache(pc_conn, dbconf.data, db_host)
 
     with FabConnection(db_host) as conn:
-        config_remote_postgres(conn, dbconf, pgconf, db_host)
-        start_remote_postgres(conn, dbconf, cgroup=exp.cgroup)
-        # empty the buffer cache on remote host
-        conn.run('echo 1 | sudo tee /proc/sys/vm/drop_caches', hide=True)
+        with timer.phase('config_postgres'):
+            config_remote_postgres(conn, dbconf, pgconf, db_host)
+            set_remote_device_latency(conn, dbconf, exp.device)
+            os_previous = apply_remote_os_tuning(conn, dbconf, exp.os_tuning)
+        try:
+            with timer.phase('start_postgres'):
+                start_remote_postgres(conn, dbconf, cgroup=exp.cgroup, affinity=exp.affinity)
+            # empty the buffer cache on remote host
+            with timer.phase('drop_caches'):
+                conn.run('echo 1 | sudo tee /proc/sys/vm/drop_caches', hide=True)
+        except BaseException:
+            restore_remote_os_tuning(conn, os_previous)
+            raise
 
     try:
+        if exp.capture.telemetry_interval_s:
+            with FabConnection(db_host) as conn:
+                start_remote_telemetry(conn, exp.capture.telemetry_interval_s, exp.cgroup)
+        capture_pagecache('start')
+
         # prewarm lineitem table if desired (TPCH only)
         if bbconf.prewarm and workload.is_tpch():
             print(f'Pre-warming cache for lineitem table...')
-            prewarm_lineitem(dbconf.data, db_host)
+            with timer.phase('prewarm'):
+                prewarm_lineitem(dbconf.data, db_host)
 
         # Clear statistics on remote postgres
-        clear_pg_stats(dbconf.data, db_host)
+        with timer.phase('clear_stats'):
+            clear_pg_stats(dbconf.data, db_host, statements=pgconf.track_statements)
+        capture_pagecache('before_run')
 
-        # get iostats! (/sys/blocks/sdb/stat in this case)
+        # get iostats! (/sys/class/block/<dev>/stat of the devices under the data directory)
         with FabConnection(db_host) as conn:
-            pre_stats = get_remote_disk_stats(conn, dbconf)
+            devices = remote_data_devices(conn, dbconf)
+            pre_stats = get_remote_disk_stats(conn, dbconf, devices)
+            blktrace = start_remote_blktrace(conn, dbconf) if exp.capture.blktrace else None
+            if exp.capture.telemetry_interval_s:
+                mark_remote_telemetry(conn, bench=True)
+
+        waits = None
+        if exp.capture.wait_events_hz:
+            waits = WaitEventSampler(dbconf.data.conn_str(db_host), exp.capture.wait_events_hz)
+            waits.start()
 
         # Run benchbase
-        subprocess.Popen([
-            'java',
-            '-jar', str(BENCHBASE_INSTALL_PATH / 'benchbase-postgres' / 'benchbase.jar'),
-            '-b', bb_workload_name,
-            '-c', str(temp_bbase_config),
-            '--execute=true',
-            '-d', str(exp.results_bbase_subdir),
-        ], cwd=BENCHBASE_INSTALL_PATH / 'benchbase-postgres').wait()
+        try:
+            with timer.phase('benchbase'):
+                if bbconf.driver == 'python':
+                    run_python_driver(exp)
+                elif bbconf.driver == 'pgbench':
+                    run_pgbench(exp)
+                elif bbconf.client_hosts:
+                    if exp.capture.client_interval_s:
+                        print(f'WARNING: benchbase on the client hosts is not sampled, so there is no {CLIENT_STATS_FILE} '
+                              f'and client saturation is not detected for this run')
+                    run_bbase_clients(exp)
+                else:
+                    bbase = subprocess.Popen([
+                        *exp.client_command,
+                        'java',
+                        '-jar', str(BENCHBASE_INSTALL_PATH / 'benchbase-postgres' / 'benchbase.jar'),
+                        '-b', bb_workload_name,
+                        '-c', str(temp_bbase_config),
+                        '--execute=true',
+                        '-s', str(BBASE_SAMPLE_WINDOW_S),
+                        '-im', str(BBASE_MONITOR_INTERVAL_S * 1000),
+                        '-d', str(exp.results_bbase_subdir),
+                    ], cwd=BENCHBASE_INSTALL_PATH / 'benchbase-postgres', stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT, text=True, bufsize=1)
+                    client = None
+                    if exp.capture.client_interval_s:
+                        client = ClientSampler(bbase.pid, exp.capture.client_interval_s)
+                        client.start()
+                    try:
+                        watch_bbase(exp, bbase)
+                    finally:
+                        # always stop the sampler (and its jstat), but only keep the samples of a complete run
+                        if client is not None:
+                            client.stop()
+                    if client is not None:
+                        client.write(exp.results_dir / CLIENT_STATS_FILE)
+                        if client_stats(exp.results_dir / CLIENT_STATS_FILE).get('client_saturated'):
+                            print(f'WARNING: the benchbase client was saturated (CPU or GC), results may be limited '
+                                  f'by the client rather than the database!')
+        finally:
+            if waits is not None:
+                waits.stop()
+                waits.write(exp.results_dir / WAIT_EVENTS_FILE)
+            if blktrace is not None:
+                with FabConnection(db_host) as conn, timer.phase('blktrace'):
+                    stop_remote_blktrace(conn, blktrace, exp.results_dir / BLKTRACE_FILE)
 
         # get & return iostats after the test
         with FabConnection(db_host) as conn:
-            post_stats = get_remote_disk_stats(conn, dbconf)
+            if exp.capture.telemetry_interval_s:
+                mark_remote_telemetry(conn, bench=False)
+            post_stats = get_remote_disk_stats(conn, dbconf, devices)
+        capture_pagecache('after_run')
+        if pagecache:
+            with open(exp.results_dir / PAGECACHE_FILE, 'w') as f:
+                f.write(json.JSONEncoder().encode(pagecache))
+
+        if pgconf.track_statements:
+            save_pg_statements(dbconf.data, db_host, exp.results_dir / STATEMENTS_FILE)
 
         return pre_stats, post_stats
 
     finally:
         with FabConnection(db_host) as conn:
-            stop_remote_postgres(conn, dbconf, immediate=not workload.is_tpch())
+            with timer.phase('stop_postgres'):
+                stop_remote_postgres(conn, dbconf, immediate=not workload.is_tpch())
+            if exp.capture.telemetry_interval_s:
+                stop_remote_telemetry(conn, exp.results_dir / TELEMETRY_FILE)
+            restore_remote_os_tuning(conn, os_previous)
+
+
+def explain_analyze(conn: PgConnection, sql: str):
+    """Run a query with EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) and return the plan."""
+    sql = re.sub(r'--.*$', '', sql, flags=re.MULTILINE).strip().rstrip(';')
+    plan = conn.prepare(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}').first()
+    return json.loads(plan) if isinstance(plan, str) else plan
+
+
+def capture_plans(exp: ExperimentConfig, timer: PhaseTimer = None):
+    """
+    Capture the plan of every query of the workload (`ddl/<workload>/<transaction name>.sql`) to `PLANS_DIR` in the
+    results, instead of running a benchmark. Postgres is restarted and the OS cache dropped before each query so the
+    'cold' run starts with empty caches, then the query is run again 'warm'.
+    """
+    dbconf = exp.dbconf
+    db_host = exp.db_host
+    timer = timer or PhaseTimer()
+    workload = exp.bbconf.workload.workload
+
+    names = read_transaction_types(workload.base_config_file)
+    queries = load_queries(workload.name, names,
+                           [(DRIVER_SQL_ROOT / workload.name / f'{n}.sql').exists() for n in names])
+    out_dir = exp.results_dir / PLANS_DIR
+    os.makedirs(out_dir, exist_ok=True)
+
+    with FabConnection(db_host) as conn, timer.phase('config_postgres'):
+        config_remote_postgres(conn, dbconf, exp.pgconf, db_host)
+        set_remote_device_latency(conn, dbconf, exp.device)
+        os_previous = apply_remote_os_tuning(conn, dbconf, exp.os_tuning)
+
+    try:
+        for name, sql in zip(names, queries):
+            if sql is None:
+                continue
+            print(f'Capturing plans for {name}...')
+            with FabConnection(db_host) as conn:
+                with timer.phase('start_postgres'):
+                    start_remote_postgres(conn, dbconf, cgroup=exp.cgroup, affinity=exp.affinity)
+                with timer.phase('drop_caches'):
+                    conn.run('echo 1 | sudo tee /proc/sys/vm/drop_caches', hide=True)
+
+            try:
+                with pg.open(dbconf.data.conn_str(db_host)) as pgconn, timer.phase('explain'):
+                    for run in PLAN_RUNS:
+                        plan = explain_analyze(pgconn, sql)
+                        with open(out_dir / plan_file_name(name, run), 'w') as f:
+                            f.write(json.JSONEncoder(indent=2).encode(plan))
+            finally:
+                with FabConnection(db_host) as conn, timer.phase('stop_postgres'):
+                    stop_remote_postgres(conn, dbconf, immediate=not workload.is_tpch())
+    finally:
+        with FabConnection(db_host) as conn:
+            restore_remote_os_tuning(conn, os_previous)
 
 
 def pg_exec_file(conn: PgConnection, file):
@@ -950,9 +1953,22 @@ def create_and_populate_tpch_local(case: DbConfig):
         pg_stop_db(cl)
 
 
-def tpcc_src_data_dir(case: DbConfig) -> Path:
-    """Name of directory to copy TPCC data so we can copy it instead of re-generating every time."""
-    return case.data.data_root / f'src_tpcc_sf{case.sf}_blksz{case.block_size}'
+def src_data_dir(case: DbConfig) -> Path:
+    """
+    Name of directory to copy data to for workloads which modify the database (TPCC, pgbench), so we can copy it back
+    before each test instead of re-generating every time.
+    """
+    return case.data.data_root / f'src_{case.data.workload.name.lower()}_sf{case.sf}_blksz{case.block_size}'
+
+
+def move_to_src_data_dir(case: DbConfig):
+    """Move a newly loaded (and stopped) database cluster to `src_data_dir` to be restored for each test."""
+    data_dir = case.data.data_path
+    alt_dir = src_data_dir(case)
+    print(f'Moving {data_dir} to {alt_dir}...')
+
+    shutil.rmtree(alt_dir, ignore_errors=True)
+    shutil.move(data_dir, alt_dir)
 
 
 def create_and_populate_tpcc_local(case: DbConfig):
@@ -991,19 +2007,50 @@ def create_and_populate_tpcc_local(case: DbConfig):
 
     # Rename the database file. TPCC modifies the database, so we need a way to
     # reset at the start of each test.
-    alt_dir = tpcc_src_data_dir(case)
-    print(f'Moving {cl.data_directory} to {alt_dir}...')
+    move_to_src_data_dir(case)
 
-    shutil.rmtree(alt_dir, ignore_errors=True)
-    shutil.move(cl.data_directory, alt_dir)
 
+def create_and_populate_pgbench_local(case: DbConfig):
+    """
+    Initialize a database with pgbench tables for the given test case, using pgbench from the same installation.
+    Note: we only need to initialize for the base branch since each branch can use the same data dir
+    """
+    db_name = case.data.db_name
+    conn_str = f'pq://localhost/{db_name}'
+
+    cl = pg_get_cluster(case)
 
-def tpcc_restore_data_dir(case: DbConfig):
-    """Copy the TPCC data directory back into place on the remote host."""
+    print(f'(Re-)Initializing database cluster at {cl.data_directory}...')
+    shutil.rmtree(cl.data_directory, ignore_errors=True)
+    pg_init_local_db(cl)
+
+    print(f'Starting cluster for pgbench load {db_name}')
+    pg_start_db(cl)
+    try:
+        subprocess.run([case.bin.install_path / 'bin' / 'createdb', db_name])
+
+        print(f'pgbench: loading test data...')
+        subprocess.run([case.bin.install_path / 'bin' / 'pgbench', '--initialize', '--scale', str(case.sf), '--quiet',
+                        db_name], check=True)
+
+        # pgbench already vacuums and analyzes the tables, CHECKPOINT to clear out the WAL
+        with pg.open(conn_str) as conn:
+            conn.execute('CHECKPOINT;')
+
+    finally:
+        print(f'Shutting down database cluster {cl.data_directory}...')
+        pg_stop_db(cl)
+
+    # pgbench modifies the database too, keep a copy to reset at the start of each test.
+    move_to_src_data_dir(case)
+
+
+def restore_data_dir(case: DbConfig):
+    """Copy the data directory back into place on the remote host, for workloads which modify the database."""
     data_dir = case.data.data_path
-    src_dir = tpcc_src_data_dir(case)
+    src_dir = src_data_dir(case)
 
-    print(f'Restoring TPCC database files: copying {src_dir} to {data_dir}...')
+    print(f'Restoring {case.data.workload.name.upper()} database files: copying {src_dir} to {data_dir}...')
     with FabConnection(case.data.workload.default_db_host) as fabconn:
         fabconn.run(f'rm --recursive --force {data_dir}')  # --force to ignore error if it is already not there
         fabconn.run(f'cp --recursive {src_dir} {data_dir}')
@@ -1234,6 +2281,56 @@ def gen_data_tpcc(sf: int, blk_sz: int):
     create_and_populate_tpcc_local(dbconf)
 
 
+def gen_data_pgbench(sf: int, blk_sz: int):
+    if sf is None:
+        raise Exception(f'Must specify scale factor when loading data!')
+
+    # Generate test data (only base branch is needed for generating data)
+    print('--------------------------------------------------------------------------------')
+    print(f'---- Initializing pgbench data for blk_sz={blk_sz}, sf={sf}')
+    print('--------------------------------------------------------------------------------')
+    dbbin = DbBin(BRANCH_POSTGRES_BASE, block_size=blk_sz)
+    dbdata = DbData(PGBENCH, sf=sf, block_size=blk_sz)
+    dbconf = DbConfig(dbbin, dbdata)
+    create_and_populate_pgbench_local(dbconf)
+
+
+def emul_device_setup(size_gb: int, latency_ms: float = 0):
+    """
+    Create the emulated device on this host: a loop device over a file, under a dm-delay device, with an ext4
+    filesystem mounted at `EMUL_MOUNT`. Data can then be generated with `data_root` under it (see `LOCAL_HOST_ARGS`).
+    """
+    def run(cmd: str) -> str:
+        return subprocess.run(cmd, shell=True, check=True, capture_output=True, text=True).stdout.strip()
+
+    if Path(f'/dev/mapper/{EMUL_DM_NAME}').exists():
+        raise Exception(f'Emulated device {EMUL_DM_NAME} already exists, run emul_teardown first')
+
+    run(f'sudo truncate --size={size_gb}G {EMUL_BACKING_FILE}')
+    loop = run(f'sudo losetup --find --show --direct-io=on {EMUL_BACKING_FILE}')
+    sectors = run(f'sudo blockdev --getsz {loop}')
+    run(f"sudo dmsetup create {EMUL_DM_NAME} --table '0 {sectors} delay {loop} 0 {latency_ms:g}'")
+    run(f'sudo mkfs.ext4 -q /dev/mapper/{EMUL_DM_NAME}')
+    run(f'sudo mkdir -p {EMUL_MOUNT}')
+    run(f'sudo mount /dev/mapper/{EMUL_DM_NAME} {EMUL_MOUNT}')
+    run(f'sudo mkdir -p {EMUL_MOUNT / "pgdata"}')
+    run(f'sudo chown -R {PG_USER}: {EMUL_MOUNT}')
+
+    dm_dev = Path(os.path.realpath(f'/dev/mapper/{EMUL_DM_NAME}')).name
+    print(f'Emulated device {dm_dev} ({loop}, {size_gb} GB) mounted at {EMUL_MOUNT}')
+
+
+def emul_device_teardown():
+    """Unmount and remove the emulated device and its backing file (including any data on it!)"""
+    subprocess.run(f'sudo umount {EMUL_MOUNT}', shell=True)
+    loop = subprocess.run(f'sudo losetup --associated {EMUL_BACKING_FILE}', shell=True, capture_output=True,
+                          text=True).stdout.split(':')[0]
+    subprocess.run(f'sudo dmsetup remove {EMUL_DM_NAME}', shell=True)
+    if loop:
+        subprocess.run(f'sudo losetup --detach {loop}', shell=True)
+    subprocess.run(f'sudo rm -f {EMUL_BACKING_FILE}', shell=True)
+
+
 def drop_all_indexes_tpch(sf: int, blk_sz: int, db_host: str):
     """Drop all indexes and constraints. More powerful cleanup function if something goes really wrong."""
     if sf is None:
@@ -1319,39 +2416,115 @@ def reindex(args):
     setup_indexes_cluster_tpch(dbconf=conf, db_host=host, prev=prev_setup, new=new_setup)
 
 
-def run_experiment(experiment: str, exp_config: ExperimentConfig):
-    dbconf = exp_config.dbconf
-    bbconf = exp_config.bbconf
-    pgconf = exp_config.pgconf
-    dbsetup = exp_config.dbsetup
+def experiment_db_setup(exp_config: ExperimentConfig) -> Tuple[Optional[DbSetup], DbSetup]:
+    """Previous and desired indexes & clustering of the database. (TPCH only, otherwise the previous setup is `None`)"""
+    # Check current status of indexes & clustering in the database
+    if exp_config.bbconf.workload.workload.is_tpch():
+        prev_setup: DbSetup = get_last_config(exp_config.dbconf.to_config_key(exp_config.db_host))
+        return prev_setup, exp_config.dbsetup.update_with_old(prev_setup)
+    return None, exp_config.dbsetup
 
-    sf = dbconf.sf
-    blk_sz = dbconf.block_size
-    is_tpch = bbconf.workload.workload.is_tpch()
 
-    # Check current status of indexes & clustering in the database
-    if is_tpch:
-        prev_setup: DbSetup = get_last_config(dbconf.to_config_key(exp_config.db_host))
-        dbsetup = dbsetup.update_with_old(prev_setup)
-        dbsetup_dict = asdict(dbsetup)
-    else:
-        dbsetup_dict = {}
+def write_experiment_config(experiment: str, exp_config: ExperimentConfig, dbsetup: DbSetup):
+    dbconf = exp_config.dbconf
+    dbsetup_dict = asdict(dbsetup) if exp_config.bbconf.workload.workload.is_tpch() else {}
 
     # Write configuration to a file
     with open(exp_config.results_dir / CONFIG_FILE_NAME, 'w') as f:
         config = {
             'experiment': experiment,
+            'db_host': exp_config.db_host,
             # 'work_mem': PG_WORK_MEM,
             **dbconf.to_config_map(),
-            **asdict(pgconf),
-            **bbconf.to_config_map(),
+            **asdict(exp_config.pgconf),
+            **exp_config.bbconf.to_config_map(),
             **dbsetup_dict,
+            **exp_config.capture.to_config_map(),
+            **exp_config.device_config_map(),
         }
         if exp_config.cgroup is not None:
             config.update(exp_config.cgroup.to_config_map())
+        if exp_config.os_tuning is not None:
+            config.update(exp_config.os_tuning.to_config_map())
+        if exp_config.affinity is not None:
+            config.update(exp_config.affinity.to_config_map())
         f.write(json.JSONEncoder(indent=2, sort_keys=True).encode(config))
         f.write('\n')  # ensure trailing newline
 
+
+def prepare_database(exp_config: ExperimentConfig, prev_setup: Optional[DbSetup], dbsetup: DbSetup,
+                     timer: PhaseTimer):
+    """Set up the indexes & clustering (TPCH) or restore a clean copy of the data directory (other workloads)."""
+    results_dir = exp_config.results_dir
+    sf = exp_config.dbconf.sf
+    blk_sz = exp_config.dbconf.block_size
+
+    if exp_config.bbconf.workload.workload.is_tpch():
+        # Make sure we have the desired indexes & clustering if applicable
+        print(f'~~~~~~~~~~ Setup indexes={dbsetup.indexes}, clustering={dbsetup.clustering} for blk_sz={blk_sz}, sf={sf} ~~~~~~~~~~')
+        with timer.phase('setup_indexes_cluster'):
+            constraints, indexes = setup_indexes_cluster_tpch(dbconf=exp_config.dbconf, db_host=exp_config.db_host,
+                                                              prev=prev_setup, new=dbsetup)
+
+        # remember when indexes and constraints are defined in case we want to double check later...
+        with open(results_dir / CONSTRAINTS_FILE, 'w') as f:
+            constraints.to_csv(f, index=False)
+
+        with open(results_dir / INDEXES_FILE, 'w') as f:
+            indexes.to_csv(f, index=False)
+
+        print(f'~~~~~~~~~~ Index and clustering setup done! Running the real tests... ~~~~~~~~~~')
+    else:
+        # for TPCC and pgbench: need to copy the database file!
+        with timer.phase('tpcc_restore_data_dir'):
+            restore_data_dir(exp_config.dbconf)
+
+
+TOPOLOGY_CMDS = {
+    'lscpu': 'lscpu --json',
+    'numa_nodes': 'for n in /sys/devices/system/node/node[0-9]*; do echo "$(basename $n) $(cat $n/cpulist)"; done',
+    'online_cpus': 'cat /sys/devices/system/cpu/online',
+}
+
+
+def host_topology(run: Callable[[str], str]) -> dict:
+    """CPU and NUMA topology of a host, using `run` to run shell commands there and return their output"""
+    topology = {name: run(cmd).strip() for name, cmd in TOPOLOGY_CMDS.items()}
+    try:
+        topology['lscpu'] = json.loads(topology['lscpu'])
+    except json.JSONDecodeError:
+        pass
+    topology['numa_nodes'] = dict(line.split(' ', 1) for line in topology['numa_nodes'].splitlines() if ' ' in line)
+    return topology
+
+
+def write_topology(exp_config: ExperimentConfig):
+    """Record the CPU and NUMA topology of the database host and this host (the client) with the results"""
+    with FabConnection(exp_config.db_host) as conn:
+        db_topology = host_topology(lambda cmd: conn.run(cmd, hide=True, warn=True).stdout)
+    client_topology = host_topology(lambda cmd: subprocess.run(cmd, shell=True, capture_output=True, text=True).stdout)
+
+    with open(exp_config.results_dir / TOPOLOGY_FILE, 'w') as f:
+        f.write(json.JSONEncoder(indent=2).encode({'db_host': db_topology, 'client': client_topology}))
+        f.write('\n')  # ensure trailing newline
+
+
+def write_phase_times(exp_config: ExperimentConfig, timer: PhaseTimer):
+    with open(exp_config.results_dir / PHASE_TIMES_FILE, 'w') as f:
+        f.write(json.JSONEncoder(indent=2).encode(timer.to_json_map()))
+        f.write('\n')  # ensure trailing newline
+
+
+def run_experiment(experiment: str, exp_config: ExperimentConfig):
+    dbconf = exp_config.dbconf
+    bbconf = exp_config.bbconf
+    pgconf = exp_config.pgconf
+
+    is_tpch = bbconf.workload.workload.is_tpch()
+    prev_setup, dbsetup = experiment_db_setup(exp_config)
+    write_experiment_config(experiment, exp_config, dbsetup)
+    write_topology(exp_config)
+
     results_dir = exp_config.results_dir
 
     # Print out summary to the console
@@ -1365,7 +2538,11 @@ def run_experiment(experiment: str, exp_config: ExperimentConfig):
     # print(f'==   Block group size       {dbconf.bg_size} KiB')
     # print(f'==   Workload:              {bbconf.workload.workname}')
     # print(f'==   Worker memory          {PG_WORK_MEM}')
-    print(f'==   Shared memory:         {pgconf.shared_buffers}   ({exp_config.cgroup.mem_gb} GB cgroup)')
+    cgroup_gb = exp_config.cgroup.mem_gb if exp_config.cgroup is not None else None
+    print(f'==   Shared memory:         {pgconf.shared_buffers}   ({cgroup_gb} GB cgroup)')
+    if exp_config.cgroup is not None and exp_config.cgroup.version == 2:
+        cg = exp_config.cgroup
+        print(f'==   Cgroup v2 limits:      memory.high={cg.mem_high_gb} GB, read {cg.io_read_bps} B/s, {cg.io_read_iops} IOPS')
     if is_tpch:
         print(f'==   Index definitions:     ddl/index/{dbsetup.indexes}/')
         print(f'==   Clustering:            ddl/cluster/{dbsetup.clustering}.sql')
@@ -1373,45 +2550,60 @@ def run_experiment(experiment: str, exp_config: ExperimentConfig):
         t = bbconf.workload.time_s
         s = t % 60
         s = '' if s == 0 else f' {s} s'
-        print(f'==   Time:                  {t // 60} min{s}')
-    print(f'==   Terminals:             {bbconf.nworkers}')
+        print(f'==   Time:                  {t // 60} min{s}'
+              + (' per phase' if isinstance(bbconf.workload, RampWorkloadConfig) else ''))
+    if isinstance(bbconf.workload, RampWorkloadConfig):
+        print(f'==   Active terminals:      {", ".join(str(t) for t in bbconf.workload.terminals)}')
+    print(f'==   Terminals:             {bbconf.nworkers}'
+          + (f'   (on {", ".join(bbconf.client_hosts)})' if bbconf.client_hosts else ''))
     print(f'==   PBM num samples:       {pgconf.pbm_evict_num_samples}  (victims={pgconf.pbm_evict_num_victims})')
     print(f'== Storing results to {results_dir}')
     print(f'======================================================================')
 
-    if is_tpch:
-        # Make sure we have the desired indexes & clustering if applicable
-        print(f'~~~~~~~~~~ Setup indexes={dbsetup.indexes}, clustering={dbsetup.clustering} for blk_sz={blk_sz}, sf={sf} ~~~~~~~~~~')
-        constraints, indexes = setup_indexes_cluster_tpch(dbconf=exp_config.dbconf, db_host=exp_config.db_host,
-                                                          prev=prev_setup, new=dbsetup)
-
-        # remember when indexes and constraints are defined in case we want to double check later...
-        with open(results_dir / CONSTRAINTS_FILE, 'w') as f:
-            constraints.to_csv(f, index=False)
-
-        with open(results_dir / INDEXES_FILE, 'w') as f:
-            indexes.to_csv(f, index=False)
+    timer = PhaseTimer()
+    try:
+        prepare_database(exp_config, prev_setup, dbsetup, timer)
+
+        # Actually run the tests
+        pre_stats, post_stats = run_bbase_test(exp_config, timer)
+        if bbconf.driver == 'benchbase' and not bbconf.client_hosts:
+            with timer.phase('rename_results'):
+                rename_bbase_results(exp_config.results_bbase_subdir)
+        # store IO stats in the results
+        with open(exp_config.results_bbase_subdir / IOSTATS_FILE, 'w') as f:
+            iostats = {
+                'before': pre_stats['aggregate'], 'after': post_stats['aggregate'],
+                'devices': {d: {'before': pre_stats['devices'][d], 'after': post_stats['devices'][d]}
+                            for d in pre_stats['devices']},
+            }
+            f.write(json.JSONEncoder(indent=2, sort_keys=True).encode(iostats))
+            f.write('\n')  # ensure trailing newline
 
-        print(f'~~~~~~~~~~ Index and clustering setup done! Running the real tests... ~~~~~~~~~~')
-    else:
-        # for TPCC: need to copy the database file!
-        tpcc_restore_data_dir(dbconf)
-
-    # Actually run the tests
-    pre_stats, post_stats = run_bbase_test(exp_config)
-    rename_bbase_results(exp_config.results_bbase_subdir)
-    # store IO stats in the results
-    with open(exp_config.results_bbase_subdir / IOSTATS_FILE, 'w') as f:
-        iostats = {'before': pre_stats, 'after': post_stats, }
-        f.write(json.JSONEncoder(indent=2, sort_keys=True).encode(iostats))
-        f.write('\n')  # ensure trailing newline
+    finally:
+        # record where the time went, even if the experiment failed part way through
+        write_phase_times(exp_config, timer)
 
     # reads = int((post_stats.get('sectors_read') or 0) - int(pre_stats.get('sectors_read') or 0)
     # print(f'disk reads = {reads} = {reads * 512 / 2**20} MiB = {reads * 512 / 2**30} GiB')
 
 
-def run_bench(args):
-    experiment: str = args.experiment
+def run_plan_capture(experiment: str, exp_config: ExperimentConfig):
+    """Capture query plans with the same configuration and database setup as `run_experiment` would use."""
+    prev_setup, dbsetup = experiment_db_setup(exp_config)
+    write_experiment_config(experiment, exp_config, dbsetup)
+    write_topology(exp_config)
+    print(f'== Capturing plans for branch {exp_config.dbconf.branch.name} to {exp_config.results_dir}')
+
+    timer = PhaseTimer()
+    try:
+        prepare_database(exp_config, prev_setup, dbsetup, timer)
+        capture_plans(exp_config, timer)
+    finally:
+        write_phase_times(exp_config, timer)
+
+
+def experiment_config_from_args(args) -> ExperimentConfig:
+    """Experiment configuration from the command line arguments of `run_util.py`"""
     branch: PgBranch
     sf: int = args.sf
 
@@ -1434,6 +2626,23 @@ def run_bench(args):
     if isinstance(workload, CountedWorkloadConfig):
         workload = workload.with_multiplier(args.count_multiplier)
 
+    if args.stop_precision is not None:
+        if not isinstance(workload, WeightedWorkloadConfig):
+            raise Exception(f'Stopping at steady state needs a weighted workload, not {args.workload}')
+        workload = workload.with_early_stop(args.stop_precision)
+
+    if args.warmup_s is not None:
+        if not isinstance(workload, WeightedWorkloadConfig):
+            raise Exception(f'The warmup time can only be set for a weighted workload, not {args.workload}')
+        workload = workload.with_times(workload.time_s, args.warmup_s)
+
+    nworkers = args.parallelism
+    if args.ramp:
+        if not isinstance(workload, WeightedWorkloadConfig):
+            raise Exception(f'Concurrency ramps need a weighted workload, not {args.workload}')
+        workload = workload.with_ramp(args.ramp)
+        nworkers = workload.max_terminals
+
     num_samples = args.num_samples
     if branch.accepts_nsamples and num_samples is None:
         # default number of samples for branches which support it
@@ -1444,14 +2653,52 @@ def run_bench(args):
         synchronize_seqscans='on' if args.syncscans else 'off',
         pbm_evict_num_samples=num_samples,
     )
+    if args.track_statements:
+        pgconf = pgconf.with_statements()
 
     dbbin = DbBin(branch, block_size=args.blk_sz, bg_size=args.bg_sz)
     dbdata = DbData(workload.workload, sf=sf, block_size=args.blk_sz)
     dbconf = DbConfig(dbbin, dbdata)
     dbsetup = DbSetup(indexes=args.index_type,
                       clustering=args.cluster)
-    bbconf = BBaseConfig(nworkers=args.parallelism, workload=workload, prewarm=args.prewarm)
+    bbconf = BBaseConfig(nworkers=nworkers, workload=workload, prewarm=args.prewarm, driver=args.driver,
+                         client_hosts=args.client_hosts or [])
+    device = DEVICE_PROFILES[args.device] if args.device is not None else None
+    os_tuning = OsTuningConfig(readahead_kb=args.readahead_kb, scheduler=args.io_scheduler, thp=args.thp,
+                               dirty_ratio=args.dirty_ratio, dirty_background_ratio=args.dirty_background_ratio)
+    if os_tuning == OsTuningConfig():
+        os_tuning = None
+    affinity = AffinityConfig(pg_cpus=args.pg_cpus, pg_numa_node=args.pg_numa_node, client_cpus=args.client_cpus,
+                              client_numa_node=args.client_numa_node)
+    if affinity == AffinityConfig():
+        affinity = None
+    capture = CaptureConfig(blktrace=args.blktrace, wait_events_hz=args.wait_events_hz,
+                            telemetry_interval_s=args.telemetry_interval_s or None,
+                            pagecache_points=tuple(args.pagecache or ()),
+                            client_interval_s=args.client_interval_s or None)
+
+    cgroup = None
+    if args.cgroup_v2 or args.cgroup_gb is not None:
+        cgroup = CGroupConfig(args.cgroup_gb, version=2 if args.cgroup_v2 else 1, mem_high_gb=args.cgroup_high_gb,
+                              io_read_bps=int(args.io_read_mbps * 2**20) if args.io_read_mbps else None,
+                              io_read_iops=args.io_read_iops)
+
+    return ExperimentConfig(pgconf=pgconf, dbconf=dbconf, dbsetup=dbsetup, bbconf=bbconf, db_host=db_host,
+                            cgroup=cgroup, capture=capture, device=device, os_tuning=os_tuning,
+                            affinity=affinity,
+                            watchdog=WatchdogConfig(stall_s=args.stall_timeout_s) if args.stall_timeout_s else None)
+
 
+def run_bench(args):
     # Actually run the experiment after parsing args
-    exp = ExperimentConfig(pgconf=pgconf, dbconf=dbconf, dbsetup=dbsetup, bbconf=bbconf, db_host=db_host)
-    run_experiment(experiment, exp)
+    run_experiment(args.experiment, experiment_config_from_args(args))
+
+
+def storage_bench(args):
+    db_host = args.host or WORKLOADS_MAP[args.workload].workload.default_db_host
+    data_root = Path(args.data_root) if args.data_root is not None else PG_DEFAULT_DATA_ROOT
+    characterize_remote_storage(db_host, data_root, args.storage_file_gb, args.storage_duration_s)
+
+
+def explain_bench(args):
+    run_plan_capture(args.experiment, experiment_config_from_args(args))
@@ -0,0 +1,102 @@
+"""
+Mergeable latency histograms with log-linear buckets (like HdrHistogram).
+
+Percentiles can't be averaged across runs, but histograms can be added: merging the histograms of several runs (e.g.
+different seeds) and then computing percentiles gives the true pooled percentiles. Every histogram has the same fixed
+buckets, so a histogram is just an array of counts and merging is addition.
+
+Values below 2^SUB_BUCKET_BITS are counted exactly. Larger values are split into powers of two, each divided into
+2^SUB_BUCKET_BITS equal buckets, so the relative error of any value is at most 2^-SUB_BUCKET_BITS.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Tuple, Union
+
+import numpy as np
+
+SUB_BUCKET_BITS = 6  # <= 1.6% relative error
+MAX_VALUE_BITS = 40  # values up to 2^40 (us: ~12 days). Larger values are counted in the last bucket
+_SUB = 1 << SUB_BUCKET_BITS
+NUM_BUCKETS = _SUB + (MAX_VALUE_BITS - SUB_BUCKET_BITS) * _SUB
+
+
+def bucket_index(values: np.ndarray) -> np.ndarray:
+    """Bucket of each (non-negative integer) value."""
+    v = np.clip(np.asarray(values, dtype=np.int64), 0, (1 << MAX_VALUE_BITS) - 1)
+    # frexp is exact for integers < 2^53: v = m * 2^bits with 0.5 <= m < 1, so bits is the bit length of v
+    _, bits = np.frexp(v.astype(np.float64))
+    shift = np.maximum(bits.astype(np.int64) - 1 - SUB_BUCKET_BITS, 0)
+    # exact for small values: shift is 0 so the index is just v
+    return np.where(v < _SUB, v, _SUB + shift * _SUB + ((v >> shift) - _SUB))
+
+
+def bucket_bounds() -> Tuple[np.ndarray, np.ndarray]:
+    """Lowest value and width of every bucket."""
+    idx = np.arange(NUM_BUCKETS, dtype=np.int64)
+    k = np.maximum(idx - _SUB, 0)
+    shift = k // _SUB
+    low = np.where(idx < _SUB, idx, (_SUB + k % _SUB) << shift)
+    width = np.where(idx < _SUB, 1, np.int64(1) << shift)
+    return low, width
+
+
+_LOW, _WIDTH = bucket_bounds()
+
+
+@dataclass
+class LatencyHistogram:
+    counts: np.ndarray  # NUM_BUCKETS counts
+
+    @staticmethod
+    def empty() -> 'LatencyHistogram':
+        return LatencyHistogram(np.zeros(NUM_BUCKETS, dtype=np.int64))
+
+    @staticmethod
+    def from_values(values: np.ndarray) -> 'LatencyHistogram':
+        return LatencyHistogram(np.bincount(bucket_index(values), minlength=NUM_BUCKETS).astype(np.int64))
+
+    @staticmethod
+    def merge_all(hists: Iterable['LatencyHistogram']) -> 'LatencyHistogram':
+        ret = LatencyHistogram.empty()
+        for h in hists:
+            ret.counts += h.counts
+        return ret
+
+    def __add__(self, other: 'LatencyHistogram') -> 'LatencyHistogram':
+        return LatencyHistogram(self.counts + other.counts)
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def mean(self) -> float:
+        """Approximate mean, using the middle of each bucket"""
+        return float((self.counts * (_LOW + (_WIDTH - 1) / 2)).sum() / self.total) if self.total > 0 else 0.
+
+    def percentile(self, p: float) -> float:
+        """Value below which `p` percent of the values are (the middle of the bucket where that happens)."""
+        if self.total == 0:
+            return 0.
+        cum = np.cumsum(self.counts)
+        i = int(np.searchsorted(cum, p / 100 * self.total, side='left'))
+        i = min(i, NUM_BUCKETS - 1)
+        return float(_LOW[i] + (_WIDTH[i] - 1) / 2)
+
+    def cdf(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(value, fraction of values <= value) at the top of every non-empty bucket"""
+        nz = np.flatnonzero(self.counts)
+        cum = np.cumsum(self.counts)[nz] / max(self.total, 1)
+        return (_LOW + _WIDTH - 1)[nz], cum
+
+
+def save_histograms(file: Union[str, Path], hists: Dict[int, LatencyHistogram]):
+    """Save histograms keyed by an integer (e.g. transaction type) as compressed `.npz`"""
+    keys = sorted(hists.keys())
+    counts = np.stack([hists[k].counts for k in keys]) if keys else np.zeros((0, NUM_BUCKETS), dtype=np.int64)
+    with open(file, 'wb') as f:
+        np.savez_compressed(f, keys=np.array(keys, dtype=np.int64), counts=counts)
+
+
+def load_histograms(file: Union[str, Path]) -> Dict[int, LatencyHistogram]:
+    with np.load(file) as data:
+        return {int(k): LatencyHistogram(c) for k, c in zip(data['keys'], data['counts'])}
@@ -0,0 +1,105 @@
+"""
+OS page cache residency of relation files, with mincore(2).
+
+Postgres counts a block as read (e.g. `heap_blks_read`) whenever it isn't in shared buffers, even if the read was
+served from the OS page cache. Measuring how much of each relation is in the page cache at points of a run shows how
+much is cached twice, and how many of those "misses" were really OS cache hits.
+
+Like the telemetry agent this is copied to the database host and run with its python3 (standard library only). It
+reads a json map of relation name -> file path relative to the data directory (from `pg_relation_filepath`), maps
+every segment file (`<path>`, `<path>.1`, ...) and checks which of its pages are resident. For each relation it writes
+the number of OS pages and resident pages, and a bitmap of resident pages (bit i = page i, zlib-compressed and base64
+encoded) which is small since residency is mostly in long runs. It can be decoded with
+`np.unpackbits(np.frombuffer(zlib.decompress(base64.b64decode(bitmap)), np.uint8), bitorder='little')[:pages]`.
+
+    python3 pagecache.py --data-dir <dir> --relations <json> --out <json>
+"""
+import argparse
+import base64
+import ctypes
+import ctypes.util
+import json
+import mmap
+import os
+import zlib
+from typing import Dict, Optional
+
+PAGE_SIZE = mmap.PAGESIZE
+
+_libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+_libc.mmap.restype = ctypes.c_void_p
+_libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+_libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+_libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p]
+
+# resident flag (lowest bit) of each mincore byte -> ascii '0'/'1'
+_TO_BITS = bytes(ord('1') if b & 1 else ord('0') for b in range(256))
+
+
+def file_residency(path: str) -> bytes:
+    """One ascii '0'/'1' per OS page of the file, '1' if it is in the page cache"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return b''
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        addr = _libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+        if addr in (None, ctypes.c_void_p(-1).value):
+            raise OSError(ctypes.get_errno(), f'mmap failed for {path}')
+        try:
+            vec = ctypes.create_string_buffer((size + PAGE_SIZE - 1) // PAGE_SIZE)
+            if _libc.mincore(addr, size, vec) != 0:
+                raise OSError(ctypes.get_errno(), f'mincore failed for {path}')
+            return vec.raw.translate(_TO_BITS)
+        finally:
+            _libc.munmap(addr, size)
+    finally:
+        os.close(fd)
+
+
+def encode_bitmap(bits: bytes) -> str:
+    if not bits:
+        return ''
+    packed = int(bits[::-1], 2).to_bytes((len(bits) + 7) // 8, 'little')
+    return base64.b64encode(zlib.compress(packed)).decode('ascii')
+
+
+def relation_residency(data_dir: str, rel_path: str) -> Optional[dict]:
+    """Residency of all segment files of a relation, or None if it has no files"""
+    parts = []
+    while True:
+        path = os.path.join(data_dir, rel_path + (f'.{len(parts)}' if parts else ''))
+        if not os.path.exists(path):
+            break
+        parts.append(file_residency(path))
+    if not parts:
+        return None
+    bits = b''.join(parts)
+    return {
+        'pages': len(bits),
+        'resident_pages': bits.count(b'1'),
+        'bitmap': encode_bitmap(bits),
+    }
+
+
+def residency(data_dir: str, relations: Dict[str, str]) -> dict:
+    rels = {}
+    for name, rel_path in relations.items():
+        r = relation_residency(data_dir, rel_path)
+        if r is not None:
+            rels[name] = r
+    return {'page_size': PAGE_SIZE, 'relations': rels}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure page cache residency of relation files with mincore')
+    parser.add_argument('--data-dir', type=str, required=True, dest='data_dir')
+    parser.add_argument('--relations', type=str, required=True,
+                        help='json file of relation name -> path relative to the data directory')
+    parser.add_argument('--out', type=str, required=True)
+    args = parser.parse_args()
+
+    with open(args.relations, 'r') as f:
+        relations = json.load(f)
+    with open(args.out, 'w') as f:
+        f.write(json.JSONEncoder().encode(residency(args.data_dir, relations)))
@@ -0,0 +1,64 @@
+"""
+Convert pgbench's per-transaction logs (`--log`) to the same result files as benchbase (`summary.json` and `raw.csv`).
+"""
+import json
+import os
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from lib.driver import summary_map, write_raw_csv
+
+# pgbench writes `<prefix>.<pid>` for the main thread and `<prefix>.<pid>.<thread>` for the others
+PGBENCH_LOG_PREFIX = 'pgbench_log'
+# Columns of the log. `latency_us` is 'skipped' for transactions skipped by --latency-limit, or 'failed' (and other
+# error types) for failed transactions in newer versions. The optional columns are only present with --rate and
+# --max-tries respectively.
+PGBENCH_LOG_COLS = ['client', 'txn_no', 'latency_us', 'script', 'epoch_s', 'epoch_us', 'schedule_lag_us', 'retries']
+
+
+def read_pgbench_logs(log_dir: Path) -> pd.DataFrame:
+    files = sorted(log_dir.glob(f'{PGBENCH_LOG_PREFIX}.*'))
+    if not files:
+        raise Exception(f'No pgbench logs found in {log_dir}!')
+
+    df = pd.concat([
+        pd.read_csv(f, sep=' ', header=None, names=PGBENCH_LOG_COLS, dtype=str)
+        for f in files
+    ], ignore_index=True)
+    for c in ['client', 'txn_no', 'script', 'epoch_s', 'epoch_us']:
+        df[c] = pd.to_numeric(df[c])
+    return df
+
+
+def write_pgbench_results(log_dir: Path, script_names: List[str], remove_logs=True):
+    """Write `summary.json` and `raw.csv` to `log_dir` from the pgbench logs in it."""
+    df = read_pgbench_logs(log_dir)
+
+    skipped = df.latency_us == 'skipped'
+    latency = pd.to_numeric(df.latency_us, errors='coerce')
+    failed = latency.isna() & ~skipped
+    df = df.assign(latency_us=latency)
+
+    end_us = df.epoch_s * 10**6 + df.epoch_us
+    start_us = end_us - df.latency_us.fillna(0)
+    run_start = start_us.min()
+    runtime_ns = int((end_us.max() - run_start) * 1000)
+
+    ok = ~(skipped | failed)
+    summary = summary_map(df.latency_us[ok].to_numpy(dtype=np.float64), runtime_ns, driver='pgbench',
+                          failed=int(failed.sum()))
+    summary['Skipped Transactions'] = int(skipped.sum())
+    summary['Failed Transactions'] = int(failed.sum())
+    with open(log_dir / 'summary.json', 'w') as f:
+        f.write(json.JSONEncoder(indent=2).encode(summary))
+
+    done = df[ok].assign(start_us=(start_us[ok] - run_start).astype(np.int64)).sort_values('start_us')
+    write_raw_csv(log_dir / 'raw.csv', zip(done.script, done.script.map(lambda s: script_names[s]), done.start_us,
+                                           done.latency_us.astype(np.int64), done.client))
+
+    if remove_logs:
+        for f in log_dir.glob(f'{PGBENCH_LOG_PREFIX}.*'):
+            os.remove(f)
@@ -0,0 +1,264 @@
+"""
+Predict how long a sweep of experiments will take before running it, and trim sweeps to fit in a time budget.
+
+Estimates come from previous results in `results.csv`: per-phase wall times (see `EXPERIMENT_PHASES`) and the measured
+runtime of matching configurations. Time-based workloads use the configured warmup + run time instead. The same history
+gives the limits of the watchdogs that abort runs which stall or behave unlike past runs (see `lib/watchdog.py`).
+"""
+from lib.experiments import *
+
+
+# Estimates (s) for phases without any history, e.g. before any results with phase timings have been collected.
+DEFAULT_PHASE_S = {
+    'setup_indexes_cluster': 60.,
+    'tpcc_restore_data_dir': 300.,
+    'config_postgres': 1.,
+    'start_postgres': 5.,
+    'drop_caches': 2.,
+    'prewarm': 60.,
+    'clear_stats': 1.,
+    'bbase_overhead': 15.,
+    'stop_postgres': 10.,
+    'rename_results': 0.,
+}
+# Measured runtime (s) of a counted workload when no similar configuration has been run before
+DEFAULT_COUNTED_RUNTIME_S = 30 * 60
+
+# Config columns which must match to use a past run's runtime for a counted workload. If nothing matches, the last
+# columns are dropped one at a time until something does.
+RUNTIME_MATCH_COLS = [
+    'workload', 'scalefactor', 'count_multiplier', 'parallelism', 'indexes', 'clustering', 'branch',
+    'shared_buffers', 'selectivity', 'pbm_evict_num_samples', 'cgroup_gb', 'db_host',
+]
+# Config columns which must all match for past runs' throughput to be the expected range of a run
+THROUGHPUT_MATCH_COLS = [*RUNTIME_MATCH_COLS, 'rate', 'driver', 'device_profile']
+
+# Abort a run if its throughput is more than this factor outside the range of past runs of the same configuration...
+WATCHDOG_THROUGHPUT_FACTOR = 3.
+# ... if no transaction completes for this many times the longest latency of those runs (at least the minimum, so
+# short transactions don't trip it with a hiccup) ...
+WATCHDOG_STALL_LATENCY_FACTOR = 3.
+WATCHDOG_STALL_MIN_S = 60.
+# ... or if benchbase runs longer than this factor of the predicted time plus some slack
+WATCHDOG_WALL_FACTOR = 1.5
+WATCHDOG_WALL_SLACK_S = 120.
+
+
+@dataclass
+class ExperimentEstimate:
+    """Predicted wall time (s) of each phase of one experiment."""
+    exp: ExperimentConfig
+    phases: Dict[str, float]
+
+    @property
+    def total_s(self) -> float:
+        return sum(self.phases.values())
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f'{seconds // 3600}h {(seconds % 3600) // 60}m {seconds % 60}s'
+
+
+class SweepPlanner:
+    """Estimates experiment wall time from the history of collected results."""
+
+    def __init__(self, history_csv=COLLECTED_RESULTS_CSV):
+        try:
+            # read everything as strings so values compare the same way as the configuration maps
+            self.history = pd.read_csv(history_csv, keep_default_na=False, dtype=str)
+        except FileNotFoundError:
+            print(f'WARNING: no results history in {history_csv}, using default time estimates')
+            self.history = pd.DataFrame()
+
+    def _history_col(self, col: str, db_host: str) -> pd.Series:
+        """Numeric values of a column from the history, restricted to `db_host` if it has any values for it."""
+        if col not in self.history.columns:
+            return pd.Series(dtype=float)
+
+        vals = pd.to_numeric(self.history[col], errors='coerce')
+        if 'db_host' in self.history.columns:
+            host_vals = vals[self.history['db_host'] == db_host].dropna()
+            if len(host_vals) > 0:
+                return host_vals
+        return vals.dropna()
+
+    def phase_estimate(self, phase: str, db_host: str, quantile=0.5) -> float:
+        vals = self._history_col(f'phase_{phase}_s', db_host)
+        if len(vals) == 0:
+            return DEFAULT_PHASE_S[phase]
+        return float(vals.quantile(quantile))
+
+    def runtime_estimate(self, exp: ExperimentConfig) -> float:
+        """Estimated measured runtime (s) of the benchmark itself."""
+        work = exp.bbconf.workload
+        if isinstance(work, WeightedWorkloadConfig):
+            return work.total_time_s
+        if isinstance(work, PgbenchWorkloadConfig):
+            return work.time_s
+
+        if 'Benchmark Runtime (nanoseconds)' not in self.history.columns:
+            return DEFAULT_COUNTED_RUNTIME_S
+
+        runs = self._matching_runs(exp, RUNTIME_MATCH_COLS)
+        runtimes = pd.to_numeric(runs.get('Benchmark Runtime (nanoseconds)', pd.Series(dtype=str)),
+                                 errors='coerce').dropna()
+        if len(runtimes) > 0:
+            return float(runtimes.median()) / 10**9
+
+        return DEFAULT_COUNTED_RUNTIME_S
+
+    def _matching_runs(self, exp: ExperimentConfig, cols: List[str], exact=False) -> pd.DataFrame:
+        """
+        Past runs with the same values of `cols` as `exp`. Unless `exact`, the last columns are dropped one at a time
+        until some past runs match.
+        """
+        conf = {
+            'db_host': exp.db_host,
+            **exp.dbconf.to_config_map(),
+            **asdict(exp.pgconf),
+            **exp.bbconf.to_config_map(),
+            **(asdict(exp.dbsetup) if exp.dbsetup is not None else {}),
+            **(exp.cgroup.to_config_map() if exp.cgroup is not None else {}),
+            **exp.device_config_map(),
+        }
+        conf = {k: ('' if v is None else str(v)) for k, v in conf.items()}
+        if exact and any(c in conf and c not in self.history.columns for c in cols):
+            return self.history.iloc[0:0]
+        match_cols = [c for c in cols if c in self.history.columns and c in conf]
+
+        # drop the least important columns until some past runs match
+        for n in range(len(match_cols), 0 if not exact else len(match_cols) - 1, -1):
+            mask = pd.Series(True, index=self.history.index)
+            for c in match_cols[:n]:
+                mask &= self.history[c] == conf[c]
+            if mask.any():
+                return self.history[mask]
+
+        return self.history.iloc[0:0]
+
+    def watchdog_config(self, exp: ExperimentConfig) -> WatchdogConfig:
+        """
+        Watchdog limits for `exp` from past runs of exactly the same configuration: their throughput range and
+        longest latency, and the predicted wall time of benchbase (the configured time for time-based workloads,
+        otherwise the longest of those runs). Without such runs no limits are set.
+        """
+        wd = WatchdogConfig()
+        if len(self.history) == 0:
+            return wd
+        runs = self._matching_runs(exp, THROUGHPUT_MATCH_COLS, exact=True)
+        if len(runs) == 0:
+            return wd
+
+        work = exp.bbconf.workload
+        overhead_s = self.phase_estimate('bbase_overhead', exp.db_host, 0.9)
+        if isinstance(work, (WeightedWorkloadConfig, PgbenchWorkloadConfig)):
+            wd.max_wall_s = self.runtime_estimate(exp) + overhead_s
+
+        runtimes = pd.to_numeric(runs.get('Benchmark Runtime (nanoseconds)', pd.Series(dtype=str)), errors='coerce')
+        if wd.max_wall_s is None and runtimes.notna().any():
+            wd.max_wall_s = float(runtimes.max()) / 10**9 + overhead_s
+        # a ramp's average throughput depends on how long each phase is, so it doesn't have a range
+        tput = pd.to_numeric(runs.get('Throughput (requests/second)', pd.Series(dtype=str)), errors='coerce').dropna()
+        if len(tput) > 0 and not isinstance(work, RampWorkloadConfig):
+            wd.min_throughput = float(tput.min()) / WATCHDOG_THROUGHPUT_FACTOR
+            wd.max_throughput = float(tput.max()) * WATCHDOG_THROUGHPUT_FACTOR
+        max_lat = pd.to_numeric(runs.get('Maximum Latency (microseconds)', pd.Series(dtype=str)), errors='coerce')
+        if max_lat.notna().any():
+            wd.stall_s = max(WATCHDOG_STALL_MIN_S, WATCHDOG_STALL_LATENCY_FACTOR * float(max_lat.max()) / 10**6)
+        return self._with_wall_slack(wd)
+
+    @staticmethod
+    def _with_wall_slack(wd: WatchdogConfig) -> WatchdogConfig:
+        if wd.max_wall_s is not None:
+            wd.max_wall_s = wd.max_wall_s * WATCHDOG_WALL_FACTOR + WATCHDOG_WALL_SLACK_S
+        return wd
+
+    def estimate(self, exp: ExperimentConfig, prev_setup: Optional[DbSetup]) -> ExperimentEstimate:
+        """
+        Estimate the time of each phase for one experiment.
+        `prev_setup` is the index/clustering setup left by the previous experiment on the same database.
+        Changing the setup is much slower than keeping it, so use a high quantile of past setup times in that case.
+        """
+        host = exp.db_host
+        is_tpch = exp.bbconf.workload.workload.is_tpch()
+        phases = {}
+
+        if is_tpch:
+            changed = prev_setup is None or exp.dbsetup.update_with_old(prev_setup) != prev_setup
+            phases['setup_indexes_cluster'] = self.phase_estimate('setup_indexes_cluster', host, 0.9 if changed else 0.1)
+        else:
+            phases['tpcc_restore_data_dir'] = self.phase_estimate('tpcc_restore_data_dir', host)
+
+        for p in ['config_postgres', 'start_postgres', 'drop_caches', 'clear_stats']:
+            phases[p] = self.phase_estimate(p, host)
+        if is_tpch and exp.bbconf.prewarm:
+            phases['prewarm'] = self.phase_estimate('prewarm', host)
+
+        phases['bbase_overhead'] = self.phase_estimate('bbase_overhead', host)
+        phases['measured'] = self.runtime_estimate(exp)
+        phases['stop_postgres'] = self.phase_estimate('stop_postgres', host)
+        phases['rename_results'] = self.phase_estimate('rename_results', host)
+
+        return ExperimentEstimate(exp, phases)
+
+    def _estimate_next(self, exp: ExperimentConfig, setups: Dict[ConfigKey, DbSetup]) -> ExperimentEstimate:
+        """Estimate `exp` following the experiments which left the databases in `setups`, then update `setups`."""
+        if not exp.bbconf.workload.workload.is_tpch():
+            return self.estimate(exp, None)
+
+        key = exp.dbconf.to_config_key(exp.db_host)
+        if key not in setups:
+            setups[key] = get_last_config(key)
+        est = self.estimate(exp, setups[key])
+        setups[key] = exp.dbsetup.update_with_old(setups[key])
+        return est
+
+    def estimate_sweep(self, tests: List[ExperimentConfig]) -> List[ExperimentEstimate]:
+        """Estimate each experiment of a sweep, in the order they will run."""
+        setups: Dict[ConfigKey, DbSetup] = {}
+        return [self._estimate_next(exp, setups) for exp in tests]
+
+    def print_sweep_estimate(self, exp_name: str, tests: List[ExperimentConfig]) -> float:
+        """Print the predicted time of a sweep per host and per phase. Returns the total (s)."""
+        estimates = self.estimate_sweep(tests)
+        df_est = pd.DataFrame([{'db_host': e.exp.db_host, **e.phases} for e in estimates]).fillna(0)
+        total = df_est.drop(columns='db_host').sum().sum()
+
+        print(f'=== [{exp_name}] PREDICTED TIME for {len(tests)} experiments: {format_duration(total)}')
+        for host, df_host in df_est.groupby('db_host'):
+            per_phase = df_host.drop(columns='db_host').sum().sort_values(ascending=False)
+            phases_str = ', '.join(f'{p}={format_duration(t)}' for p, t in per_phase.items() if t > 0)
+            print(f'===     {host}: {format_duration(per_phase.sum())}  ({phases_str})')
+
+        return total
+
+    def plan_budget(self, tests: List[ExperimentConfig], budget_s: float,
+                    seed_priority: List[int] = None) -> List[ExperimentConfig]:
+        """
+        Choose which experiments to run to fit in `budget_s` seconds.
+        Experiments are ordered by the position of their seed in `seed_priority` (so complete repetitions finish
+        first) and any experiment which would exceed the budget is dropped.
+        """
+        if seed_priority is not None:
+            prio = {s: i for i, s in enumerate(seed_priority)}
+            tests = sorted(tests, key=lambda e: prio.get(e.bbconf.seed, len(prio)))
+
+        planned = []
+        used = 0.
+        setups: Dict[ConfigKey, DbSetup] = {}
+        for exp in tests:
+            # estimate following the planned experiments so index setup changes are accounted for
+            trial_setups = copy.copy(setups)
+            est = self._estimate_next(exp, trial_setups)
+            if used + est.total_s <= budget_s:
+                planned.append(exp)
+                used += est.total_s
+                setups = trial_setups
+
+        skipped = len(tests) - len(planned)
+        if skipped > 0:
+            print(f'WARNING: skipping {skipped} of {len(tests)} experiments to fit in {format_duration(budget_s)} '
+                  f'(planned: {format_duration(used)})')
+
+        return planned
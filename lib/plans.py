@@ -0,0 +1,81 @@
+"""
+Query plans captured with `EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)`, flattened to one row per plan node.
+
+Each query is explained twice: 'cold' right after restarting postgres and dropping the OS cache, then 'warm'
+immediately after. Plans are saved as `<query>_<run>.json` in the plans directory of the experiment.
+
+Buffer counts and times reported by EXPLAIN include the node's children, so the exclusive (`excl_*`) columns subtract
+the children to attribute I/O to the node itself (e.g. a specific seq/bitmap/index scan). Times are summed over all
+loops, so for parallel nodes they are summed over all processes rather than wall time.
+"""
+import json
+from pathlib import Path
+from typing import List, Union
+
+PLAN_RUNS = ['cold', 'warm']
+PLAN_NODE_COLS = [
+    'query', 'run', 'node_id', 'parent_id', 'depth', 'node_type', 'parent_relationship', 'relation_name',
+    'index_name', 'plan_rows', 'actual_rows', 'actual_loops', 'workers_launched',
+    'total_time_ms', 'excl_total_time_ms', 'shared_hit_blocks', 'shared_read_blocks', 'excl_shared_hit_blocks',
+    'excl_shared_read_blocks', 'io_read_time_ms', 'query_execution_ms',
+]
+
+
+def plan_file_name(query: str, run: str) -> str:
+    return f'{query}_{run}.json'
+
+
+def _node_totals(node: dict) -> dict:
+    loops = node.get('Actual Loops', 0)
+    return {
+        'total_time_ms': node.get('Actual Total Time', 0.) * loops,
+        'shared_hit_blocks': node.get('Shared Hit Blocks', 0),
+        'shared_read_blocks': node.get('Shared Read Blocks', 0),
+    }
+
+
+def flatten_plan(explain: Union[list, dict], query: str, run: str) -> List[dict]:
+    """One row per node of the output of EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON), in depth-first order"""
+    if isinstance(explain, list):
+        explain = explain[0]
+    rows = []
+
+    def visit(node: dict, parent_id: int, depth: int):
+        node_id = len(rows)
+        totals = _node_totals(node)
+        children = [_node_totals(c) for c in node.get('Plans', [])]
+        row = {
+            'query': query,
+            'run': run,
+            'node_id': node_id,
+            'parent_id': parent_id,
+            'depth': depth,
+            'node_type': node.get('Node Type'),
+            'parent_relationship': node.get('Parent Relationship'),
+            'relation_name': node.get('Relation Name'),
+            'index_name': node.get('Index Name'),
+            'plan_rows': node.get('Plan Rows'),
+            'actual_rows': node.get('Actual Rows'),
+            'actual_loops': node.get('Actual Loops'),
+            'workers_launched': node.get('Workers Launched'),
+            **totals,
+            **{f'excl_{k}': v - sum(c[k] for c in children) for k, v in totals.items()},
+            'io_read_time_ms': node.get('I/O Read Time'),
+            'query_execution_ms': explain.get('Execution Time'),
+        }
+        rows.append(row)
+        for c in node.get('Plans', []):
+            visit(c, node_id, depth + 1)
+
+    visit(explain['Plan'], -1, 0)
+    return rows
+
+
+def read_plans(plans_dir: Path) -> List[dict]:
+    """Flattened nodes of every plan saved in `plans_dir`"""
+    rows = []
+    for f in sorted(plans_dir.glob('*.json')):
+        query, run = f.stem.rsplit('_', 1)
+        with open(f, 'r') as pf:
+            rows += flatten_plan(json.load(pf), query, run)
+    return rows
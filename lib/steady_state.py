@@ -0,0 +1,147 @@
+"""
+Steady-state detection from the throughput time series of a run, instead of trusting a fixed warmup time.
+
+The series is throughput (and average latency) per sampling window: benchbase writes it to `samples.csv` when run with
+`-s <window>`, otherwise it is computed from `raw.csv` (by completion time) and saved in the same format. The end of
+the warmup is found with MSER-5: the series is averaged in batches of 5 windows, and the truncation point is the one
+minimizing the squared standard error of the remaining batches' mean. Steady-state throughput is the mean after the
+truncation point, with a confidence interval from non-overlapping batch means so autocorrelation between windows
+doesn't make it look more precise than it is.
+
+`SteadyStateMonitor` does the same incrementally, for stopping a run early once the steady-state throughput is known
+to the requested relative precision. Only depends on NumPy so the collector can use it.
+"""
+import csv
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+from lib.bbase_results import RawResults
+
+# columns of benchbase's samples file used here
+SAMPLE_TIME_COL = 'Time (seconds)'
+SAMPLE_THROUGHPUT_COL = 'Throughput (requests/second)'
+SAMPLE_LATENCY_COL = 'Average Latency (millisecond)'
+
+SS_STAT_COLS = [
+    'ss_warmup_s', 'ss_time_s', 'ss_throughput', 'ss_throughput_ci', 'ss_rel_precision', 'ss_latency_ms', 'ss_reached',
+]
+
+MSER_BATCH = 5
+# number of batches for the batch means confidence interval
+CI_BATCHES = 10
+# two-sided 95% t quantiles by degrees of freedom (normal quantile beyond the table)
+_T_975 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131,
+          2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+# steady state is reached if the confidence interval half-width is within this fraction of the mean
+DEFAULT_TARGET_PRECISION = 0.05
+
+
+def _t_quantile(df: int) -> float:
+    return _T_975[df - 1] if df <= len(_T_975) else 1.96
+
+
+def read_samples(samples_file: Union[str, Path]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Time (s), throughput (/s) and average latency (ms) of each window from a benchbase samples file"""
+    with open(samples_file, 'r') as f:
+        rows = list(csv.DictReader(f))
+    cols = [SAMPLE_TIME_COL, SAMPLE_THROUGHPUT_COL, SAMPLE_LATENCY_COL]
+    return tuple(np.array([float(r[c] or 0) for r in rows], dtype=np.float64) for c in cols)
+
+
+def series_from_raw(raw: RawResults, window_s: float = 1.) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Same as `read_samples`, from the raw results: transactions are counted in the window they completed in. `raw`
+    should only have the measured transactions, like benchbase's samples.
+    """
+    if len(raw) == 0:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    end_s = raw.start_s + raw.latency_us / 10**6
+    bins = ((end_s - raw.start_s.min()) // window_s).astype(np.int64)
+    counts = np.bincount(bins)
+    lat_sum = np.bincount(bins, weights=raw.latency_us)
+    lat_ms = np.divide(lat_sum, counts, out=np.zeros(len(counts)), where=counts > 0) / 1000
+    # drop the last window, which is usually partial
+    n = max(len(counts) - 1, 1)
+    return np.arange(n) * window_s, counts[:n] / window_s, lat_ms[:n]
+
+
+def write_samples(samples_file: Union[str, Path], time_s: np.ndarray, throughput: np.ndarray, latency_ms: np.ndarray):
+    with open(samples_file, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow([SAMPLE_TIME_COL, SAMPLE_THROUGHPUT_COL, SAMPLE_LATENCY_COL])
+        w.writerows(zip(time_s.tolist(), throughput.tolist(), latency_ms.tolist()))
+
+
+def mser5(x: np.ndarray) -> int:
+    """Number of leading windows of `x` to discard as warmup, by MSER-5 (only truncating up to half of the series)"""
+    nbatches = len(x) // MSER_BATCH
+    if nbatches < 2:
+        return 0
+    batches = x[:nbatches * MSER_BATCH].reshape(nbatches, MSER_BATCH).mean(axis=1)
+
+    # MSER(d) = sum_{i >= d} (b_i - mean_d)^2 / (n - d)^2, from suffix sums
+    suffix_n = np.arange(nbatches, 0, -1)
+    suffix_sum = np.cumsum(batches[::-1])[::-1]
+    suffix_sq = np.cumsum(batches[::-1] ** 2)[::-1]
+    sse = suffix_sq - suffix_sum ** 2 / suffix_n
+    mser = sse / suffix_n ** 2
+    return int(np.argmin(mser[:(nbatches + 1) // 2])) * MSER_BATCH
+
+
+def batch_means_ci(x: np.ndarray, nbatches: int = CI_BATCHES) -> Tuple[float, Optional[float]]:
+    """Mean of `x` and the half-width of its 95% confidence interval (None if there are too few values)"""
+    mean = float(x.mean()) if len(x) > 0 else 0.
+    size = len(x) // nbatches
+    if size < 1:
+        return mean, None
+    batches = x[:nbatches * size].reshape(nbatches, size).mean(axis=1)
+    return mean, _t_quantile(nbatches - 1) * float(batches.std(ddof=1)) / float(np.sqrt(nbatches))
+
+
+def steady_state(time_s: np.ndarray, throughput: np.ndarray, latency_ms: np.ndarray,
+                 target_precision: float = DEFAULT_TARGET_PRECISION) -> dict:
+    """Detected warmup and steady-state throughput of a run, or an empty dict if the series is too short"""
+    if len(throughput) < 2 * MSER_BATCH:
+        return {}
+    window_s = float(time_s[1] - time_s[0])
+    d = mser5(throughput)
+    mean, ci = batch_means_ci(throughput[d:])
+    rel = ci / mean if ci is not None and mean > 0 else None
+    tput = throughput[d:]
+    return {
+        'ss_warmup_s': d * window_s,
+        'ss_time_s': len(tput) * window_s,
+        'ss_throughput': mean,
+        'ss_throughput_ci': ci,
+        'ss_rel_precision': rel,
+        # weighted by throughput, so it is the average over transactions like benchbase's summary
+        'ss_latency_ms': float((latency_ms[d:] * tput).sum() / tput.sum()) if tput.sum() > 0 else None,
+        'ss_reached': bool(rel is not None and rel <= target_precision),
+    }
+
+
+class SteadyStateMonitor:
+    """
+    Count completed transactions per window while a run is going, to decide when the steady-state throughput is
+    known precisely enough to stop: after at least `min_time_s`, when the confidence interval of the throughput after
+    the MSER-5 truncation point is within `target_precision` of it.
+    """
+
+    def __init__(self, target_precision: float, window_s: float = 1., min_time_s: float = 30.):
+        self.target_precision = target_precision
+        self.window_s = window_s
+        self.min_time_s = min_time_s
+        self.counts: List[int] = []
+
+    def add_window(self, completed: int):
+        self.counts.append(completed)
+
+    def converged(self) -> bool:
+        if len(self.counts) * self.window_s < self.min_time_s:
+            return False
+        tput = np.array(self.counts, dtype=np.float64) / self.window_s
+        d = mser5(tput)
+        mean, ci = batch_means_ci(tput[d:])
+        return ci is not None and mean > 0 and ci / mean <= self.target_precision
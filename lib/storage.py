@@ -0,0 +1,150 @@
+"""
+Characterize the read performance of the storage device under a directory, as a baseline to normalize I/O metrics.
+
+Like the telemetry agent this is copied to the database host and run with its python3, so it only uses the standard
+library. A test file is written under the directory and then read with direct I/O (bypassing the page cache) by a pool
+of threads, one outstanding request each, so the number of threads is the queue depth. Sequential reads give each
+thread its own contiguous part of the file, random reads pick aligned offsets uniformly over the whole file. For each
+(pattern, request size, queue depth) throughput, IOPS and request latency are measured, and the best of them are
+summarized for normalizing results (e.g. the fraction of the device's sequential bandwidth a run used).
+
+    python3 storage.py --dir <data_root> --out <json> [--file-gb <GB>] [--duration <s>]
+"""
+import argparse
+import json
+import mmap
+import os
+import random
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+TEST_FILE_NAME = 'pbm_storage_test.dat'
+REQUEST_SIZES_KB = [4, 8, 64, 256, 1024]
+QUEUE_DEPTHS = [1, 4, 16, 32]
+PATTERNS = ['seq', 'rand']
+# block size for random IOPS and latency in the summary (postgres' default block size)
+SUMMARY_BLOCK_KB = 8
+
+
+def _percentile(sorted_vals: List[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.
+    return sorted_vals[min(int(p / 100 * len(sorted_vals)), len(sorted_vals) - 1)]
+
+
+def write_test_file(path: str, size_bytes: int):
+    """Write incompressible data so reads actually hit the device (and not e.g. unallocated extents)"""
+    chunk = os.urandom(64 * 2**20)
+    with open(path, 'wb') as f:
+        written = 0
+        while written < size_bytes:
+            f.write(chunk[:min(len(chunk), size_bytes - written)])
+            written += len(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def measure(path: str, pattern: str, req_kb: int, qd: int, duration_s: float) -> dict:
+    """Read `path` with direct I/O using `qd` threads for `duration_s`"""
+    req = req_kb * 1024
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+    try:
+        nreqs = os.fstat(fd).st_size // req
+        deadline = time.perf_counter() + duration_s
+
+        def worker(i: int) -> List[float]:
+            buf = mmap.mmap(-1, req)  # page aligned, as direct I/O needs
+            rng = random.Random(i)
+            # sequential: each thread reads its own part of the file, wrapping around at the end of it
+            part = nreqs // qd
+            pos = part * i
+            lats = []
+            while True:
+                if pattern == 'seq':
+                    off = pos * req
+                    pos = pos + 1 if pos + 1 < part * (i + 1) else part * i
+                else:
+                    off = rng.randrange(nreqs) * req
+                start = time.perf_counter()
+                os.preadv(fd, [buf], off)
+                end = time.perf_counter()
+                lats.append(end - start)
+                if end >= deadline:
+                    break
+            buf.close()
+            return lats
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(qd) as pool:
+            lats = [lat for ls in pool.map(worker, range(qd)) for lat in ls]
+        elapsed = time.perf_counter() - start
+    finally:
+        os.close(fd)
+
+    lats.sort()
+    return {
+        'pattern': pattern,
+        'req_kb': req_kb,
+        'qd': qd,
+        'mb_per_s': len(lats) * req / 2**20 / elapsed,
+        'iops': len(lats) / elapsed,
+        'lat_avg_ms': sum(lats) / len(lats) * 1000,
+        'lat_p50_ms': _percentile(lats, 50) * 1000,
+        'lat_p99_ms': _percentile(lats, 99) * 1000,
+    }
+
+
+def summarize(results: List[dict]) -> dict:
+    def best(pattern: str, key: str, req_kb: Optional[int] = None) -> float:
+        return max((r[key] for r in results if r['pattern'] == pattern and req_kb in (None, r['req_kb'])), default=0.)
+
+    qd1 = [r for r in results if r['pattern'] == 'rand' and r['req_kb'] == SUMMARY_BLOCK_KB and r['qd'] == 1]
+    return {
+        'seq_read_mb_per_s': best('seq', 'mb_per_s'),
+        'rand_read_mb_per_s': best('rand', 'mb_per_s'),
+        'rand_read_iops': best('rand', 'iops', SUMMARY_BLOCK_KB),
+        'rand_read_lat_ms': qd1[0]['lat_avg_ms'] if qd1 else None,
+    }
+
+
+def characterize(directory: str, file_gb: float, duration_s: float) -> dict:
+    path = os.path.join(directory, TEST_FILE_NAME)
+    write_test_file(path, int(file_gb * 2**30))
+    try:
+        results = []
+        for pattern in PATTERNS:
+            for req_kb in REQUEST_SIZES_KB:
+                for qd in QUEUE_DEPTHS:
+                    r = measure(path, pattern, req_kb, qd, duration_s)
+                    print(f'{pattern:4} {req_kb:5}kB qd={qd:<3} {r["mb_per_s"]:9.1f} MiB/s {r["iops"]:10.0f} IOPS '
+                          f'{r["lat_avg_ms"]:8.3f} ms', flush=True)
+                    results.append(r)
+    finally:
+        os.remove(path)
+
+    return {
+        'host': socket.gethostname(),
+        'dir': directory,
+        'device': os.stat(directory).st_dev,
+        'file_gb': file_gb,
+        'duration_s': duration_s,
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        **summarize(results),
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure direct I/O read performance of the device under a directory')
+    parser.add_argument('--dir', type=str, required=True)
+    parser.add_argument('--out', type=str, required=True)
+    parser.add_argument('--file-gb', type=float, default=8., dest='file_gb',
+                        help='Size of the test file, should be much larger than any device cache')
+    parser.add_argument('--duration', type=float, default=5., help='Seconds per measurement')
+    args = parser.parse_args()
+
+    profile = characterize(args.dir, args.file_gb, args.duration)
+    with open(args.out, 'w') as f:
+        f.write(json.JSONEncoder(indent=2).encode(profile))
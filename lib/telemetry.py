@@ -0,0 +1,200 @@
+"""
+Lightweight resource telemetry agent for the database host, and a summary of its output for the collector.
+
+The agent is copied to the database host and run with its python3 for the duration of a test (so it only uses the
+standard library). Every interval it appends one row of counters to a csv: CPU time and context switches from
+`/proc/stat`, page cache and dirty memory from `/proc/meminfo`, reclaim from `/proc/vmstat`, pressure stall totals
+from `/proc/pressure/*` and memory usage of the postgres cgroup (v1 or v2) if given. Cumulative counters are written
+as-is, so rates are computed from differences afterwards.
+
+The agent runs from before prewarm until after postgres is stopped, so the benchmark itself is marked in the output:
+SIGUSR1 takes a sample immediately and sets the `bench` column of the following rows, SIGUSR2 takes a last sample of
+the benchmark and clears it again. The summaries only use the marked rows. SIGTERM takes a final sample and exits.
+
+    python3 telemetry.py --out <csv> [--interval <s>] [--cgroup <name>]
+"""
+import argparse
+import csv
+import os
+import signal
+import time
+from typing import Dict, List, Optional
+
+CPU_FIELDS = ['user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal']
+MEMINFO_FIELDS = {'MemFree': 'mem_free_kb', 'Cached': 'cached_kb', 'Dirty': 'dirty_kb', 'Writeback': 'writeback_kb',
+                  'Active(file)': 'active_file_kb', 'Inactive(file)': 'inactive_file_kb'}
+VMSTAT_FIELDS = ['pgscan_kswapd', 'pgscan_direct', 'pgsteal_kswapd', 'pgsteal_direct', 'pgmajfault']
+PSI_RESOURCES = ['cpu', 'memory', 'io']
+CGROUP_FIELDS = ['cg_usage_bytes', 'cg_file_bytes', 'cg_anon_bytes', 'cg_pgmajfault']
+
+TELEMETRY_COLS = [
+    'time_s', 'bench',
+    *(f'cpu_{f}' for f in CPU_FIELDS), 'ctxt', 'procs_running', 'procs_blocked',
+    *MEMINFO_FIELDS.values(),
+    *VMSTAT_FIELDS,
+    *(f'psi_{r}_{k}_us' for r in PSI_RESOURCES for k in ['some', 'full']),
+    *CGROUP_FIELDS,
+]
+
+# per-run summary columns for the collector
+TELEMETRY_STAT_COLS = [
+    'tel_cpu_util', 'tel_cpu_iowait', 'tel_ctxt_per_s', 'tel_procs_blocked_avg',
+    'tel_cached_gb_avg', 'tel_cached_gb_max', 'tel_dirty_mb_max',
+    'tel_pgscan_kswapd', 'tel_pgscan_direct', 'tel_pgmajfault',
+    *(f'tel_psi_{r}_{k}_frac' for r in PSI_RESOURCES for k in ['some', 'full']),
+    'tel_cg_usage_gb_max', 'tel_cg_file_gb_avg',
+]
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, 'r') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _key_values(text: Optional[str]) -> Dict[str, str]:
+    """Lines of `key value ...` (or `key: value ...`) as a dict of the first value"""
+    ret = {}
+    for line in (text or '').splitlines():
+        parts = line.replace(':', ' ').split()
+        if len(parts) >= 2:
+            ret[parts[0]] = parts[1]
+    return ret
+
+
+def cgroup_paths(name: str) -> Optional[Dict[str, str]]:
+    """Files with memory usage and stats of a cgroup, for whichever of cgroup v2 or v1 it exists in"""
+    v2 = f'/sys/fs/cgroup/{name}'
+    if os.path.exists(f'{v2}/memory.current'):
+        return {'usage': f'{v2}/memory.current', 'stat': f'{v2}/memory.stat', 'file': 'file', 'anon': 'anon',
+                'pgmajfault': 'pgmajfault'}
+    v1 = f'/sys/fs/cgroup/memory/{name}'
+    if os.path.exists(f'{v1}/memory.usage_in_bytes'):
+        return {'usage': f'{v1}/memory.usage_in_bytes', 'stat': f'{v1}/memory.stat', 'file': 'cache', 'anon': 'rss',
+                'pgmajfault': 'pgmajfault'}
+    return None
+
+
+def sample(cgroup: Optional[Dict[str, str]]) -> dict:
+    row = {'time_s': time.monotonic()}
+
+    for line in (_read('/proc/stat') or '').splitlines():
+        parts = line.split()
+        if parts and parts[0] == 'cpu':
+            row.update({f'cpu_{f}': int(v) for f, v in zip(CPU_FIELDS, parts[1:])})
+        elif parts and parts[0] in ['ctxt', 'procs_running', 'procs_blocked']:
+            row[parts[0]] = int(parts[1])
+
+    meminfo = _key_values(_read('/proc/meminfo'))
+    row.update({col: meminfo.get(k) for k, col in MEMINFO_FIELDS.items()})
+    vmstat = _key_values(_read('/proc/vmstat'))
+    row.update({f: vmstat.get(f) for f in VMSTAT_FIELDS})
+
+    for r in PSI_RESOURCES:
+        for line in (_read(f'/proc/pressure/{r}') or '').splitlines():
+            kind, *fields = line.split()
+            total = [f.split('=')[1] for f in fields if f.startswith('total=')]
+            if total:
+                row[f'psi_{r}_{kind}_us'] = total[0]
+
+    if cgroup is not None:
+        row['cg_usage_bytes'] = (_read(cgroup['usage']) or '').strip() or None
+        stat = _key_values(_read(cgroup['stat']))
+        row['cg_file_bytes'] = stat.get(cgroup['file'])
+        row['cg_anon_bytes'] = stat.get(cgroup['anon'])
+        row['cg_pgmajfault'] = stat.get(cgroup['pgmajfault'])
+
+    return row
+
+
+def run_agent(out: str, interval_s: float, cgroup_name: Optional[str]):
+    cgroup = cgroup_paths(cgroup_name) if cgroup_name else None
+    # signals are handled synchronously by waiting for them between samples
+    signals = {signal.SIGTERM, signal.SIGINT, signal.SIGUSR1, signal.SIGUSR2}
+    signal.pthread_sigmask(signal.SIG_BLOCK, signals)
+    bench = 0
+
+    with open(out, 'w', newline='') as f:
+        w = csv.DictWriter(f, TELEMETRY_COLS)
+        w.writeheader()
+
+        def write_sample():
+            w.writerow({**sample(cgroup), 'bench': bench})
+            f.flush()
+
+        next_sample = time.monotonic()
+        while True:
+            info = signal.sigtimedwait(signals, max(next_sample - time.monotonic(), 0))
+            if info is None:
+                write_sample()
+                next_sample += interval_s
+            elif info.si_signo == signal.SIGUSR1:
+                # start of the benchmark: sample right away and keep the interval from here
+                bench = 1
+                write_sample()
+                next_sample = time.monotonic() + interval_s
+            elif info.si_signo == signal.SIGUSR2:
+                # end of the benchmark: its last sample
+                write_sample()
+                bench = 0
+                next_sample = time.monotonic() + interval_s
+            else:
+                break
+        # one last sample so the totals cover the whole run
+        write_sample()
+
+
+def telemetry_stats(telemetry_file: str) -> dict:
+    """
+    Summarize the telemetry of the benchmark (the rows marked in the `bench` column, or all rows of older files without
+    the marks), or an empty dict if there wasn't enough of it.
+    """
+    with open(telemetry_file, 'r') as f:
+        rows = list(csv.DictReader(f))
+    if rows and 'bench' in rows[0]:
+        rows = [r for r in rows if r['bench'] == '1']
+    if len(rows) < 2:
+        return {}
+
+    def col(c) -> List[float]:
+        return [float(r[c]) for r in rows if r.get(c) not in (None, '')]
+
+    def delta(c) -> Optional[float]:
+        vals = col(c)
+        return vals[-1] - vals[0] if len(vals) >= 2 else None
+
+    def avg(vals):
+        return sum(vals) / len(vals) if vals else None
+
+    elapsed_s = float(rows[-1]['time_s']) - float(rows[0]['time_s'])
+    cpu = {f: delta(f'cpu_{f}') or 0 for f in CPU_FIELDS}
+    cpu_total = sum(cpu.values())
+    cached_kb = col('cached_kb')
+    ret = {
+        'tel_cpu_util': 1 - (cpu['idle'] + cpu['iowait']) / cpu_total if cpu_total else None,
+        'tel_cpu_iowait': cpu['iowait'] / cpu_total if cpu_total else None,
+        'tel_ctxt_per_s': delta('ctxt') / elapsed_s if delta('ctxt') is not None and elapsed_s > 0 else None,
+        'tel_procs_blocked_avg': avg(col('procs_blocked')),
+        'tel_cached_gb_avg': avg(cached_kb) / 2**20 if cached_kb else None,
+        'tel_cached_gb_max': max(cached_kb) / 2**20 if cached_kb else None,
+        'tel_dirty_mb_max': max(col('dirty_kb')) / 2**10 if col('dirty_kb') else None,
+        **{f'tel_{f}': delta(f) for f in ['pgscan_kswapd', 'pgscan_direct', 'pgmajfault']},
+        'tel_cg_usage_gb_max': max(col('cg_usage_bytes')) / 2**30 if col('cg_usage_bytes') else None,
+        'tel_cg_file_gb_avg': avg(col('cg_file_bytes')) / 2**30 if col('cg_file_bytes') else None,
+    }
+    for r in PSI_RESOURCES:
+        for k in ['some', 'full']:
+            d = delta(f'psi_{r}_{k}_us')
+            ret[f'tel_psi_{r}_{k}_frac'] = d / (elapsed_s * 10**6) if d is not None and elapsed_s > 0 else None
+    return ret
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sample host resource usage to a csv until terminated')
+    parser.add_argument('--out', type=str, required=True)
+    parser.add_argument('--interval', type=float, default=1.)
+    parser.add_argument('--cgroup', type=str, default=None, help='Name of the cgroup to report memory usage for')
+    args = parser.parse_args()
+    run_agent(args.out, args.interval, args.cgroup)
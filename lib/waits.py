@@ -0,0 +1,81 @@
+"""
+Sample what the backends running the benchmark are waiting on, from `pg_stat_activity` on a dedicated connection.
+
+Active backends without a wait event are counted as 'CPU'. The samples of each run are aggregated into a profile of
+how often each (wait_event_type, wait_event) was seen, saved as `WAIT_EVENTS_FILE` in the results directory.
+"""
+import json
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+import postgresql as pg
+
+CPU_WAIT = 'CPU'
+WAIT_EVENTS_QUERY = f'''
+    SELECT coalesce(wait_event_type, '{CPU_WAIT}'), coalesce(wait_event, '{CPU_WAIT}'), count(*)
+    FROM pg_stat_activity
+    WHERE state = 'active' AND backend_type IN ('client backend', 'parallel worker')
+        AND datname = current_database() AND pid <> pg_backend_pid()
+    GROUP BY 1, 2
+'''
+
+
+class WaitEventSampler:
+    """Poll `pg_stat_activity` at `rate_hz` in a background thread between `start()` and `stop()`."""
+
+    def __init__(self, conn_str: str, rate_hz: float):
+        self.conn_str = conn_str
+        self.interval_s = 1 / rate_hz
+        self.rate_hz = rate_hz
+        self.counts = Counter()
+        self.samples = 0
+        self.duration_s = 0.
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self, stmt):
+        start = next_sample = time.perf_counter()
+        while not self._stop.is_set():
+            for wtype, event, n in stmt():
+                self.counts[(wtype, event)] += n
+            self.samples += 1
+
+            # keep a fixed rate rather than a fixed delay, skipping samples if the query is too slow
+            next_sample += self.interval_s
+            now = time.perf_counter()
+            if next_sample < now:
+                next_sample = now
+            self._stop.wait(next_sample - now)
+        self.duration_s = time.perf_counter() - start
+
+    def start(self):
+        conn = pg.open(self.conn_str)
+        stmt = conn.prepare(WAIT_EVENTS_QUERY)
+
+        def run():
+            try:
+                self._run(stmt)
+            finally:
+                conn.close()
+
+        self._thread = threading.Thread(target=run, name='wait_event_sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def to_json_map(self) -> dict:
+        return {
+            'rate_hz': self.rate_hz,
+            'samples': self.samples,
+            'duration_s': self.duration_s,
+            'events': [{'type': t, 'event': e, 'count': c} for (t, e), c in self.counts.most_common()],
+        }
+
+    def write(self, out_file: Path):
+        with open(out_file, 'w') as f:
+            f.write(json.JSONEncoder(indent=2).encode(self.to_json_map()))
@@ -0,0 +1,83 @@
+"""
+Watchdogs for a running benchmark, to abort runs that hang or degrade instead of finding out after collecting them.
+
+Benchbase is run with `-im <ms>` so it logs the throughput of every interval, and its output is streamed through
+`RunWatchdog.feed` (which echoes it). `RunWatchdog.check` is polled while it runs and returns why the run should be
+aborted, if it should:
+ - stall: no transactions completed for `stall_s`
+ - throughput: the average throughput since `band_after_s` is outside [`min_throughput`, `max_throughput`]
+ - wall time: the benchmark ran longer than `max_wall_s` (predicted runtime with some slack)
+All limits are off by default: `SweepPlanner.watchdog_config` sets them from the history of the same configuration,
+since e.g. how long a single query may take without a transaction completing depends entirely on the workload.
+"""
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import IO, Optional
+
+# benchbase's interval monitor output, e.g. "Throughput: 123.45 txn/sec"
+THROUGHPUT_RE = re.compile(r'Throughput:\s*([0-9.]+)\s*txn/sec')
+
+
+@dataclass
+class WatchdogConfig:
+    stall_s: Optional[float] = None
+    min_throughput: Optional[float] = None
+    max_throughput: Optional[float] = None
+    # only check the throughput band after this long (warmup, and so the average isn't too noisy)
+    band_after_s: float = 60.
+    max_wall_s: Optional[float] = None
+
+
+class RunWatchdog:
+    def __init__(self, config: WatchdogConfig, monitor_interval_s: float):
+        self.config = config
+        self.monitor_interval_s = monitor_interval_s
+        self.start = time.monotonic()
+        self.last_progress = self.start
+        self.seen_monitor = False
+        self._band_txns = 0.
+        self._band_time_s = 0.
+        self._lock = threading.Lock()
+
+    def progress(self, throughput: float):
+        """Throughput (/s) of the last monitor interval"""
+        now = time.monotonic()
+        with self._lock:
+            self.seen_monitor = True
+            if throughput > 0:
+                self.last_progress = now
+            if now - self.start >= self.config.band_after_s:
+                self._band_txns += throughput * self.monitor_interval_s
+                self._band_time_s += self.monitor_interval_s
+
+    def feed(self, out: IO[str]):
+        """Echo benchbase's output and pass the throughput it reports to `progress`, until it ends"""
+        for line in out:
+            sys.stdout.write(line)
+            m = THROUGHPUT_RE.search(line)
+            if m:
+                self.progress(float(m.group(1)))
+        sys.stdout.flush()
+
+    def check(self) -> Optional[str]:
+        """Reason to abort the run, or None if it looks fine"""
+        c = self.config
+        now = time.monotonic()
+        with self._lock:
+            if c.max_wall_s is not None and now - self.start > c.max_wall_s:
+                return f'ran for {now - self.start:.0f} s, more than the predicted maximum of {c.max_wall_s:.0f} s'
+            # without any monitor output (e.g. an old benchbase) there is nothing to judge progress by
+            if not self.seen_monitor:
+                return None
+            if c.stall_s is not None and now - self.last_progress > c.stall_s:
+                return f'no transactions completed for {now - self.last_progress:.0f} s'
+            if self._band_time_s > 0 and self._band_time_s >= c.band_after_s:
+                tput = self._band_txns / self._band_time_s
+                if c.min_throughput is not None and tput < c.min_throughput:
+                    return f'throughput {tput:.2f}/s is below the expected minimum of {c.min_throughput:.2f}/s'
+                if c.max_throughput is not None and tput > c.max_throughput:
+                    return f'throughput {tput:.2f}/s is above the expected maximum of {c.max_throughput:.2f}/s'
+        return None
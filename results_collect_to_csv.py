@@ -5,11 +5,20 @@ import json
 import csv
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, List, Tuple
 
+import numpy as np
 import pandas as pd
 
 from lib.config import *
+from lib.blktrace import blktrace_stats, BLKTRACE_STAT_COLS
+from lib.bbase_results import RAW_RESULTS_FILE, TXN_STAT_COLS, PHASE_STAT_COLS, read_raw_results, txn_stats, \
+    txn_histograms, phase_stats
+from lib.histogram import LatencyHistogram, NUM_BUCKETS, save_histograms, load_histograms
+from lib.plans import PLAN_NODE_COLS, read_plans
+from lib.telemetry import TELEMETRY_STAT_COLS, telemetry_stats
+from lib.client_monitor import CLIENT_STAT_COLS, client_stats
+from lib.steady_state import SS_STAT_COLS, read_samples, series_from_raw, steady_state, write_samples
 
 #################
 #  CSV columns  #
@@ -30,18 +39,37 @@ bbase_latency_cols = [
     '25th Percentile Latency (microseconds)',
     'Minimum Latency (microseconds)',
 ]
+# wall time of each phase of the experiment (s). 'benchbase' is split into JVM startup/shutdown and the measured run
+phase_cols = [
+    *(f'phase_{p}_s' for p in EXPERIMENT_PHASES),
+    'phase_bbase_overhead_s', 'phase_measured_s', 'phase_total_s', 'harness_overhead_s',
+]
+
+# configuration from configuration json file
+config_cols = [
+    'db_host', 'block_group_size', 'workload', 'scalefactor', 'selectivity', 'clustering', 'indexes', 'shared_buffers',
+    'work_mem', 'synchronize_seqscans', 'pbm_evict_num_samples', 'pbm_bg_naest_max_age', 'pbm_evict_num_victims',
+    'pbm_evict_use_freq', 'pbm_evict_use_idx_scan', 'pbm_idx_scan_num_counts', 'pbm_lru_if_not_requested',
+    'parallelism', 'driver', 'client_hosts', 'ramp', 'time', 'warmup', 'stop_precision',
+    'count_multiplier', 'prewarm', 'seed', 'query_order_randomized', 'rate', 'pgbench_scripts', 'pgbench_threads',
+    'cgroup_gb', 'cgroup_version', 'cgroup_high_gb', 'cgroup_io_read_bps', 'cgroup_io_read_iops',
+    'device_profile', 'device_latency_ms',
+    'os_readahead_kb', 'os_scheduler', 'os_thp', 'os_dirty_ratio', 'os_dirty_background_ratio',
+    'os_dirty_expire_centisecs',
+    'affinity_pg_cpus', 'affinity_pg_numa_node', 'affinity_client_cpus', 'affinity_client_numa_node',
+]
+
+# average number of active backends, and the fraction of their samples in each wait event type
+wait_cols = ['wait_samples', 'wait_avg_active', *(f'wait_frac_{t}' for t in WAIT_EVENT_TYPES)]
+# OS page cache used by the database's relations at each point it was measured at
+pagecache_cols = [f'pagecache_{p}_gb' for p in PAGECACHE_POINTS]
 
 csv_cols = [
     # configuration from directory information:
     'experiment', 'dir', 'branch', 'block size',
-    # configuration from configuration json file
-    'block_group_size', 'workload', 'scalefactor', 'selectivity', 'clustering', 'indexes', 'shared_buffers',
-    'work_mem', 'synchronize_seqscans', 'pbm_evict_num_samples', 'pbm_bg_naest_max_age', 'pbm_evict_num_victims',
-    'pbm_evict_use_freq', 'pbm_evict_use_idx_scan', 'pbm_idx_scan_num_counts', 'pbm_lru_if_not_requested',
-    'parallelism', 'time',
-    'count_multiplier', 'prewarm', 'seed', 'query_order_randomized',
+    *config_cols,
     # from OS IO statis
-    *SYSBLOCKSTAT_COLS,
+    *SYSBLOCKSTAT_COLS, 'io_devices',
     # from benchbase summary:
     'Throughput (requests/second)', 'Goodput (requests/second)', 'Benchmark Runtime (nanoseconds)',
     # latency from benchbase summary:
@@ -52,9 +80,35 @@ csv_cols = [
     *dbstat_cols.values(),
     *('lineitem_' + col for col in statio_main_cols),
     'hit_rate', 'lineitem_hit_rate',
-    'data_read_gb', 'data_processed_gb'
+    'data_read_gb', 'data_processed_gb',
+    # from phase timings
+    *phase_cols,
+    # from block I/O traces (only if captured)
+    *BLKTRACE_STAT_COLS,
+    # from wait event sampling (only if captured)
+    *wait_cols,
+    # from host telemetry
+    *TELEMETRY_STAT_COLS,
+    # from page cache residency (only if captured)
+    *pagecache_cols,
+    # from sampling the benchbase client
+    *CLIENT_STAT_COLS,
+    # steady state detected from the throughput time series
+    *SS_STAT_COLS,
 ]
 
+# one row per transaction type of each run
+txn_csv_cols = ['dir', 'branch', 'block size', *TXN_STAT_COLS]
+# one row per phase of each concurrency ramp
+phase_csv_cols = ['experiment', 'dir', 'branch', 'block size', *config_cols, *PHASE_STAT_COLS]
+# one row per wait event of each run
+wait_csv_cols = ['dir', 'branch', 'block size', 'wait_event_type', 'wait_event', 'count', 'frac', 'avg_backends']
+# one row per relation at each point page cache residency was measured at
+pagecache_csv_cols = ['dir', 'branch', 'block size', 'point', 'relation', 'pages', 'resident_pages', 'resident_frac',
+                      'resident_gb']
+# one row per query plan node, with the configuration since plan capture runs have no benchmark results to join to
+plan_csv_cols = ['experiment', 'dir', 'branch', 'block size', *config_cols, *PLAN_NODE_COLS]
+
 
 ##########
 #  CODE  #
@@ -86,6 +140,9 @@ def decode_iostats(iostats_file: Path, decoder: json.JSONDecoder) -> dict:
             after = decoded['after']
 
             iostats = {k: (int(after[k]) - int(before[k])) for k in before.keys()}
+            # devices the counters were summed over (older results only have the one configured device)
+            if 'devices' in decoded:
+                iostats['io_devices'] = ' '.join(decoded['devices'].keys())
 
         else:
             # only reads and writes
@@ -96,6 +153,184 @@ def decode_iostats(iostats_file: Path, decoder: json.JSONDecoder) -> dict:
     return iostats
 
 
+def decode_phase_times(phase_times_file: Path, decoder: json.JSONDecoder, runtime_ns: Optional[int]) -> dict:
+    """Read per-phase wall times and compute how much of the experiment was not the measured benchmark run."""
+    try:
+        with open(phase_times_file, 'r') as f:
+            decoded = decoder.decode(f.read())
+    except FileNotFoundError:
+        return {}
+
+    ret = {f'phase_{p}_s': t for p, t in decoded['phases'].items()}
+    ret['phase_total_s'] = decoded['total']
+
+    if runtime_ns is not None:
+        measured_s = int(runtime_ns) / 10**9
+        ret['phase_measured_s'] = measured_s
+        ret['harness_overhead_s'] = decoded['total'] - measured_s
+        if 'benchbase' in decoded['phases']:
+            ret['phase_bbase_overhead_s'] = decoded['phases']['benchbase'] - measured_s
+
+    return ret
+
+
+def decode_blktrace(blktrace_file: Path) -> dict:
+    """Summarize the block I/O trace of the experiment, if one was captured."""
+    try:
+        return blktrace_stats(np.load(blktrace_file, mmap_mode='r'))
+    except FileNotFoundError:
+        return {}
+
+
+def decode_telemetry(telemetry_file: Path) -> dict:
+    """Summarize the host telemetry of the experiment, if there is any."""
+    try:
+        return telemetry_stats(telemetry_file)
+    except FileNotFoundError:
+        return {}
+
+
+def decode_client_stats(client_file: Path) -> dict:
+    """Summarize the load generator's resource usage on the client, if it was sampled."""
+    try:
+        return client_stats(client_file)
+    except FileNotFoundError:
+        return {}
+
+
+def decode_steady_state(subdir: Path, config: dict) -> dict:
+    """
+    Warmup and steady-state throughput detected from the per-window samples of the run. If benchbase didn't write them
+    (other drivers, multiple clients) they are computed from the measured rows of the raw results and saved in the same
+    format. Either way the series starts after the configured warmup, so `ss_warmup_s` is warmup beyond it. Not done
+    for concurrency ramps, whose throughput changes in every phase.
+    """
+    if config.get('ramp'):
+        return {}
+    samples_file = subdir / SAMPLES_FILE
+    if not samples_file.exists():
+        raw_file = subdir / RAW_RESULTS_FILE
+        if not raw_file.exists():
+            return {}
+        raw = read_raw_results(raw_file)
+        if config.get('driver') == 'python' and config.get('warmup'):
+            # older python driver results also have the warmup queries (start times are from the start of the run)
+            raw = raw.select(raw.start_s >= float(config['warmup']))
+        write_samples(samples_file, *series_from_raw(raw, BBASE_SAMPLE_WINDOW_S))
+    return steady_state(*read_samples(samples_file))
+
+
+def decode_wait_events(wait_events_file: Path, decoder: json.JSONDecoder) -> Tuple[dict, List[dict]]:
+    """Summary of the wait event profile of the experiment if one was captured, and one row per wait event."""
+    try:
+        with open(wait_events_file, 'r') as f:
+            profile = decoder.decode(f.read())
+    except FileNotFoundError:
+        return {}, []
+
+    samples = profile['samples']
+    total = sum(e['count'] for e in profile['events'])
+    rows = [{
+        'wait_event_type': e['type'],
+        'wait_event': e['event'],
+        'count': e['count'],
+        'frac': e['count'] / total,
+        'avg_backends': e['count'] / samples,
+    } for e in profile['events']]
+
+    summary = {
+        'wait_samples': samples,
+        'wait_avg_active': total / samples if samples > 0 else None,
+        **{f'wait_frac_{t}': 0. for t in WAIT_EVENT_TYPES},
+    }
+    for r in rows:
+        summary[f'wait_frac_{r["wait_event_type"]}'] = summary.get(f'wait_frac_{r["wait_event_type"]}', 0.) + r['frac']
+    return summary, rows
+
+
+def decode_pagecache(pagecache_file: Path, decoder: json.JSONDecoder) -> Tuple[dict, List[dict]]:
+    """Page cache used by all relations at each point if it was measured, and one row per relation and point."""
+    try:
+        with open(pagecache_file, 'r') as f:
+            points = decoder.decode(f.read())
+    except FileNotFoundError:
+        return {}, []
+
+    rows = [{
+        'point': point,
+        'relation': rel,
+        'pages': r['pages'],
+        'resident_pages': r['resident_pages'],
+        'resident_frac': r['resident_pages'] / r['pages'] if r['pages'] > 0 else None,
+        'resident_gb': r['resident_pages'] * res['page_size'] / 2**30,
+    } for point, res in points.items() for rel, r in res['relations'].items()]
+
+    summary = {f'pagecache_{p}_gb': sum(r['resident_gb'] for r in rows if r['point'] == p) for p in points}
+    return summary, rows
+
+
+def load_txn_results(subdir: Path) -> Tuple[List[dict], Dict[int, LatencyHistogram]]:
+    """
+    Per-transaction-type stats and latency histograms of one run from the raw results, cached in `TXN_STATS_FILE` and
+    `LATENCY_HIST_FILE`.
+    """
+    raw_file = subdir / RAW_RESULTS_FILE
+    cache_files = [subdir / TXN_STATS_FILE, subdir / LATENCY_HIST_FILE]
+    if all(f.exists() and (not raw_file.exists() or f.stat().st_mtime >= raw_file.stat().st_mtime)
+           for f in cache_files):
+        with open(cache_files[0], 'r') as f:
+            return list(csv.DictReader(f)), load_histograms(cache_files[1])
+    if not raw_file.exists():
+        return [], {}
+
+    raw = read_raw_results(raw_file)
+    stats = txn_stats(raw)
+    hists = txn_histograms(raw)
+    with open(cache_files[0], 'w') as f:
+        writer = csv.DictWriter(f, TXN_STAT_COLS)
+        writer.writeheader()
+        writer.writerows(stats)
+    save_histograms(cache_files[1], hists)
+    return stats, hists
+
+
+def load_phase_results(subdir: Path, config: dict) -> List[dict]:
+    """Stats of each phase of a concurrency ramp from the raw results, cached in `PHASE_STATS_FILE`."""
+    raw_file = subdir / RAW_RESULTS_FILE
+    cache_file = subdir / PHASE_STATS_FILE
+    if cache_file.exists() and (not raw_file.exists() or cache_file.stat().st_mtime >= raw_file.stat().st_mtime):
+        with open(cache_file, 'r') as f:
+            return list(csv.DictReader(f))
+    if not raw_file.exists():
+        return []
+
+    terminals = [int(t) for t in str(config['ramp']).split(',')]
+    stats = phase_stats(read_raw_results(raw_file), terminals, float(config['time']) if config.get('time') else None)
+    with open(cache_file, 'w') as f:
+        writer = csv.DictWriter(f, PHASE_STAT_COLS)
+        writer.writeheader()
+        writer.writerows(stats)
+    return stats
+
+
+def write_collected_histograms(hist_out: Path, hist_rows: List[Tuple[str, str, int, Dict[int, LatencyHistogram]]]):
+    """
+    Save the latency histograms of every run as one `.npz`: one row of bucket counts per (run, transaction type), with
+    the `dir`, `branch`, `block_size` and `txn_index` (`ALL_TXNS` for all of them) of each row as separate arrays.
+    """
+    rows = [(d, b, bs, t, h.counts) for d, b, bs, hists in sorted(hist_rows, key=lambda r: r[0])
+            for t, h in sorted(hists.items())]
+    with open(hist_out, 'wb') as f:
+        np.savez_compressed(
+            f,
+            dir=np.array([r[0] for r in rows], dtype=str),
+            branch=np.array([r[1] for r in rows], dtype=str),
+            block_size=np.array([r[2] for r in rows], dtype=np.int64),
+            txn_index=np.array([r[3] for r in rows], dtype=np.int64),
+            counts=np.stack([r[4] for r in rows]) if rows else np.zeros((0, NUM_BUCKETS), dtype=np.int64),
+        )
+
+
 def io_metrics_map(metrics: dict, blk_sz: int) -> dict:
     """Parse the `metrics.json` json file produced by benchbase and extract io metrics."""
     pg_statio_user_tables = metrics['pg_statio_user_tables']
@@ -143,7 +378,18 @@ def io_metrics_map(metrics: dict, blk_sz: int) -> dict:
     return metrics_totals
 
 
-def collect_results_to_csv(res_dir: Path, csv_out: Path, sort_rows=True):
+def collect_results_to_csv(res_dir: Path, csv_out: Path, sort_rows=True, txn_csv_out: Optional[Path] = None,
+                           hist_out: Optional[Path] = None, plan_csv_out: Optional[Path] = None,
+                           wait_csv_out: Optional[Path] = None, pagecache_csv_out: Optional[Path] = None,
+                           phase_csv_out: Optional[Path] = None):
+    """
+    Collect the results of every experiment in `res_dir` to one row each in `csv_out`.
+    If `txn_csv_out` is given, per-transaction-type stats of every experiment are also collected there, and if
+    `hist_out` is given their latency histograms are collected there. Nodes of captured query plans are collected to
+    `plan_csv_out` if given, the wait event profiles of every experiment to `wait_csv_out` if given, page cache
+    residency of every relation to `pagecache_csv_out` if given, and each phase of concurrency ramps to
+    `phase_csv_out` if given.
+    """
     decoder = json.JSONDecoder()
     json_decode = decoder.decode
 
@@ -152,6 +398,12 @@ def collect_results_to_csv(res_dir: Path, csv_out: Path, sort_rows=True):
     writer.writeheader()
 
     rows = []
+    txn_rows = []
+    hist_rows = []
+    plan_rows = []
+    wait_rows = []
+    pagecache_rows = []
+    phase_rows = []
 
     # Folders to ignore results from, usually because something went wrong during the test (e.g. network issues...) but the test still completed
     # These experiments have been re-run separately
@@ -176,6 +428,17 @@ def collect_results_to_csv(res_dir: Path, csv_out: Path, sort_rows=True):
             print(f'{conf_dir}: No config, skipping...')
             continue
 
+        if (res_dir / conf_dir / FAILED_FILE).exists():
+            with open(res_dir / conf_dir / FAILED_FILE, 'r') as f:
+                reason = json_decode(f.read()).get('reason')
+            print(f'{conf_dir}: aborted by a watchdog ({reason}), skipping...')
+            continue
+
+        plans_dir = res_dir / conf_dir / PLANS_DIR
+        if plan_csv_out is not None and plans_dir.is_dir():
+            plan_rows += [{'dir': conf_dir, 'block size': config.get('block_size'), **config, **r}
+                          for r in read_plans(plans_dir)]
+
         # each directory is a different run of benchbase
         subdirs = [subdir for subdir in os.listdir(res_dir / conf_dir) if subdir not in NON_DIR_RESULTS]
         pgconfigs = [subdir.split('_blksz') for subdir in subdirs]
@@ -204,6 +467,14 @@ def collect_results_to_csv(res_dir: Path, csv_out: Path, sort_rows=True):
 
                 iostats = decode_iostats(subdir / IOSTATS_FILE, decoder)
                 io_metrics = io_metrics_map(metrics, blk_sz)
+                phase_times = decode_phase_times(res_dir / conf_dir / PHASE_TIMES_FILE, decoder,
+                                                 summary.get('Benchmark Runtime (nanoseconds)'))
+                blktrace = decode_blktrace(res_dir / conf_dir / BLKTRACE_FILE)
+                waits, wait_events = decode_wait_events(res_dir / conf_dir / WAIT_EVENTS_FILE, decoder)
+                telemetry = decode_telemetry(res_dir / conf_dir / TELEMETRY_FILE)
+                pagecache, pagecache_rels = decode_pagecache(res_dir / conf_dir / PAGECACHE_FILE, decoder)
+                client = decode_client_stats(res_dir / conf_dir / CLIENT_STATS_FILE)
+                steady = decode_steady_state(subdir, config)
 
                 # generate row in the processed results:
                 row = {
@@ -218,9 +489,25 @@ def collect_results_to_csv(res_dir: Path, csv_out: Path, sort_rows=True):
                     **summary,
                     **summary['Latency Distribution'],
                     **io_metrics,
+                    **phase_times,
+                    **blktrace,
+                    **waits,
+                    **telemetry,
+                    **pagecache,
+                    **client,
+                    **steady,
                 }
 
                 rows.append(row)
+                if txn_csv_out is not None or hist_out is not None:
+                    stats, hists = load_txn_results(subdir)
+                    txn_rows += [{'dir': conf_dir, 'branch': brnch, 'block size': blk_sz, **r} for r in stats]
+                    hist_rows.append((conf_dir, brnch, blk_sz, hists))
+                wait_rows += [{'dir': conf_dir, 'branch': brnch, 'block size': blk_sz, **r} for r in wait_events]
+                pagecache_rows += [{'dir': conf_dir, 'branch': brnch, 'block size': blk_sz, **r} for r in pagecache_rels]
+                if phase_csv_out is not None and config.get('ramp'):
+                    phase_rows += [{'dir': conf_dir, 'branch': brnch, 'block size': blk_sz, **config, **r}
+                                   for r in load_phase_results(subdir, config)]
 
                 if not sort_rows:
                     writer.writerow(row)
@@ -240,11 +527,68 @@ def collect_results_to_csv(res_dir: Path, csv_out: Path, sort_rows=True):
 
     out.close()
 
+    if txn_csv_out is not None:
+        txn_rows.sort(key=lambda r: (r['dir'], int(r['txn_index'])))
+        with open(txn_csv_out, 'w') as f:
+            txn_writer = csv.DictWriter(f, txn_csv_cols, extrasaction='ignore')
+            txn_writer.writeheader()
+            txn_writer.writerows(txn_rows)
+
+    if hist_out is not None:
+        write_collected_histograms(hist_out, hist_rows)
+
+    if plan_csv_out is not None:
+        plan_rows.sort(key=lambda r: (r['dir'], r['query'], r['run'], r['node_id']))
+        with open(plan_csv_out, 'w') as f:
+            plan_writer = csv.DictWriter(f, plan_csv_cols, extrasaction='ignore')
+            plan_writer.writeheader()
+            plan_writer.writerows(plan_rows)
+
+    if wait_csv_out is not None:
+        wait_rows.sort(key=lambda r: (r['dir'], -r['count']))
+        with open(wait_csv_out, 'w') as f:
+            wait_writer = csv.DictWriter(f, wait_csv_cols, extrasaction='ignore')
+            wait_writer.writeheader()
+            wait_writer.writerows(wait_rows)
+
+    if pagecache_csv_out is not None:
+        pagecache_rows.sort(key=lambda r: (r['dir'], PAGECACHE_POINTS.index(r['point']), -r['resident_pages']))
+        with open(pagecache_csv_out, 'w') as f:
+            pagecache_writer = csv.DictWriter(f, pagecache_csv_cols, extrasaction='ignore')
+            pagecache_writer.writeheader()
+            pagecache_writer.writerows(pagecache_rows)
+
+    if phase_csv_out is not None:
+        phase_rows.sort(key=lambda r: (r['dir'], int(r['phase'])))
+        with open(phase_csv_out, 'w') as f:
+            phase_writer = csv.DictWriter(f, phase_csv_cols, extrasaction='ignore')
+            phase_writer.writeheader()
+            phase_writer.writerows(phase_rows)
+
 
 if __name__ == '__main__':
     res_dir = RESULTS_ROOT
     csv_out = COLLECTED_RESULTS_CSV
+    txn_csv_out = COLLECTED_TXN_RESULTS_CSV
+    hist_out = COLLECTED_HIST_NPZ
+    plan_csv_out = COLLECTED_PLAN_NODES_CSV
+    wait_csv_out = COLLECTED_WAIT_EVENTS_CSV
+    pagecache_csv_out = COLLECTED_PAGECACHE_CSV
+    phase_csv_out = COLLECTED_PHASE_RESULTS_CSV
     if len(sys.argv) > 2:
         res_dir = Path(sys.argv[1])
         csv_out = Path(sys.argv[2])
-    collect_results_to_csv(res_dir, csv_out)
+    if len(sys.argv) > 3:
+        txn_csv_out = Path(sys.argv[3])
+    if len(sys.argv) > 4:
+        hist_out = Path(sys.argv[4])
+    if len(sys.argv) > 5:
+        plan_csv_out = Path(sys.argv[5])
+    if len(sys.argv) > 6:
+        wait_csv_out = Path(sys.argv[6])
+    if len(sys.argv) > 7:
+        pagecache_csv_out = Path(sys.argv[7])
+    if len(sys.argv) > 8:
+        phase_csv_out = Path(sys.argv[8])
+    collect_results_to_csv(res_dir, csv_out, txn_csv_out=txn_csv_out, hist_out=hist_out, plan_csv_out=plan_csv_out,
+                           wait_csv_out=wait_csv_out, pagecache_csv_out=pagecache_csv_out, phase_csv_out=phase_csv_out)
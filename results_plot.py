@@ -2,8 +2,9 @@
 import sys
 import os
 
+import numpy as np
 import pandas as pd
-from typing import Union, Iterable, Optional, Sequence, Callable, List, Any
+from typing import Union, Iterable, Optional, Sequence, Callable, List, Any, Dict, Tuple
 from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime as dt
@@ -14,8 +15,11 @@ from matplotlib.ticker import FixedLocator, FixedFormatter
 import seaborn.objects as so
 import tikzplotlib
 import re
+import json
 
 from lib.config import *
+from lib.bbase_results import ALL_TXNS
+from lib.histogram import LatencyHistogram
 
 # Configure matplotlib
 matplotlib.use('TkAgg')
@@ -64,7 +68,7 @@ def mk_list(x):
     """wrap argument in a list if it isn't one already"""
     if isinstance(x, list):
         return x
-    elif isinstance(x, Iterable):
+    elif isinstance(x, Iterable) and not isinstance(x, str):
         return list(x)
     else:
         return [x]
@@ -187,6 +191,7 @@ def average_series(df: pd.DataFrame, /, x, y, other_cols=None):
     """
     Compute the average and error for a series.
     'other_cols' are included in the groupby call, should be functionally dependent on 'x'
+    Averaging percentiles of each run is not the percentile of all runs: use `pooled_percentiles` for those.
     """
     if other_cols is None:
         other_cols = []
@@ -335,6 +340,17 @@ def plot_exp_sb(df: pd.DataFrame, exp: str, *, ax: Optional[plt.Axes] = None,
 #                     )
 
 
+def read_storage_profiles(profiles_dir=STORAGE_PROFILES_DIR) -> pd.DataFrame:
+    """Summary of the storage profile of each host (`./run_util.py storage_profile`), indexed by host"""
+    profiles = []
+    for f in sorted(Path(profiles_dir).glob('*.json')):
+        with open(f, 'r') as pf:
+            p = json.load(pf)
+        profiles.append({'db_host': f.stem, **{k: v for k, v in p.items() if k.startswith(('seq_', 'rand_'))}})
+    return pd.DataFrame(profiles, columns=['db_host', 'seq_read_mb_per_s', 'rand_read_mb_per_s', 'rand_read_iops',
+                                           'rand_read_lat_ms']).set_index('db_host')
+
+
 def post_process_data(df: pd.DataFrame) -> pd.DataFrame:
     """Generate extra columns to be plotted for the given dataframe"""
 
@@ -350,6 +366,35 @@ def post_process_data(df: pd.DataFrame) -> pd.DataFrame:
 
     df['pg_iolat'] = (df.db_blk_read_time / 1000) / (df.db_blks_read * df.block_size / 2**20)  # ms/block to s/GiB
     df['hw_iolat'] = (df.read_ticks / 1000) / (df.sectors_read * 512 / 2**30)  # ms/sectors to s/GiB
+    # from block traces (if captured): device service time only. hw_iolat also includes time queued in the block layer
+    # before the request is issued, and pg_iolat also counts page cache hits and merged/readahead requests, so the
+    # differences show where the time goes
+    if 'blk_read_lat_avg_ms' in df.columns:
+        for c in ['blk_read_lat_avg_ms', 'blk_read_reqs', 'blk_read_gb', 'blk_read_seq_frac', 'blk_read_reread_frac']:
+            df[c] = pd.to_numeric(df[c], errors='coerce')
+        df['dev_iolat'] = (df.blk_read_lat_avg_ms * df.blk_read_reqs / 1000) / df.blk_read_gb  # s/GiB
+
+    # wait event profile (if captured): fraction of active backend samples in each wait event type
+    if 'wait_avg_active' in df.columns:
+        for c in ['wait_samples', 'wait_avg_active', *(f'wait_frac_{t}' for t in WAIT_EVENT_TYPES)]:
+            df[c] = pd.to_numeric(df[c], errors='coerce')
+
+    # fraction of what the device can do (if its host was characterized): bandwidth relative to the best direct I/O
+    # sequential read throughput, and requests relative to the best random 8kB read IOPS
+    profiles = read_storage_profiles()
+    dev_mb_per_s = df.db_host.map(profiles.seq_read_mb_per_s)
+    dev_iops = df.db_host.map(profiles.rand_read_iops)
+    df['dev_bw_util'] = df.hw_mb_per_s / dev_mb_per_s
+    df['dev_iops_util'] = df.read_ios * 10**9 / df.total_time_ns / dev_iops
+    # I/O latency relative to the device transferring the same data sequentially (1 = as fast as sequential reads)
+    df['hw_iolat_norm'] = df.hw_iolat / (1024 / dev_mb_per_s)
+
+    # reads postgres counted as misses which didn't reach the device, i.e. were served by the OS page cache. With page
+    # cache residency (if captured), `pagecache_*_gb` show how much of the data was cached twice
+    df['os_cache_hit_gb'] = (df.data_read_gb - df.hw_read_gb).clip(lower=0)
+    df['os_cache_hit_frac'] = df.os_cache_hit_gb / df.data_read_gb
+    for c in [c for c in df.columns if c.startswith('pagecache_')]:
+        df[c] = pd.to_numeric(df[c], errors='coerce')
 
     # disk wait time (minutes) (concurrent waits including separate worker threads are added)
     df['pg_disk_wait'] = df.db_blk_read_time / 1000 / 60
@@ -370,6 +415,237 @@ def post_process_data(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def exclude_client_saturated(df: pd.DataFrame) -> pd.DataFrame:
+    """Results without the ones where the benchbase client was saturated (see `lib/client_monitor.py`)"""
+    saturated = df.client_saturated.astype(str).str.lower().eq('true') if 'client_saturated' in df.columns \
+        else pd.Series(False, index=df.index)
+    if saturated.any():
+        print(f'Excluding {saturated.sum()} results where the client was saturated: {", ".join(df[saturated].dir)}')
+    return df[~saturated]
+
+
+def phase_time_breakdown(df: pd.DataFrame, by: Union[str, List[str]] = 'experiment') -> pd.DataFrame:
+    """
+    Average wall time (s) of each experiment phase, grouped by `by`, worst phases first.
+    Results without phase timings (older experiments) are ignored.
+    """
+    phase_cols = [f'phase_{p}_s' for p in EXPERIMENT_PHASES if p != 'benchbase'] \
+        + ['phase_bbase_overhead_s', 'phase_measured_s']
+    phase_cols = [c for c in phase_cols if c in df.columns]
+
+    df_phases = df[mk_list(by) + phase_cols + ['harness_overhead_s']].copy()
+    for c in phase_cols + ['harness_overhead_s']:
+        df_phases[c] = pd.to_numeric(df_phases[c], errors='coerce')
+    df_phases = df_phases.dropna(subset=['harness_overhead_s'])
+
+    res = df_phases.groupby(by).mean()
+    return res[res.mean().sort_values(ascending=False).index]
+
+
+def plot_phase_breakdown(df: pd.DataFrame, by: Union[str, List[str]] = 'experiment', include_measured=False):
+    """Stacked bar plot of where the wall time of each experiment goes."""
+    res = phase_time_breakdown(df, by).drop(columns=['harness_overhead_s'])
+    if not include_measured:
+        res = res.drop(columns=['phase_measured_s'])
+    res = res.rename(columns=lambda c: re.sub(r'^phase_(.*)_s$', r'\1', c)) / 60
+
+    ax = res.plot.bar(stacked=True, title='Time per experiment phase')
+    ax.set_ylabel('Time (min)')
+    return ax
+
+
+def plot_wait_breakdown(df: pd.DataFrame, exp: Union[str, list], *, x='parallelism',
+                        group: Union[str, Iterable[str]] = 'branch', absolute=False, title=None,
+                        ax: Optional[plt.Axes] = None):
+    """
+    Stacked bars of what active backends were waiting on (by wait event type) for each configuration, averaged over
+    runs. With `absolute`, show the average number of backends in each state instead of fractions.
+    """
+    df_exp = df[df['experiment'].isin(mk_list(exp)) & df['wait_avg_active'].notna()]
+    group = mk_list(group)
+    type_cols = [f'wait_frac_{t}' for t in WAIT_EVENT_TYPES]
+
+    vals = df_exp[type_cols].mul(df_exp['wait_avg_active'], axis=0) if absolute else df_exp[type_cols]
+    res = vals.groupby([df_exp[c] for c in group + [x]]).mean()
+    res.columns = WAIT_EVENT_TYPES
+    res = res.loc[:, (res > 0).any()]
+
+    if ax is None:
+        f, ax = plt.subplots(num=title)
+    res.plot.bar(stacked=True, ax=ax)
+    ax.set_xlabel(format_str_or_iterable(group + [x]))
+    ax.set_ylabel('Average active backends' if absolute else 'Fraction of active backend time')
+    ax.legend(title='Wait event type')
+    ax.set_title(str(title))
+    return ax
+
+
+def read_wait_events(df: pd.DataFrame, wait_csv=COLLECTED_WAIT_EVENTS_CSV) -> pd.DataFrame:
+    """Read the individual wait events of each run, joined with the configuration and results of each run in `df`."""
+    df_wait = pd.read_csv(wait_csv, keep_default_na=False).rename(columns=rename_cols)
+    for c in ['count', 'frac', 'avg_backends']:
+        df_wait[c] = pd.to_numeric(df_wait[c])
+    return df_wait.merge(df, on=['dir', 'branch', 'block_size'], suffixes=('', '_run'))
+
+
+def plot_wait_events(df_wait: pd.DataFrame, exp: Union[str, list], *,
+                     group: Union[str, Iterable[str]] = ('branch', 'parallelism'), top=8, title=None,
+                     ax: Optional[plt.Axes] = None):
+    """
+    Stacked bars of the individual wait events (e.g. LWLock:BufferMapping vs LWLock:BufferContent) of each
+    configuration as average number of backends, averaged over runs. Only the `top` events are shown separately.
+    """
+    df_exp = df_wait[df_wait['experiment'].isin(mk_list(exp))]
+    group = mk_list(group)
+
+    nruns = df_exp.groupby(group)['dir'].nunique()
+    event = df_exp['wait_event_type'] + ':' + df_exp['wait_event']
+    res = df_exp.groupby(group + [event.rename('event')])['avg_backends'].sum().unstack('event', fill_value=0)
+    res = res.div(nruns, axis=0)
+
+    top_events = res.sum().nlargest(top).index
+    others = res.drop(columns=top_events).sum(axis=1)
+    res = res[top_events]
+    if (others > 0).any():
+        res['other'] = others
+
+    if ax is None:
+        f, ax = plt.subplots(num=title)
+    res.plot.bar(stacked=True, ax=ax)
+    ax.set_xlabel(format_str_or_iterable(group))
+    ax.set_ylabel('Average active backends')
+    ax.legend(title='Wait event')
+    ax.set_title(str(title))
+    return ax
+
+
+def read_txn_results(df: pd.DataFrame, txn_csv=COLLECTED_TXN_RESULTS_CSV) -> pd.DataFrame:
+    """Read the per-transaction-type results, joined with the configuration and results of each run in `df`."""
+    df_txn = pd.read_csv(txn_csv, keep_default_na=False).rename(columns=rename_cols)
+    for c in ['txn_index', 'count', 'mean_us', 'min_us', 'max_us', 'total_s'] + \
+             [c for c in df_txn.columns if re.fullmatch(r'p\d+_us', c)]:
+        df_txn[c] = pd.to_numeric(df_txn[c])
+    return df_txn.merge(df, on=['dir', 'branch', 'block_size'], suffixes=('', '_run'))
+
+
+def plot_txn_latency(df_txn: pd.DataFrame, exp: Union[str, list], *, y='mean_us', ylabel='Mean latency (s)',
+                     group: Union[str, Iterable[str]] = ('branch', 'pbm_evict_num_samples'),
+                     grp_name: Callable[[Iterable[str]], str] = format_str_or_iterable,
+                     title=None, ax: Optional[plt.Axes] = None):
+    """
+    Compare latency of each transaction type (e.g. each TPCH query) between configurations: grouped bars averaged over
+    the runs (seeds) of each configuration, with 95% confidence intervals.
+    """
+    df_exp = df_txn[df_txn['experiment'].isin(mk_list(exp))]
+    group = mk_list(group)
+
+    grps = df_exp.groupby(['txn_index', 'txn_name'] + group)[y]
+    res = grps.mean().unstack(group) / 10**6
+    err = grps.sem().unstack(group) * 1.96 / 10**6
+    res.index = res.index.get_level_values('txn_name')
+    err.index = res.index
+    res.columns = err.columns = [grp_name(c) for c in res.columns]
+
+    if ax is None:
+        f, ax = plt.subplots(num=title)
+    res.plot.bar(yerr=err, ax=ax, capsize=2)
+    ax.set_xlabel('Transaction type')
+    ax.set_ylabel(ylabel)
+    ax.legend(title=format_str_or_iterable(group))
+    ax.set_title(str(title))
+    return ax
+
+
+def read_latency_hists(df: pd.DataFrame, hist_file=COLLECTED_HIST_NPZ) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Read the collected latency histograms: one row per run and transaction type (`ALL_TXNS` for all of them) joined
+    with the configuration and results of each run in `df`, and the bucket counts of each row (row `hist_row`).
+    """
+    with np.load(hist_file) as data:
+        counts = data['counts']
+        df_hist = pd.DataFrame({c: data[c] for c in ['dir', 'branch', 'block_size', 'txn_index']})
+    df_hist['hist_row'] = np.arange(len(df_hist))
+    return df_hist.merge(df, on=['dir', 'branch', 'block_size'], suffixes=('', '_run')), counts
+
+
+def pooled_histograms(df_hist: pd.DataFrame, counts: np.ndarray, group: Union[str, Iterable[str]],
+                      txn=ALL_TXNS) -> Dict[tuple, LatencyHistogram]:
+    """Merge the latency histograms of all runs (e.g. seeds) in each group, for one transaction type."""
+    group = mk_list(group)
+    df_t = df_hist[df_hist['txn_index'] == txn]
+    rows = df_t['hist_row'].to_numpy()
+    return {
+        (k if isinstance(k, tuple) else (k,)): LatencyHistogram(counts[rows[idx]].sum(axis=0))
+        for k, idx in df_t.groupby(group).indices.items()
+    }
+
+
+def pooled_percentiles(df_hist: pd.DataFrame, counts: np.ndarray, group: Union[str, Iterable[str]], txn=ALL_TXNS,
+                       percentiles=(50, 90, 95, 99, 99.9)) -> pd.DataFrame:
+    """Latency percentiles (us) over all transactions of all runs in each group, from the merged histograms."""
+    group = mk_list(group)
+    return pd.DataFrame([
+        {**dict(zip(group, k)), 'count': h.total, 'mean_us': h.mean(),
+         **{f'p{p}_us': h.percentile(p) for p in percentiles}}
+        for k, h in pooled_histograms(df_hist, counts, group, txn).items()
+    ])
+
+
+def plot_latency_cdf(df_hist: pd.DataFrame, counts: np.ndarray, exp: Union[str, list], *, txn=ALL_TXNS,
+                     group: Union[str, Iterable[str]] = ('branch', 'pbm_evict_num_samples'),
+                     grp_name: Callable[[Iterable[str]], str] = format_str_or_iterable,
+                     tail=False, logx=True, title=None, ax: Optional[plt.Axes] = None):
+    """
+    Latency CDF of each configuration, pooled over all of its runs. With `tail`, plot the complementary CDF on a log
+    scale instead to show the tail of the distribution.
+    """
+    df_exp = df_hist[df_hist['experiment'].isin(mk_list(exp))]
+
+    if ax is None:
+        f, ax = plt.subplots(num=title)
+    for k, h in sorted(pooled_histograms(df_exp, counts, group, txn).items()):
+        x, cdf = h.cdf()
+        ax.step(x / 10**3, 1 - cdf if tail else cdf, where='post', label=grp_name(k))
+    if logx:
+        ax.set_xscale('log')
+    if tail:
+        ax.set_yscale('log')
+    ax.set_xlabel('Latency (ms)')
+    ax.set_ylabel('Fraction of transactions slower' if tail else 'Fraction of transactions')
+    ax.legend(title=format_str_or_iterable(group))
+    ax.set_title(str(title))
+    return ax
+
+
+# Plan nodes which read a relation, to compare access paths between configurations
+SCAN_NODE_TYPES = ['Seq Scan', 'Index Scan', 'Index Only Scan', 'Bitmap Heap Scan', 'Bitmap Index Scan']
+
+
+def read_plan_nodes(plan_csv=COLLECTED_PLAN_NODES_CSV) -> pd.DataFrame:
+    """Read the collected query plan nodes (one row per node of each cold/warm plan)."""
+    df_plan = pd.read_csv(plan_csv, keep_default_na=False).rename(columns=rename_cols)
+    for c in ['node_id', 'parent_id', 'depth', 'actual_loops', 'total_time_ms', 'excl_total_time_ms',
+              'shared_hit_blocks', 'shared_read_blocks', 'excl_shared_hit_blocks', 'excl_shared_read_blocks',
+              'query_execution_ms']:
+        df_plan[c] = pd.to_numeric(df_plan[c])
+    return df_plan
+
+
+def join_plans_to_txn(df_plan: pd.DataFrame, df_txn: pd.DataFrame, run='cold', scans_only=True,
+                      on=('branch', 'block_size', 'scalefactor', 'shared_buffers', 'indexes', 'clustering',
+                          'pbm_evict_num_samples')) -> pd.DataFrame:
+    """
+    Join the plan nodes of each query to the latency of that query in benchmark runs with the same configuration
+    (`read_txn_results`, averaged over seeds) to attribute differences between configurations to specific nodes.
+    """
+    on = list(on)
+    nodes = df_plan[df_plan['run'] == run]
+    if scans_only:
+        nodes = nodes[nodes['node_type'].isin(SCAN_NODE_TYPES)]
+    txn = df_txn.groupby(on + ['txn_name'])[['mean_us', 'p99_us', 'count']].mean().reset_index()
+    return nodes.merge(txn.rename(columns={'txn_name': 'query'}), on=on + ['query'])
+
+
 def parallelism_grp_sort_key(random_first: bool) -> Callable[[Iterable[str], Any], None]:
 
     def ret(x: (Iterable[str], Any)):
@@ -395,6 +671,7 @@ def parallelism_grp_sort_key(random_first: bool) -> Callable[[Iterable[str], Any
 
 def plot_figures_parallelism(df: pd.DataFrame, exp: Union[str, list], subtitle: str,
                              hitrate=True, runtime=True, data_processed=False, iorate=False, iolat=False, iovol=False,
+                             devutil=False,
                              separate_hitrate=False, time_ybound=(0, None), hitrate_ybound=None,
                              extra_grp_cols=None, grp_name=default_fmt_branch, avg_y_values=True,
                              omit_p1=OMIT_PARALLELISM1, random_first=False):
@@ -455,6 +732,14 @@ def plot_figures_parallelism(df: pd.DataFrame, exp: Union[str, list], subtitle:
                  title=f'Hardware IO latency vs parallelism - {subtitle}', **parallelism_common_args),
     ] if iolat else []
 
+    # needs a storage profile of the host (`./run_util.py storage_profile`)
+    ret_list += [
+        plot_exp(df, exp, y='dev_bw_util', ylabel='Fraction of device bandwidth', ybound=(0, None),
+                 title=f'Device bandwidth utilisation vs parallelism - {subtitle}', **parallelism_common_args),
+        plot_exp(df, exp, y='dev_iops_util', ylabel='Fraction of device IOPS', ybound=(0, None),
+                 title=f'Device IOPS utilisation vs parallelism - {subtitle}', **parallelism_common_args),
+    ] if devutil else []
+
     return ret_list
 
 
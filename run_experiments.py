@@ -4,6 +4,7 @@ from itertools import product
 import sys
 
 from lib.experiments import *
+from lib.planner import SweepPlanner
 import lib.config as config
 
 
@@ -18,21 +19,37 @@ NUM_EXPERIMENTS_RUN: int = 0
 rand_seeds = [16312, 22289, 16987, 6262, 32495, 5786, 24267, 3636, 9774, 19740, 4448, 19357, 15930, 3127, 4385, 6870, 27272, 14943, 13146, 32540]
 
 
-def run_tests(exp_name: str, tests: Iterable[ExperimentConfig], /, skip=0, dry_run=False):
+def run_tests(exp_name: str, tests: Iterable[ExperimentConfig], /, skip=0, dry_run=False,
+              deadline: Optional[dt] = None, seed_priority: List[int] = None):
     """
     Run a set of experiments.
 
     skip: skips the first N experiments. So for example if experiment 10 fails, skip should be 9 to re-run experiment 10
+    deadline: if given, experiments are re-ordered by seed (in order of `seed_priority`, default `rand_seeds`) and
+        trimmed based on the predicted time so that the set of experiments finishes before the deadline
+    Experiments with the default watchdog get limits from the history of past runs, and the sweep continues with the
+    next experiment if one is aborted by its watchdog.
     """
     global NUM_EXPERIMENTS_RUN
     tests = list(tests)
-    count = len(tests)
-    c_len = len(str(count))
     global_start = dt.now()
 
     if len(tests) == 0:
         return
 
+    # predict how long this will take before starting
+    planner = SweepPlanner()
+    if deadline is not None:
+        tests = tests[:skip] + planner.plan_budget(tests[skip:], (deadline - global_start).total_seconds(),
+                                                   seed_priority or rand_seeds)
+    planner.print_sweep_estimate(exp_name, tests[skip:])
+    for exp in tests[skip:]:
+        if exp.watchdog == WatchdogConfig() and exp.bbconf.watchable:
+            exp.watchdog = planner.watchdog_config(exp)
+
+    count = len(tests)
+    c_len = len(str(count))
+
     for i, exp in enumerate(tests[skip:]):
         start = dt.now()
         ts_str = start.strftime('%H:%M:%S')
@@ -46,7 +63,10 @@ def run_tests(exp_name: str, tests: Iterable[ExperimentConfig], /, skip=0, dry_r
         if dry_run:
             print(f'EXPERIMENT: {exp.dbconf = }  {exp.pgconf = }')
         else:
-            run_experiment(exp_name, exp)
+            try:
+                run_experiment(exp_name, exp)
+            except RunAborted as e:
+                print(f'WARNING: experiment #{i+skip+1} was aborted ({e}), continuing with the next one')
 
         end = dt.now()
         ts_str = end.strftime('%H:%M:%S')
@@ -166,7 +186,9 @@ def test_micro_parallelism_constant_nqueries() -> Iterable[ExperimentConfig]:
 
 
 def test_tpcc(seeds: List[int], nsamples: List[int] = None, shmem='2560MB', cgmem=3.0,
-              blk_sz=DEFAULT_BLOCK_SIZE, bg_sz=DEFAULT_BG_SIZE, use_ssd=False) -> Iterable[ExperimentConfig]:
+              blk_sz=DEFAULT_BLOCK_SIZE, bg_sz=DEFAULT_BG_SIZE, use_ssd=False,
+              client_hosts: List[str] = None) -> Iterable[ExperimentConfig]:
+    """TPCC with many terminals. `client_hosts` splits the terminals between benchbase on each of those hosts"""
     ssd_data_root = pathlib.Path('/hdd2/pgdata')
     ssd_dev_stats = 'sda/sda3'
     ssd_host = 'tem06'
@@ -193,7 +215,7 @@ def test_tpcc(seeds: List[int], nsamples: List[int] = None, shmem='2560MB', cgme
         bbworkload = WORKLOAD_TPCC.with_times(300, 30).with_rate(100)
         bbworkload.workload = workload
         bbconf = BBaseConfig(nworkers=nworkers, seed=seed,
-                             workload=bbworkload)
+                             workload=bbworkload, client_hosts=client_hosts or [])
         # TODO or with rate = nworkers? i.e. each worker tries once a second... (maybe have to be less than that)
 
         for ns in branch_samples(branch, nsamples):
@@ -431,6 +453,48 @@ def test_micro_parallelism_same_stream_count(seed: int, parallel_ops=None) -> It
     return test_micro_parallelism([seed], None, cm=6, parallel_ops=parallel_ops, nsamples=[1, 5, 10])
 
 
+def test_micro_parallelism_ramp(seeds: List[Optional[int]], selectivity: Optional[float], ssd=True, *,
+                                terminals: List[int] = None, phase_s=120, warmup_s=30, nsamples: List[int] = None,
+                                nvictims: int = 1, cache_time: Optional[float] = None, branches: List[PgBranch] = None,
+                                shmem='2GB', cgmem_gb: float = None, blk_sz=DEFAULT_BLOCK_SIZE, bg_sz=DEFAULT_BG_SIZE,
+                                data_root: (Path, str) = None, db_host: str = None,
+                                indexes='lineitem_brinonly', clustering='dates') -> Iterable[ExperimentConfig]:
+    """
+    Like `test_micro_parallelism`, but measures throughput at every level of concurrency in one run: a time-based
+    workload in phases with an increasing number of active terminals, split up by the collector. Unlike the counted
+    workload, later phases see the cache state left by earlier ones.
+    """
+    terminals = terminals or [1, 2, 4, 8, 16, 32, 64]
+    work = WORKLOAD_MICRO_WEIGHTS.with_selectivity(selectivity).with_times(phase_s, warmup_s).with_ramp(terminals)
+    workload = work.workload
+    if data_root is not None:
+        workload = workload.with_host_device(db_host, data_root[1])
+        dbdata = DbData(workload, sf=10, block_size=blk_sz, data_root=data_root[0])
+    else:
+        dbdata = DbData(workload, sf=10, block_size=blk_sz)
+    work.workload = workload
+    dbsetup = DbSetup(indexes=indexes, clustering=clustering)
+    cgroup = CGroupConfig(cgmem_gb) if cgmem_gb is not None else None
+
+    for seed, branch in product(seeds, branches or POSTGRES_ALL_BRANCHES):
+        seed = seed if seed is not None else 12345  # default seed
+        dbconf = DbConfig(DbBin(branch, block_size=blk_sz, bg_size=bg_sz), dbdata)
+        bbconf = BBaseConfig(nworkers=work.max_terminals, seed=seed, workload=work)
+
+        for ns in branch_samples(branch, nsamples or [1, 10]):
+            nv = nvictims if ns is not None and ns > 1 else None
+            pgconf = RuntimePgConfig(shared_buffers=shmem,
+                                     pbm_evict_num_samples=ns * nv if nv is not None else ns,
+                                     pbm_evict_num_victims=nv,
+                                     pbm_bg_naest_max_age=cache_time if branch.accepts_nsamples else None,
+                                     synchronize_seqscans='on',
+                                     track_io_timing='on',
+                                     random_page_cost=1.1 if ssd else None,
+                                     max_connections=work.max_terminals + 5)
+
+            yield ExperimentConfig(pgconf, dbconf, dbsetup, bbconf, cgroup=cgroup, db_host=db_host)
+
+
 def test_large_mem(seeds: List[int], blksz=DEFAULT_BLOCK_SIZE, bgsz=DEFAULT_BG_SIZE, *, nvictims=1, sf=100, cgroup=None, shmem='28GB', cm=1) -> Iterable[ExperimentConfig]:
     dbsetup = DbSetup(indexes='lineitem_brinonly', clustering='dates')
     dbdata = DbData(WORKLOAD_MICRO_COUNTS.workload, sf=sf, block_size=blksz)
@@ -578,8 +642,25 @@ def test_micro_seq_shmem():
 
 
 
-def test_micro_seqscans(ssd=True):
-    """Experiment: lineitem microbenchmarks with only sequential/bitmap scans"""
+def with_device(tests: Iterable[ExperimentConfig], device: DeviceProfile) -> Iterable[ExperimentConfig]:
+    """Run the given tests on the emulated device (see `emul_device_setup`) with the given profile"""
+    for exp in tests:
+        yield replace(exp, device=device)
+
+
+def with_os_tunings(tests: Iterable[ExperimentConfig], tunings: List[Optional[OsTuningConfig]]) \
+        -> Iterable[ExperimentConfig]:
+    """Run each of the given tests with each OS tuning (None for the host's settings)"""
+    for exp, tuning in product(tests, tunings):
+        yield replace(exp, os_tuning=tuning)
+
+
+def test_micro_seqscans(ssd=True, emulate=False):
+    """
+    Experiment: lineitem microbenchmarks with only sequential/bitmap scans
+
+    emulate: run on the emulated device of this host (using `LOCAL_HOST_ARGS`) with the SSD or HDD profile instead
+    """
     # host_args = SSD_HOST_ARGS if ssd else HDD_HOST_ARGS_TPCH
     common_args = {
         'cache_time': 10, 'cgmem_gb': 3.0,
@@ -589,7 +670,15 @@ def test_micro_seqscans(ssd=True):
         'parallel_ops': [1, 2, 4, 6, 8, 12, 16, 24, 32],
     }
 
-    if ssd:  # SSD tests
+    if emulate:
+        device = DEVICE_SSD if ssd else DEVICE_HDD
+        run_tests(f'parallelism_micro_seqscans_emul_{device.name}_1',
+                  with_device(test_micro_parallelism(rand_seeds[:3], **{**common_args, 'cgmem_gb': None},
+                                                     **LOCAL_HOST_ARGS, nsamples=[1, 10, 100],
+                                                     branches=[BRANCH_POSTGRES_BASE, BRANCH_PBM2, BRANCH_PBM3], ),
+                              device))
+
+    elif ssd:  # SSD tests
         # Compare different branches
         run_tests('parallelism_micro_seqscans_1',
                   test_micro_parallelism(rand_seeds[5:5], **common_args, **SSD_HOST_ARGS, nsamples=[1, 10, 100],
@@ -617,6 +706,31 @@ def test_micro_seqscans(ssd=True):
                                          branches=[BRANCH_POSTGRES_BASE, BRANCH_PBM1, BRANCH_PBM2, BRANCH_PBM3], ))
 
 
+def test_micro_seq_readahead(ssd=True):
+    """Experiment: lineitem sequential/bitmap scan microbenchmarks with different device readahead"""
+    host_args = SSD_HOST_ARGS if ssd else HDD_HOST_ARGS_TPCH
+    common_args = {
+        'cache_time': 10, 'cgmem_gb': 3.0,
+        'selectivity': 0.3, 'cm': 8, 'shmem': '2560MB',
+        'indexes': 'lineitem_brinonly', 'clustering': 'dates',
+        'parallel_ops': [1, 4, 16],
+    }
+    tunings = [OsTuningConfig(readahead_kb=ra, scheduler='mq-deadline', thp='madvise') for ra in [128, 512, 2048, 8192]]
+
+    run_tests(f'readahead_micro_seqscans_{"ssd" if ssd else "hdd"}_1',
+              with_os_tunings(test_micro_parallelism(rand_seeds[:3], **common_args, **host_args, nsamples=[10],
+                                                     branches=[BRANCH_POSTGRES_BASE, BRANCH_PBM2], ),
+                              tunings))
+
+
+def test_micro_seq_ramp():
+    """Experiment: lineitem sequential/bitmap scan throughput vs. concurrency, from one run per configuration"""
+    run_tests('ramp_micro_seqscans_1',
+              test_micro_parallelism_ramp(rand_seeds[:3], 0.3, **SSD_HOST_ARGS, cache_time=10, cgmem_gb=3.0,
+                                          shmem='2560MB', nsamples=[1, 10],
+                                          branches=[BRANCH_POSTGRES_BASE, BRANCH_PBM2, BRANCH_PBM3]))
+
+
 def test_micro_trailing_idx():
     """Experiment: lineitem microbenchmarks with un-correlated index scans, to test "trailing index scan" support."""
     common_args = {
@@ -735,6 +849,8 @@ if __name__ == '__main__':
         "micro_seqscans": lambda: test_micro_seqscans(ssd=True),
         "micro_seqscans_hdd": lambda: test_micro_seqscans(ssd=False),
         "micro_seq_shmem": test_micro_seq_shmem,
+        "micro_seq_readahead": test_micro_seq_readahead,
+        "micro_seq_ramp": test_micro_seq_ramp,
         "micro_seq_idx": test_micro_seq_index_scans,
         "micro_trailing_idx": test_micro_trailing_idx,
         "tpch": test_tpch,
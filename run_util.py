@@ -16,13 +16,21 @@ MAIN_HELP_TEXT = """Action to perform. Actions are:
     bbase_reinstall:    unpack benchbase into the install directory without rebuilding it
     gen_data_tpch:      load test data for the given scale factor for all test configurations
     gen_data_tpcc:      load test data for TPCC, scale factor = # of warehouses
+    gen_data_pgbench:   load test data for pgbench workloads, scale factor = pgbench scale (100k accounts each)
     drop_indexes:       used to remove and indexes and constraints for given scale factor
     reindex:            set the indexes clustering without running benchmarks
     bench:              run benchmarks using the specified scale factor and index type
+    explain:            capture cold and warm EXPLAIN ANALYZE plans of each query instead of running the benchmark
+
+    storage_profile:    measure read throughput and latency of the storage under data_root on the database host, as a
+                        baseline for I/O metrics (saved per host, e.g. for device utilisation in plots)
+
+    emul_setup:         create a device with added latency (dm-delay) on this host to emulate HDD/SSD storage
+    emul_teardown:      remove the emulated device, including its data
 
     testing:            experiments, to be removed...
 
-Note that `bench` runs against postgres installed on a different machine (PG_HOST) and should NOT be run on the postgres
+Note that `bench` (and `explain`) runs against postgres installed on a different machine (PG_HOST) and should NOT be run on the postgres
 server (it will remotely configure and start/stop postgres as needed) while everything else is setup which runs locally.
 (i.e. should be run from the postgres host machine)
 """
@@ -39,9 +47,14 @@ def main():
         'bbase_reinstall',
         'gen_data_tpch',
         'gen_data_tpcc',
+        'gen_data_pgbench',
         'drop_indexes',
         'reindex',
         'bench',
+        'explain',
+        'storage_profile',
+        'emul_setup',
+        'emul_teardown',
         'testing'
     ], help=MAIN_HELP_TEXT)
     parser.add_argument('-b', '--branch', type=str, default=None, dest='branch',
@@ -74,6 +87,70 @@ def main():
     parser.add_argument('-sel', '--selectivity', type=float, default=None, dest='selectivity',
                         help='Selectivity of the "alt" query types')
     parser.add_argument('--host', type=str, default=None, help='Database hostname (if non-default)')
+    parser.add_argument('--driver', type=str, default='benchbase', choices=['benchbase', 'python'],
+                        help='Load generator: benchbase, or the in-process python driver (TPCH queries only)')
+    parser.add_argument('--stop-precision', type=float, default=None, dest='stop_precision',
+                        help='Stop a weighted workload early once the steady-state throughput is known to this '
+                             'relative precision (e.g. 0.02, python driver only)')
+    parser.add_argument('--warmup', type=int, default=None, dest='warmup_s', metavar='S',
+                        help='Warmup time of a weighted workload, excluded from the results (0 to leave finding the '
+                             'end of the warmup to steady-state detection)')
+    parser.add_argument('--ramp', type=int, nargs='+', default=None, metavar='TERMINALS',
+                        help='Run a weighted workload in phases with these numbers of active terminals (each for the '
+                             'configured time), with as many terminals as the largest')
+    parser.add_argument('--client-hosts', type=str, nargs='+', default=None, dest='client_hosts', metavar='HOST',
+                        help='Split the terminals between benchbase on each of these hosts instead of running it here')
+    parser.add_argument('--track-statements', action='store_true', dest='track_statements',
+                        help='Preload pg_stat_statements and save per-statement statistics of the run')
+    parser.add_argument('--blktrace', action='store_true',
+                        help='Trace block I/O requests to the data device during the benchmark')
+    parser.add_argument('--wait-events', type=float, default=None, dest='wait_events_hz', metavar='HZ',
+                        help='Sample wait events of the benchmark\'s backends at this rate (e.g. 10-50)')
+    parser.add_argument('--telemetry-interval', type=float, default=None, dest='telemetry_interval_s', metavar='S',
+                        help='Sample resource usage of the database host at this interval (e.g. 1)')
+    parser.add_argument('--stall-timeout', type=float, default=None, dest='stall_timeout_s', metavar='S',
+                        help='Abort benchbase if no transactions complete for this long (longer than any query)')
+    parser.add_argument('--client-interval', type=float, default=1., dest='client_interval_s', metavar='S',
+                        help='Interval to sample the benchbase client process at (0 to disable)')
+    parser.add_argument('--pagecache', type=str, nargs='*', default=None, choices=PAGECACHE_POINTS, metavar='POINT',
+                        help='Measure OS page cache residency of each relation at these points of the run: '
+                             + ', '.join(PAGECACHE_POINTS))
+    parser.add_argument('--cgroup-gb', type=float, default=None, dest='cgroup_gb',
+                        help='Run postgres in a cgroup with this much memory (including OS cache)')
+    parser.add_argument('--cgroup-v2', action='store_true', dest='cgroup_v2',
+                        help='Use cgroup v2 (unified hierarchy) instead of cgroup-tools, needed for the options below')
+    parser.add_argument('--cgroup-high-gb', type=float, default=None, dest='cgroup_high_gb',
+                        help='cgroup v2 memory.high: throttle and reclaim above this much memory')
+    parser.add_argument('--io-read-mbps', type=float, default=None, dest='io_read_mbps',
+                        help='cgroup v2 io.max: limit reads from the data disk to this many MiB/s')
+    parser.add_argument('--io-read-iops', type=int, default=None, dest='io_read_iops',
+                        help='cgroup v2 io.max: limit reads from the data disk to this many IOPS')
+    parser.add_argument('--readahead-kb', type=int, default=None, dest='readahead_kb',
+                        help='Readahead of the data device during the run (restored after)')
+    parser.add_argument('--io-scheduler', type=str, default=None, dest='io_scheduler',
+                        help='I/O scheduler of the data disk(s) during the run, e.g. none, mq-deadline (restored after)')
+    parser.add_argument('--thp', type=str, default=None, choices=['always', 'madvise', 'never'],
+                        help='Transparent huge pages setting during the run (restored after)')
+    parser.add_argument('--dirty-ratio', type=int, default=None, dest='dirty_ratio',
+                        help='vm.dirty_ratio during the run (restored after)')
+    parser.add_argument('--dirty-background-ratio', type=int, default=None, dest='dirty_background_ratio',
+                        help='vm.dirty_background_ratio during the run (restored after)')
+    parser.add_argument('--pg-cpus', type=str, default=None, dest='pg_cpus', metavar='CPUS',
+                        help='CPUs to run postgres on (cpu list, e.g. 0-7)')
+    parser.add_argument('--pg-numa-node', type=int, default=None, dest='pg_numa_node', metavar='NODE',
+                        help='NUMA node to run postgres on and allocate its memory from')
+    parser.add_argument('--client-cpus', type=str, default=None, dest='client_cpus', metavar='CPUS',
+                        help='CPUs to run the load generator (benchbase or pgbench) on')
+    parser.add_argument('--client-numa-node', type=int, default=None, dest='client_numa_node', metavar='NODE',
+                        help='NUMA node to run the load generator on')
+    parser.add_argument('--device', type=str, default=None, choices=[*DEVICE_PROFILES.keys()],
+                        help='Emulate the bandwidth, IOPS and latency of this kind of storage')
+    parser.add_argument('--emul-size-gb', type=int, default=64, dest='emul_size_gb',
+                        help='Size of the emulated device for emul_setup')
+    parser.add_argument('--storage-file-gb', type=float, default=8., dest='storage_file_gb',
+                        help='Size of the test file for storage_profile, should be much larger than any device cache')
+    parser.add_argument('--storage-duration', type=float, default=5., dest='storage_duration_s', metavar='S',
+                        help='Seconds per storage_profile measurement')
     parser.add_argument('--data_root', type=str, default=None, help='Location for the database')
     args = parser.parse_args()
 
@@ -101,6 +178,9 @@ def main():
     elif args.action == 'gen_data_tpcc':
         gen_data_tpcc(args.sf, blk_sz=args.blk_sz)
 
+    elif args.action == 'gen_data_pgbench':
+        gen_data_pgbench(args.sf, blk_sz=args.blk_sz)
+
     elif args.action == 'drop_indexes':
         drop_all_indexes_tpch(args.sf, blk_sz=args.blk_sz, db_host=args.host)
 
@@ -110,6 +190,18 @@ def main():
     elif args.action == 'bench':
         run_bench(args)
 
+    elif args.action == 'explain':
+        explain_bench(args)
+
+    elif args.action == 'storage_profile':
+        storage_bench(args)
+
+    elif args.action == 'emul_setup':
+        emul_device_setup(args.emul_size_gb)
+
+    elif args.action == 'emul_teardown':
+        emul_device_teardown()
+
     # TODO remove the 'testing' option
     elif args.action == 'testing':
         pass
@@ -0,0 +1,6 @@
+"""
+Offline buffer replacement simulator.
+
+Replays block access traces (captured, or synthetic ones resembling the TPCH micro benchmarks) against different
+replacement policies to answer policy questions without running real experiments. Run `python -m sim --help`.
+"""
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import sys
+from itertools import product
+
+from sim.trace import Trace, synthetic_tpch_trace, mem_to_blocks
+from sim.policies import POLICIES
+from sim.simulate import simulate
+from sim.mrc import shards_mrc, check_exact_lru
+from lib.config import BLOCK_GROUP_SIZES, DEFAULT_BLOCK_SIZE, DEFAULT_BG_SIZE
+
+
+MAIN_HELP_TEXT = """Action to perform. Actions are:
+    gen_trace:          generate a synthetic trace resembling the lineitem micro benchmarks
+    simulate:           replay a trace against each combination of the given policies and options
+    mrc:                estimate the miss-ratio curve of a trace (SHARDS) and predict the hit rate for each
+                        shared_buffers size, suggesting which sizes are worth running real experiments for
+    check_mrc:          check that SHARDS without sampling reproduces the hit rates of exact LRU for each
+                        shared_buffers size (on a small trace)
+"""
+
+
+def gen_trace(args):
+    table_blocks = mem_to_blocks(args.table_size, args.blk_sz)
+    print(f'Generating trace: {args.streams} streams x {args.queries} queries, selectivity={args.selectivity}, '
+          f'table of {table_blocks} blocks')
+    trace = synthetic_tpch_trace(table_blocks, args.streams, args.queries, args.selectivity,
+                                 index_frac=args.index_frac, pct_of_range=args.pct_of_range, seed=args.seed)
+    trace.save(args.trace)
+    print(f'Saved {len(trace)} accesses to {args.trace}')
+
+
+def run_simulations(args):
+    trace = Trace.load(args.trace)
+    nblocks = trace.nblocks
+    print(f'Loaded {len(trace)} accesses over {nblocks} blocks from {args.trace}')
+
+    out = csv.DictWriter(open(args.out, 'w') if args.out else sys.stdout,
+                         ['policy', 'shared_buffers', 'block_group_size', 'num_samples', 'num_victims', 'use_freq',
+                          'nbuffers', 'accesses', 'hits', 'hit_rate'])
+    out.writeheader()
+
+    for shmem, policy in product(args.shared_buffers, args.policy):
+        nbuffers = mem_to_blocks(shmem, args.blk_sz)
+        # only the sampling policy uses the PBM options
+        if policy == 'pbm':
+            options = product(args.bg_size, args.num_samples, args.num_victims, args.use_freq)
+        else:
+            options = [(None, None, None, None)]
+
+        for bg_sz, ns, nv, freq in options:
+            pol = POLICIES[policy](nbuffers, nblocks, scans=trace.scans,
+                                   bg_blocks=(bg_sz or DEFAULT_BG_SIZE) // args.blk_sz,
+                                   num_samples=ns, num_victims=nv, use_freq=freq, seed=args.seed)
+            res = simulate(trace, pol, progress=not args.quiet)
+            out.writerow({
+                'shared_buffers': shmem, 'block_group_size': bg_sz, 'num_samples': ns, 'num_victims': nv,
+                'use_freq': freq, **res.to_map(),
+            })
+
+
+def miss_ratio_curve(args):
+    trace = Trace.load(args.trace, mmap=True)
+    print(f'Loaded {len(trace)} accesses from {args.trace}')
+    mrc = shards_mrc(trace, max_samples=args.max_samples, initial_rate=args.sample_rate,
+                     bin_blocks=max(mem_to_blocks(args.mrc_resolution, args.blk_sz), 1), progress=not args.quiet)
+    print(f'Sampled {mrc.sampled} of {mrc.accesses} accesses')
+
+    out = csv.DictWriter(open(args.out, 'w') if args.out else sys.stdout, ['shared_buffers', 'nbuffers', 'hit_rate'])
+    out.writeheader()
+    sizes = {shmem: mem_to_blocks(shmem, args.blk_sz) for shmem in args.shared_buffers}
+    for shmem, nbuffers in sizes.items():
+        out.writerow({'shared_buffers': shmem, 'nbuffers': nbuffers, 'hit_rate': mrc.hit_rate(nbuffers)})
+
+    knees = mrc.knees([*sizes.values()], n=args.knees)
+    print(f'Knee points (sizes worth running): {[s for s, nb in sizes.items() if nb in knees]}')
+
+    if args.mrc_out:
+        with open(args.mrc_out, 'w') as f:
+            w = csv.writer(f)
+            w.writerow(['nbuffers', 'miss_ratio'])
+            w.writerows(zip(mrc.sizes.tolist(), mrc.miss_ratio.tolist()))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m sim', formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('action', choices=['gen_trace', 'simulate', 'mrc', 'check_mrc'], help=MAIN_HELP_TEXT)
+    parser.add_argument('-t', '--trace', type=str, required=True,
+                        help='Trace file (without extension, `.npy` and `.scans.npy` are added)')
+    parser.add_argument('-bs', '--block-size', type=int, default=DEFAULT_BLOCK_SIZE, dest='blk_sz',
+                        help='Block size (KiB)')
+    parser.add_argument('--seed', type=int, default=12345)
+    parser.add_argument('-q', '--quiet', action='store_true', help='Don\'t show progress bars')
+
+    # trace generation
+    parser.add_argument('--table-size', type=str, default='7GB', help='Size of the synthetic table (MB, GB, ...)')
+    parser.add_argument('-p', '--streams', type=int, default=8, help='Number of concurrent query streams')
+    parser.add_argument('--queries', type=int, default=8, help='Number of queries per stream')
+    parser.add_argument('-sel', '--selectivity', type=float, default=0.3, help='Fraction of the table read per query')
+    parser.add_argument('--index-frac', type=float, default=0., help='Fraction of queries which are index scans')
+    parser.add_argument('--pct-of-range', type=float, default=5.,
+                        help='Percentage of the table from which index scans choose blocks')
+
+    # simulation
+    parser.add_argument('-sm', '--shared_buffers', type=str, nargs='+', default=['2GB'],
+                        help='Sizes of the buffer pool to simulate')
+    parser.add_argument('--policy', type=str, nargs='+', default=[*POLICIES.keys()], choices=[*POLICIES.keys()])
+    parser.add_argument('-bgs', '--block-group-size', type=int, nargs='+', default=BLOCK_GROUP_SIZES, dest='bg_size',
+                        help='Sizes of PBM block groups to simulate (KiB)')
+    parser.add_argument('--eviction-samples', type=int, nargs='+', default=[10], dest='num_samples')
+    parser.add_argument('--eviction-victims', type=int, nargs='+', default=[1], dest='num_victims')
+    parser.add_argument('--use-freq', type=int, nargs='+', default=[0], choices=[0, 1],
+                        help='Whether PBM uses frequency stats for blocks not requested by a scan')
+
+    # miss-ratio curve
+    parser.add_argument('--sample-rate', type=float, default=0.1, help='Initial SHARDS sampling rate')
+    parser.add_argument('--max-samples', type=int, default=2**13,
+                        help='Max distinct blocks tracked by SHARDS (the sampling rate is lowered to stay below it)')
+    parser.add_argument('--mrc-resolution', type=str, default='1MB', help='Resolution of the miss-ratio curve')
+    parser.add_argument('--knees', type=int, default=3, help='Number of knee points of the curve to report')
+    parser.add_argument('--mrc-out', type=str, default=None, help='CSV file for the full miss-ratio curve')
+
+    parser.add_argument('-o', '--out', type=str, default=None, help='CSV file for the results (default stdout)')
+    args = parser.parse_args()
+    args.use_freq = [bool(f) for f in args.use_freq]
+
+    if args.action == 'gen_trace':
+        gen_trace(args)
+
+    elif args.action == 'simulate':
+        run_simulations(args)
+
+    elif args.action == 'mrc':
+        miss_ratio_curve(args)
+
+    elif args.action == 'check_mrc':
+        trace = Trace.load(args.trace)
+        check_exact_lru(trace, [mem_to_blocks(shmem, args.blk_sz) for shmem in args.shared_buffers],
+                        progress=not args.quiet)
+        print(f'SHARDS at rate 1 matches LRU for {args.shared_buffers}')
+
+    else:
+        raise Exception(f'Unknown action {args.action}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Approximate miss-ratio curves (MRC) from a single trace using SHARDS: spatially hashed sampling of blocks and reuse
+(stack) distance analysis of only the sampled blocks. [Waldspurger et al., FAST 2015]
+
+Blocks are sampled if `hash(block) mod P < T`, so every access to a sampled block is kept and reuse distances measured
+between sampled blocks can be scaled up by 1/R (R = T/P) to estimate distances in the full trace. This uses the
+fixed-size variant: at most `max_samples` distinct blocks are tracked, lowering T (and evicting the blocks with the
+largest hash values) when that limit is reached, so memory is bounded regardless of trace length.
+
+The MRC is exact for LRU and a good approximation for clock-sweep, predicting the hit rate at every cache size from
+one pass over the trace.
+"""
+from dataclasses import dataclass
+import heapq
+from typing import Dict, List, Tuple
+import numpy as np
+import tqdm
+
+from sim.trace import Trace
+from sim.simulate import CHUNK_SIZE, simulate
+from sim.policies import LRU
+
+HASH_MOD = 2**24  # P: hash values are in [0, P)
+
+
+def hash_blocks(blocks: np.ndarray) -> np.ndarray:
+    """Hash block numbers to [0, HASH_MOD), using the splitmix64 finalizer."""
+    with np.errstate(over='ignore'):
+        h = blocks.astype(np.uint64)
+        h ^= h >> np.uint64(30)
+        h *= np.uint64(0xbf58476d1ce4e5b9)
+        h ^= h >> np.uint64(27)
+        h *= np.uint64(0x94d049bb133111eb)
+        h ^= h >> np.uint64(31)
+    return (h % np.uint64(HASH_MOD)).astype(np.int64)
+
+
+class FenwickTree:
+    """Binary indexed tree of counts, used to count distinct blocks accessed after a given time."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.tree = np.zeros(size + 1, dtype=np.int32)
+
+    def add(self, i: int, v: int):
+        i += 1
+        tree = self.tree
+        while i <= self.size:
+            tree[i] += v
+            i += i & -i
+
+    def prefix_sum(self, i: int) -> int:
+        """Sum of entries [0, i)"""
+        s = 0
+        tree = self.tree
+        while i > 0:
+            s += int(tree[i])
+            i -= i & -i
+        return s
+
+
+@dataclass
+class MissRatioCurve:
+    """Miss ratio for each cache size (in blocks). `sizes` is increasing."""
+    sizes: np.ndarray
+    miss_ratio: np.ndarray
+    accesses: int
+    sampled: int
+
+    def at(self, nbuffers: int) -> float:
+        i = np.searchsorted(self.sizes, nbuffers, side='right') - 1
+        return float(self.miss_ratio[i]) if i >= 0 else 1.
+
+    def hit_rate(self, nbuffers: int) -> float:
+        return 1. - self.at(nbuffers)
+
+    def knees(self, candidates: List[int], n: int = 3) -> List[int]:
+        """
+        The `n` candidate cache sizes where the curve bends the most (largest change in slope with respect to
+        log(size)) -- where real experiments are most informative.
+        """
+        candidates = sorted(candidates)
+        if len(candidates) < 3:
+            return candidates
+        mr = np.array([self.at(c) for c in candidates])
+        logs = np.log2(candidates)
+        slopes = np.diff(mr) / np.diff(logs)
+        bend = np.abs(np.diff(slopes))
+        best = np.argsort(-bend, kind='stable')[:n] + 1
+        return sorted(candidates[i] for i in best)
+
+
+def shards_mrc(trace: Trace, *, max_samples: int = 2**13, initial_rate: float = 0.1, bin_blocks: int = 128,
+               progress=True) -> MissRatioCurve:
+    """
+    Compute an approximate MRC with fixed-size SHARDS.
+    `bin_blocks` is the resolution of the curve (histogram bin width in blocks).
+    """
+    threshold = int(initial_rate * HASH_MOD)  # T
+    last_access: Dict[int, int] = {}  # sampled block -> time of last access (sampled accesses only)
+    by_hash: List[Tuple[int, int]] = []  # max-heap of (-hash, block) for the sampled blocks
+
+    # distance histogram. counts are rescaled when the sampling rate is lowered so that all counts are in the
+    # units of the current rate
+    hist = np.zeros(1024, dtype=np.float64)
+    cold = 0.
+    total = 0.
+    accesses = 0
+    sampled = 0
+
+    capacity = 4 * max_samples
+    fenwick = FenwickTree(capacity)
+    now = 0
+
+    def compact():
+        """Renumber the last access times of all tracked blocks from 0 to fit them back in the tree."""
+        nonlocal fenwick, now
+        fenwick = FenwickTree(capacity)
+        for i, (blk, _) in enumerate(sorted(last_access.items(), key=lambda kv: kv[1])):
+            last_access[blk] = i
+            fenwick.add(i, 1)
+        now = len(last_access)
+
+    n = len(trace)
+    with tqdm.tqdm(total=n, desc='SHARDS', unit='acc', unit_scale=True, disable=not progress) as pbar:
+        for start in range(0, n, CHUNK_SIZE):
+            blocks = np.asarray(trace.accesses['block'][start:start + CHUNK_SIZE])
+            hashes = hash_blocks(blocks)
+            sel = np.flatnonzero(hashes < threshold)
+            accesses += len(blocks)
+            pbar.update(len(blocks))
+
+            for blk, h in zip(blocks[sel].tolist(), hashes[sel].tolist()):
+                if h >= threshold:  # threshold was lowered since filtering this chunk
+                    continue
+                sampled += 1
+                rate = threshold / HASH_MOD
+                total += 1
+
+                # compact before looking up the previous access, so it is renumbered along with the others
+                if now >= capacity:
+                    compact()
+                prev = last_access.get(blk)
+                if prev is None:
+                    cold += 1
+                    heapq.heappush(by_hash, (-h, blk))
+                else:
+                    # distinct blocks accessed since the previous access, scaled to the full trace
+                    dist = (fenwick.prefix_sum(now) - fenwick.prefix_sum(prev + 1)) / rate
+                    b = int(dist // bin_blocks)
+                    if b >= len(hist):
+                        hist = np.concatenate([hist, np.zeros(max(b + 1, 2 * len(hist)) - len(hist))])
+                    hist[b] += 1
+                    fenwick.add(prev, -1)
+
+                last_access[blk] = now
+                fenwick.add(now, 1)
+                now += 1
+
+                # too many blocks tracked: lower the threshold to drop the block(s) with the largest hash
+                if len(last_access) > max_samples:
+                    new_threshold = -by_hash[0][0]
+                    while by_hash and -by_hash[0][0] >= new_threshold:
+                        _, evict = heapq.heappop(by_hash)
+                        fenwick.add(last_access.pop(evict), -1)
+                    scale = new_threshold / threshold
+                    hist *= scale
+                    cold *= scale
+                    total *= scale
+                    threshold = new_threshold
+
+    # miss ratio at size c: cold misses + reuses with distance >= c
+    hits_below = np.cumsum(hist)
+    miss_ratio = 1. - np.concatenate([[0.], hits_below]) / total if total > 0 else np.ones(len(hist) + 1)
+    sizes = np.arange(len(hist) + 1, dtype=np.int64) * bin_blocks
+    return MissRatioCurve(sizes=sizes, miss_ratio=np.clip(miss_ratio, 0., 1.), accesses=accesses, sampled=sampled)
+
+
+def check_exact_lru(trace: Trace, sizes: List[int], progress=True):
+    """
+    Check that SHARDS without sampling (rate 1, tracking every block) reproduces the hit rates of simulating exact LRU
+    at each of `sizes`. Raises an exception on a mismatch.
+    Only as many samples as there are blocks are allowed, so that long traces also exercise the compaction of the
+    access times.
+    """
+    nblocks = trace.nblocks
+    mrc = shards_mrc(trace, max_samples=nblocks, initial_rate=1., bin_blocks=1, progress=progress)
+    for nbuffers in sizes:
+        res = simulate(trace, LRU(nbuffers, nblocks), progress=progress)
+        expected = res.hits / res.accesses if res.accesses > 0 else 0.
+        if abs(mrc.hit_rate(nbuffers) - expected) > 1e-9:
+            raise Exception(f'SHARDS at rate 1 predicts a hit rate of {mrc.hit_rate(nbuffers)} for {nbuffers} buffers, '
+                            f'but LRU has {expected}')
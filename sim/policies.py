@@ -0,0 +1,231 @@
+"""
+Buffer replacement policies for the simulator.
+
+All state is kept in fixed-size arrays indexed by buffer id or block number, so memory use only depends on the
+number of buffers and the size of the block space, not on the length of the trace. The arrays that are indexed on every
+access are `array.array`s rather than NumPy arrays: each access depends on the evictions of the previous ones so it
+can't be vectorized, and indexing a NumPy array one element at a time is several times slower.
+"""
+from abc import ABC, abstractmethod
+from array import array
+import math
+from typing import Dict, List, Type
+import numpy as np
+
+
+class ReplacementPolicy(ABC):
+    """A buffer pool of `nbuffers` buffers caching blocks from a space of `nblocks` blocks."""
+    name: str
+
+    def __init__(self, nbuffers: int, nblocks: int, **kwargs):
+        self.nbuffers = nbuffers
+        self.buf_block = array('q', [-1]) * nbuffers
+        self.block_buf = array('i', [-1]) * nblocks
+        self.free: List[int] = list(range(nbuffers - 1, -1, -1))
+
+    def access(self, block: int, scan: int, now: int) -> bool:
+        """Access a block at (logical) time `now`. Returns whether it was a hit."""
+        buf = self.block_buf[block]
+        if buf >= 0:
+            self.on_hit(buf, now)
+            return True
+
+        if not self.free:
+            for victim in self.choose_victims(now):
+                self.on_evict(victim)
+                self.block_buf[self.buf_block[victim]] = -1
+                self.buf_block[victim] = -1
+                self.free.append(victim)
+
+        buf = self.free.pop()
+        self.buf_block[buf] = block
+        self.block_buf[block] = buf
+        self.on_insert(buf, now)
+        return False
+
+    def on_hit(self, buf: int, now: int):
+        pass
+
+    def on_insert(self, buf: int, now: int):
+        pass
+
+    def on_evict(self, buf: int):
+        pass
+
+    @abstractmethod
+    def choose_victims(self, now: int) -> List[int]:
+        """Pick one or more buffers to evict when there are no free buffers."""
+        ...
+
+
+class ClockSweep(ReplacementPolicy):
+    """PostgreSQL's default clock-sweep: usage counts are incremented on access and decremented by the sweep."""
+    name = 'clock'
+    MAX_USAGE_COUNT = 5  # BM_MAX_USAGE_COUNT
+
+    def __init__(self, nbuffers: int, nblocks: int, **kwargs):
+        super().__init__(nbuffers, nblocks)
+        self.usage = array('B', [0]) * nbuffers
+        self.hand = 0
+
+    def on_hit(self, buf: int, now: int):
+        if self.usage[buf] < self.MAX_USAGE_COUNT:
+            self.usage[buf] += 1
+
+    def on_insert(self, buf: int, now: int):
+        self.usage[buf] = 1
+
+    def choose_victims(self, now: int) -> List[int]:
+        usage = self.usage
+        while True:
+            buf = self.hand
+            self.hand = (self.hand + 1) % self.nbuffers
+            if usage[buf] == 0:
+                return [buf]
+            usage[buf] -= 1
+
+
+class LRU(ReplacementPolicy):
+    """Exact LRU, using a doubly-linked list stored in arrays. `head` is the most recently used buffer."""
+    name = 'lru'
+
+    def __init__(self, nbuffers: int, nblocks: int, **kwargs):
+        super().__init__(nbuffers, nblocks)
+        self.prev = array('i', [-1]) * nbuffers
+        self.next = array('i', [-1]) * nbuffers
+        self.head = -1
+        self.tail = -1
+
+    def _unlink(self, buf: int):
+        p, n = self.prev[buf], self.next[buf]
+        if p >= 0:
+            self.next[p] = n
+        else:
+            self.head = n
+        if n >= 0:
+            self.prev[n] = p
+        else:
+            self.tail = p
+
+    def _push_head(self, buf: int):
+        self.prev[buf] = -1
+        self.next[buf] = self.head
+        if self.head >= 0:
+            self.prev[self.head] = buf
+        self.head = buf
+        if self.tail < 0:
+            self.tail = buf
+
+    def on_hit(self, buf: int, now: int):
+        if buf != self.head:
+            self._unlink(buf)
+            self._push_head(buf)
+
+    def on_insert(self, buf: int, now: int):
+        self._push_head(buf)
+
+    def on_evict(self, buf: int):
+        self._unlink(buf)
+
+    def choose_victims(self, now: int) -> List[int]:
+        return [self.tail]
+
+
+class SampledPBM(ReplacementPolicy):
+    """
+    Sampling-based Predictive Buffer Manager (as in the pbm2+ branches): sample `num_samples` random buffers and
+    evict the `num_victims` whose block groups are predicted to be needed furthest in the future.
+
+    Predictions come from registered sequential scans: the time until a scan reaches a block group is its distance
+    divided by the scan's speed so far. Blocks not requested by any scan are evicted first, unless `use_freq` is set
+    in which case they are predicted from the average time between visits to their block group (as in pbm3). A visit
+    is a scan entering the group, or an access which isn't part of a scan (e.g. an index lookup). Counting every block
+    a scan reads instead would make a group read once by a scan look as hot as one used all the time.
+    """
+    name = 'pbm'
+    RAND_BATCH = 2**16
+
+    def __init__(self, nbuffers: int, nblocks: int, *, scans: np.ndarray, bg_blocks: int,
+                 num_samples: int = 10, num_victims: int = 1, use_freq: bool = False, seed: int = 12345, **kwargs):
+        super().__init__(nbuffers, nblocks)
+        self.bg_blocks = bg_blocks
+        self.num_samples = num_samples
+        self.num_victims = num_victims
+        self.use_freq = use_freq
+
+        # scan state, indexed by scan id
+        self.scan_start = array('q', np.asarray(scans['start'], dtype=np.int64).tolist())
+        self.scan_end = array('q', np.asarray(scans['end'], dtype=np.int64).tolist())
+        self.scan_pos = array('q', [0]) * len(scans)
+        self.scan_t0 = array('q', [-1]) * len(scans)  # -1 = not started yet
+        self.active = set()
+
+        # frequency stats per block group: number of visits and time of the first one
+        ngroups = (nblocks + bg_blocks - 1) // bg_blocks if use_freq else 0
+        self.group_count = array('q', [0]) * ngroups
+        self.group_first = array('q', [0]) * ngroups
+
+        self.rng = np.random.default_rng(seed)
+        self._rand = None
+        self._rand_i = self.RAND_BATCH
+
+    def access(self, block: int, scan: int, now: int) -> bool:
+        g = block // self.bg_blocks
+        new_visit = True
+        if scan >= 0:
+            if self.scan_t0[scan] < 0:
+                self.active.add(scan)
+                self.scan_t0[scan] = now
+            else:
+                new_visit = self.scan_pos[scan] // self.bg_blocks != g
+            self.scan_pos[scan] = block
+            if block >= self.scan_end[scan] - 1:
+                self.active.discard(scan)
+
+        if self.use_freq and new_visit:
+            if self.group_count[g] == 0:
+                self.group_first[g] = now
+            self.group_count[g] += 1
+
+        return super().access(block, scan, now)
+
+    def _sample(self) -> List[int]:
+        if self._rand_i >= self.RAND_BATCH:
+            self._rand = self.rng.integers(self.nbuffers, size=(self.RAND_BATCH, self.num_samples)).tolist()
+            self._rand_i = 0
+        self._rand_i += 1
+        return sorted(set(self._rand[self._rand_i - 1]))
+
+    def next_access(self, bufs: List[int], now: int) -> List[float]:
+        """Predicted time until each buffer is next accessed (inf if not predicted to be accessed)."""
+        bg = self.bg_blocks
+        # (position, end, speed) of the active scans
+        scans = [(self.scan_pos[s], self.scan_end[s],
+                  (self.scan_pos[s] - self.scan_start[s] + 1) / max(now - self.scan_t0[s], 1)) for s in self.active]
+        est = []
+        for buf in bufs:
+            group = self.buf_block[buf] // bg
+            gstart = group * bg
+            t = math.inf
+            for pos, end, speed in scans:
+                # block group is requested by a scan if the scan has not passed it yet but will reach it
+                if gstart + bg > pos and gstart < end:
+                    t = min(t, max(gstart - pos, 0) / speed)
+            if self.use_freq and t == math.inf:
+                t = (now - self.group_first[group]) / max(self.group_count[group], 1)
+            est.append(t)
+        return est
+
+    def choose_victims(self, now: int) -> List[int]:
+        sample = self._sample()
+        est = self.next_access(sample, now)
+        # furthest first, ties in buffer order (sorted is stable)
+        order = sorted(range(len(sample)), key=lambda i: -est[i])[:self.num_victims]
+        return [sample[i] for i in order]
+
+
+POLICIES: Dict[str, Type[ReplacementPolicy]] = {p.name: p for p in [
+    ClockSweep,
+    LRU,
+    SampledPBM,
+]}
@@ -0,0 +1,113 @@
+"""
+Block access traces for the buffer replacement simulator.
+
+A trace is stored as two NumPy files so large traces can be memory-mapped instead of loaded:
+  - `<name>.npy`: one record per block access (`ACCESS_DTYPE`): the block number, and which scan it belongs to
+    (or -1 if it isn't part of a sequential scan, e.g. index lookups)
+  - `<name>.scans.npy`: the block range of each scan (`SCAN_DTYPE`), indexed by scan id. Used by PBM-style policies
+    which know what each registered scan will read in the future.
+Block numbers are global, i.e. all relations are mapped to one contiguous block space.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Union
+import numpy as np
+
+
+ACCESS_DTYPE = np.dtype([('block', np.int64), ('scan', np.int32)])
+SCAN_DTYPE = np.dtype([('start', np.int64), ('end', np.int64)])  # range of blocks [start, end)
+
+
+def mem_to_blocks(mem: str, blk_sz: int) -> int:
+    """Convert memory size in postgres config format (e.g. 2GB) to # of blocks of `blk_sz` KiB."""
+    units = {'kb': 2**0, 'mb': 2**10, 'gb': 2**20, 'tb': 2**30}
+    kb = float(mem[:-2]) * units[mem[-2:].lower()]
+    return int(kb // blk_sz)
+
+
+def _trace_file(path: Union[str, Path], suffix: str) -> Path:
+    """Append `suffix` to the trace name (not `with_suffix`, which would replace anything after a dot in the name)"""
+    path = Path(path)
+    return path.with_name(path.name + suffix)
+
+
+@dataclass
+class Trace:
+    accesses: np.ndarray
+    scans: np.ndarray
+
+    def __len__(self):
+        return len(self.accesses)
+
+    @property
+    def nblocks(self) -> int:
+        """Size of the block space referenced by the trace."""
+        max_scan = int(self.scans['end'].max()) if len(self.scans) > 0 else 0
+        return max(int(self.accesses['block'].max()) + 1, max_scan)
+
+    def save(self, path: Union[str, Path]):
+        np.save(_trace_file(path, '.npy'), self.accesses)
+        np.save(_trace_file(path, '.scans.npy'), self.scans)
+
+    @staticmethod
+    def load(path: Union[str, Path], mmap=True) -> 'Trace':
+        accesses = np.load(_trace_file(path, '.npy'), mmap_mode='r' if mmap else None)
+        try:
+            scans = np.load(_trace_file(path, '.scans.npy'))
+        except FileNotFoundError:
+            scans = np.zeros(0, dtype=SCAN_DTYPE)
+        return Trace(accesses, scans)
+
+    @staticmethod
+    def from_blocks(blocks: np.ndarray) -> 'Trace':
+        """Trace of plain block accesses without any scan information. (e.g. converted from an I/O trace)"""
+        accesses = np.empty(len(blocks), dtype=ACCESS_DTYPE)
+        accesses['block'] = blocks
+        accesses['scan'] = -1
+        return Trace(accesses, np.zeros(0, dtype=SCAN_DTYPE))
+
+
+def synthetic_tpch_trace(table_blocks: int, nstreams: int, queries_per_stream: int, selectivity: float, *,
+                         index_frac: float = 0., pct_of_range: float = 5., seed: int = 12345) -> Trace:
+    """
+    Generate a trace resembling the lineitem microbenchmarks: `nstreams` concurrent query streams, each running
+    `queries_per_stream` queries over a table of `table_blocks` blocks clustered by date.
+    Each query reads `selectivity` of the table: either a sequential scan of a contiguous range (as for the date
+    predicates of the "alt" queries) or, with probability `index_frac`, random index lookups within a range covering
+    `pct_of_range` percent of the table (as for the trailing index scan micro queries).
+    Streams progress at different random speeds and their accesses are interleaved by time.
+    """
+    rng = np.random.default_rng(seed)
+    scan_len = max(1, int(table_blocks * selectivity))
+    idx_range = max(scan_len, int(table_blocks * pct_of_range / 100))
+
+    blocks, scans, times = [], [], []
+    scan_ranges = []
+    for _ in range(nstreams):
+        speed = rng.uniform(0.5, 1.5)
+        t = 0.
+        for _ in range(queries_per_stream):
+            if rng.random() < index_frac:
+                lo = int(rng.integers(0, table_blocks - idx_range + 1))
+                q_blocks = rng.integers(lo, lo + idx_range, size=scan_len)
+                q_scans = np.full(scan_len, -1, dtype=np.int32)
+            else:
+                lo = int(rng.integers(0, table_blocks - scan_len + 1))
+                q_blocks = np.arange(lo, lo + scan_len, dtype=np.int64)
+                q_scans = np.full(scan_len, len(scan_ranges), dtype=np.int32)
+                scan_ranges.append((lo, lo + scan_len))
+
+            blocks.append(q_blocks)
+            scans.append(q_scans)
+            times.append(t + np.arange(scan_len) / speed)
+            t += scan_len / speed
+
+    # interleave the streams by (slightly jittered) time of each access
+    times = np.concatenate(times)
+    order = np.argsort(times + rng.uniform(0, 1, size=len(times)), kind='stable')
+
+    accesses = np.empty(len(times), dtype=ACCESS_DTYPE)
+    accesses['block'] = np.concatenate(blocks)[order]
+    accesses['scan'] = np.concatenate(scans)[order]
+
+    return Trace(accesses, np.array(scan_ranges, dtype=SCAN_DTYPE))